@@ -3,37 +3,88 @@
 #----------------------------------------------------------------------------#
 
 import json
+import click
 import dateutil.parser
 import babel
-from datetime import datetime
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import groupby
+from flask import Blueprint, Flask, abort, current_app, render_template, request, Response, flash, redirect, send_file, url_for, session, stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 import logging
+import sqlite3
+import time
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from search import SearchIndex
+from bookings import booking_rejections, find_overlaps
+from genres import GENRE_BITS, decode_genres, encode_genres, genre_filter
+from pagination import decode_cursor, keyset_page, list_page, page_args
+from page_cache import PageCache
+from conditional import conditional
+from parallel import QueryPool
+from assets import Assets
+from thumbnails import Thumbnails
+import assets
+import importer
+import geo
+import partitions
+import instrumentation
+import recommendations
+import replica
+import thumbnails
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import NullPool
 from werkzeug.datastructures import MultiDict
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-
-# TODO: connect to a local postgresql database
-migrate = Migrate(app, db)
+moment = Moment()
+db = SQLAlchemy(session_options={'class_': replica.RoutingSession})
+migrate = Migrate()
+search_index = SearchIndex()
+geo_index = geo.GridIndex()
+matchmaker = recommendations.Matchmaker()
+page_cache = PageCache()
+query_pool = QueryPool()
+static_assets = Assets()
+images = Thumbnails()
+
+# Every route, filter, error handler and command is registered on this
+# blueprint; create_app() attaches it to the application.
+bp = Blueprint('main', __name__, cli_group=None)
 
 #----------------------------------------------------------------------------#
 # Model.
 #----------------------------------------------------------------------------#
 
+def genre_indexes(table, *columns):
+    # One small partial index per genre, matching the terms genre_filter() emits.
+    return [
+        db.Index('ix_{}_genre_{}'.format(table, position), *columns,
+                 postgresql_where=db.text('genre_mask & {} <> 0'.format(bit)),
+                 sqlite_where=db.text('genre_mask & {} <> 0'.format(bit)))
+        for position, bit in enumerate(GENRE_BITS.values())
+    ]
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_city_state', 'city', 'state'),
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_deleted_at', 'deleted_at',
+                 postgresql_where=db.text('deleted_at IS NOT NULL'),
+                 sqlite_where=db.text('deleted_at IS NOT NULL')),
+        *genre_indexes('Venue', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -41,12 +92,22 @@ class Venue(db.Model):
     state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
-    genres = db.Column(db.String(120), nullable=False)
+    genre_mask = db.Column(db.Integer, nullable=False, default=0)
     image_link = db.Column(db.String(500), nullable=True)
     facebook_link = db.Column(db.String(120), nullable=True)
     website = db.Column(db.String(120), nullable=True)
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String, nullable=False, default='')
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.now, onupdate=datetime.now, server_default=db.func.now())
+    # Set when it is deleted but its shows are still being purged.
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # The city's centre from the gazetteer, and its cell in geo's grid.
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    geocell = db.Column(db.Integer, nullable=True, index=True)
 
     def __repr__(self):
         return f'''
@@ -59,18 +120,33 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_deleted_at', 'deleted_at',
+                 postgresql_where=db.text('deleted_at IS NOT NULL'),
+                 sqlite_where=db.text('deleted_at IS NOT NULL')),
+        *genre_indexes('Artist', 'name', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
-    genres = db.Column(db.String(120), nullable=False)
+    genre_mask = db.Column(db.Integer, nullable=False, default=0)
     image_link = db.Column(db.String(500), nullable=True)
     facebook_link = db.Column(db.String(120), nullable=True)
     website = db.Column(db.String(120), nullable=True)
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String, nullable=False, default='')
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.now, onupdate=datetime.now, server_default=db.func.now())
+    # Set when it is deleted but its shows are still being purged.
+    deleted_at = db.Column(db.DateTime, nullable=True)
 
     def __repr__(self):
         return f'''
@@ -81,211 +157,764 @@ class Artist(db.Model):
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
+def default_end_time(context):
+  # Shows listed without an end run for SHOW_DURATION_MINUTES.
+  return context.get_current_parameters()['start_time'] + timedelta(
+    minutes=current_app.config.get('SHOW_DURATION_MINUTES', 120))
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 class Show(db.Model):
   __tablename__ = 'Show'
+  __table_args__ = (
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    # On PostgreSQL, one partition per month of start_time (see partitions.py);
+    # the double-booking exclusion constraints live on the partitions.
+    {'postgresql_partition_by': 'RANGE (start_time)', 'info': {'partition_key': 'start_time'}},
+  )
 
   id = db.Column(db.Integer, primary_key=True)
   start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+  end_time = db.Column(db.DateTime, nullable=False, default=default_end_time)
+  # The database deletes a venue's or artist's shows with it (see Deletes).
+  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE', onupdate='CASCADE'), nullable=False)
+  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE', onupdate='CASCADE'), nullable=False)
+  updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                         default=datetime.now, onupdate=datetime.now, server_default=db.func.now())
 
-  artist = db.relationship('Artist', backref=db.backref('shows', cascade='all, delete'))
-  venue = db.relationship('Venue', backref=db.backref('shows', cascade='all, delete'))
+  artist = db.relationship('Artist', backref=db.backref('shows', cascade='all, delete', passive_deletes=True))
+  venue = db.relationship('Venue', backref=db.backref('shows', cascade='all, delete', passive_deletes=True))
 
   def __repr__(self):
         return f'<Show {self.id} {self.start_time} {self.venue_id} {self.artist_id}>'
 
+@db.event.listens_for(Show.__table__, 'after_create')
+def create_show_partitions(target, connection, **kw):
+  if connection.dialect.name == 'postgresql':
+    partitions.maintain(connection, datetime.now(), current_app.config['SHOW_PARTITION_MONTHS_AHEAD'])
+
+@db.event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  # SQLite ignores foreign keys, ON DELETE CASCADE included, unless each
+  # connection turns them on.
+  if isinstance(dbapi_connection, sqlite3.Connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+@db.event.listens_for(db.session, 'do_orm_execute')
+def hide_deleted(execute_state):
+  # Venues and artists waiting to be purged are left out of every ORM
+  # select, joins and subqueries included. The purge itself opts out with
+  # execution_options(include_deleted=True).
+  if execute_state.is_select and not execute_state.execution_options.get('include_deleted', False):
+    execute_state.statement = execute_state.statement.options(
+      db.with_loader_criteria(Venue, Venue.deleted_at.is_(None), include_aliases=True),
+      db.with_loader_criteria(Artist, Artist.deleted_at.is_(None), include_aliases=True))
+
+class CounterState(db.Model):
+  # A single row: Venue/Artist upcoming_shows_count and past_shows_count
+  # split each entity's shows at as_of. roll_over_counters() moves it forward.
+  __tablename__ = 'CounterState'
+
+  id = db.Column(db.Integer, primary_key=True)
+  as_of = db.Column(db.DateTime, nullable=False)
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=64)
+def compiled_datetime_format(locale, format):
+  # Parsing a babel pattern is far more expensive than applying it, and the
+  # filter runs once per show tile, so patterns are compiled once per
+  # (locale, format) pair.
+  return (babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)),
+          babel.Locale.parse(locale))
+
+def format_datetime(value, format='medium', locale=babel.dates.LC_TIME):
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  pattern, locale = compiled_datetime_format(locale, format)
+  return pattern.apply(value, locale)
+
+bp.add_app_template_filter(format_datetime, 'datetime')
+bp.add_app_template_global(thumbnails.image_url, 'image_url')
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+def get_search_index():
+  return search_index.ensure_loaded(
+    lambda: db.session.query(Venue.id, Venue.name).all(),
+    lambda: db.session.query(Artist.id, Artist.name).all())
+
+def matching_ids(column, name, ids, search_term):
+  # ``column IN ids`` for the search index's hits on ``name``. A short term
+  # can match most rows; past SEARCH_MAX_BOUND_IDS ids the query matches
+  # ``name`` itself with ILIKE instead (the trigram index on PostgreSQL)
+  # rather than binding tens of thousands of parameters, so ``name``'s
+  # table must be in the query.
+  if len(ids) <= current_app.config['SEARCH_MAX_BOUND_IDS']:
+    return column.in_(ids)
+  return name.icontains(search_term, autoescape=True)
+
+def get_geo_index():
+  return geo_index.ensure_loaded(
+    lambda: db.session.query(Venue.id, Venue.latitude, Venue.longitude)
+                      .filter(Venue.latitude.isnot(None)).all())
+
+def venue_location(city, state):
+  return geo.location_columns(geo.load_gazetteer(current_app.config['GAZETTEER_PATH']), city, state)
+
+#----------------------------------------------------------------------------#
+# Recommendations.
+#----------------------------------------------------------------------------#
+
+# Matchmaker profiles are (genre_mask, latitude, longitude, state), or None
+# for a venue or artist that isn't seeking. Artists have no location
+# columns: they are placed at their city's centre on the fly.
+def artist_place(city, state):
+  return geo.load_gazetteer(current_app.config['GAZETTEER_PATH']).get(geo.place_key(city, state), (None, None))
+
+def venue_match_profile(form, location):
+  if not form.seeking_talent.data:
+    return None
+  return (encode_genres(form.genres.data), location['latitude'], location['longitude'], form.state.data)
+
+def artist_match_profile(form):
+  if not form.seeking_venue.data:
+    return None
+  return (encode_genres(form.genres.data),) + artist_place(form.city.data, form.state.data) + (form.state.data,)
+
+def match_profiles():
+  artists = [(id, genre_mask) + artist_place(city, state) + (state,)
+             for id, genre_mask, city, state in db.session
+               .query(Artist.id, Artist.genre_mask, Artist.city, Artist.state)
+               .filter(Artist.seeking_venue.is_(True))]
+  venues = [tuple(row) for row in db.session
+              .query(Venue.id, Venue.genre_mask, Venue.latitude, Venue.longitude, Venue.state)
+              .filter(Venue.seeking_talent.is_(True))]
+  return artists, venues
+
+def get_matchmaker():
+  # None without NumPy.
+  if not recommendations.available():
+    return None
+  return matchmaker.ensure_loaded(match_profiles, current_app.config['RECOMMENDATION_WORKERS'])
+
+def render_suggestions(kind, id, model):
+  # The "Suggested ..." section of a venue or artist page. Pages fetch it
+  # separately (static/js/suggestions.js): it changes whenever any profile
+  # on the other side does, which page caching and ETags don't track.
+  found = get_matchmaker()
+  matches = found.suggestions(kind, id) if found is not None else []
+  if not matches:
+    return '', 204
+  rows = {row.id: row for row in db.session
+          .query(model.id, model.name, model.city, model.state, model.image_link)
+          .filter(model.id.in_([match_id for match_id, score in matches]))}
+  suggestions = [rows[match_id] for match_id, score in matches if match_id in rows]
+  return render_template('pages/suggestions.html', kind='venue' if model is Venue else 'artist',
+                         suggestions=suggestions)
+
+def estimate_count(model):
+  # PostgreSQL keeps a row estimate for every table in pg_class; it is as
+  # fresh as the last (auto)vacuum/analyze and costs nothing to read.
+  if db.engine.dialect.name == 'postgresql':
+    # A partitioned table has no rows of its own: add up its partitions.
+    estimate = db.session.execute(
+      db.text('SELECT CASE WHEN min(reltuples) >= 0 THEN sum(reltuples)::bigint END FROM pg_class '
+              'WHERE relkind = \'r\' AND (oid = to_regclass(:name) OR oid IN '
+              '(SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(:name)))'),
+      {'name': '"{}"'.format(model.__tablename__)}).scalar()
+    if estimate is not None and estimate >= 0:
+      return estimate
+  return db.session.query(db.func.count(model.id)).scalar()
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+# A venue page lists the names and images of the artists playing there and
+# an artist page those of its venues, so a change to one entity also
+# invalidates the pages on the other side of its shows.
+def pages_showing_venue(venue_id):
+  artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+  return [('venue', venue_id)] + [('artist', row[0]) for row in artist_ids]
+
+def pages_showing_artist(artist_id):
+  venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+  return [('artist', artist_id)] + [('venue', row[0]) for row in venue_ids]
+
+def touch_pages(*pages):
+  # Move updated_at on the venues and artists behind ``pages`` so their
+  # conditional GET validators change along with the page. Runs as part of
+  # the caller's transaction.
+  now = datetime.now()
+  for kind, model in (('venue', Venue), ('artist', Artist)):
+    ids = {int(id) for page_kind, id in pages if page_kind == kind}
+    if ids:
+      table = model.__table__
+      db.session.execute(table.update().where(table.c.id.in_(ids)).values(updated_at=now))
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry upcoming_shows_count and past_shows_count, split at
+# CounterState.as_of rather than at the current time so that they can be
+# kept exact in the same transaction as every show insert or delete.
+# roll_over_counters() (`flask counters rollover`, run every minute) moves
+# the shows that started since as_of over to past and advances as_of; until
+# it runs, a show that has just started still counts as upcoming.
+
+COUNTED = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+def init_counters(now=None):
+  # Start (or restart) the counters at ``now`` and recount every row.
+  now = now or datetime.now()
+  state = db.session.query(CounterState).with_for_update().first()
+  if state is None:
+    state = CounterState(id=1, as_of=now)
+    db.session.add(state)
+  state.as_of = now
+  recount_counters(now)
+  return now
+
+def counters_as_of():
+  # Share-locks the state row so a roll-over can't move as_of between
+  # reading it and committing the counter change that depends on it.
+  # Without a state row the counters are initialized here, from the rows
+  # already written: the caller's pending show is left unflushed, or the
+  # recount would include it and the caller's own adjustment count it twice.
+  with db.session.no_autoflush:
+    state = db.session.query(CounterState).with_for_update(read=True).first()
+    return state.as_of if state is not None else init_counters()
+
+def adjust_counters(model, deltas):
+  # ``deltas`` maps id -> (change to upcoming, change to past). The counts
+  # are shown on the entity's pages, so updated_at moves with them.
+  if not deltas:
+    return
+  table = model.__table__
+  db.session.execute(
+    table.update()
+      .where(table.c.id == db.bindparam('row_id'))
+      .values(upcoming_shows_count=table.c.upcoming_shows_count + db.bindparam('upcoming'),
+              past_shows_count=table.c.past_shows_count + db.bindparam('past'),
+              updated_at=datetime.now()),
+    [{'row_id': id, 'upcoming': upcoming, 'past': past} for id, (upcoming, past) in deltas.items()])
+
+def count_shows(group_by, as_of, *criteria):
+  # {id: (upcoming, past)} over the shows matching ``criteria``, grouped by
+  # a Show column, e.g. the artists whose counters a venue's shows feed.
+  upcoming = db.func.sum(db.case((Show.start_time >= as_of, 1), else_=0))
+  rows = (db.session
+          .query(group_by, upcoming, db.func.count(Show.id))
+          .filter(*criteria)
+          .group_by(group_by)
+          .all())
+  return {id: (upcoming, total - upcoming) for id, upcoming, total in rows}
+
+def show_counted(show, sign=1):
+  # Counter change for adding (sign=1) or removing (sign=-1) one show.
+  upcoming = show.start_time >= counters_as_of()
+  delta = (sign, 0) if upcoming else (0, sign)
+  adjust_counters(Venue, {int(show.venue_id): delta})
+  adjust_counters(Artist, {int(show.artist_id): delta})
+
+def roll_over_counters(now=None):
+  # Move shows that started in [as_of, now) from upcoming to past and
+  # advance as_of, all in one transaction. Safe to re-run and to run from
+  # several hosts: the state row is locked and a second run finds nothing.
+  # Returns the number of shows moved.
+  now = now or datetime.now()
+  state = db.session.query(CounterState).with_for_update().first()
+  if state is None:
+    init_counters(now)
+    db.session.commit()
+    return 0
+  if now <= state.as_of:
+    db.session.rollback()
+    return 0
+
+  for model, column in COUNTED:
+    started = dict(db.session
+                   .query(column, db.func.count(Show.id))
+                   .filter(Show.start_time >= state.as_of, Show.start_time < now)
+                   .group_by(column)
+                   .all())
+    adjust_counters(model, {id: (-count, count) for id, count in started.items()})
+  # Every show has one venue and one artist; both passes saw the same shows.
+  moved = sum(started.values())
+  state.as_of = now
+  db.session.commit()
+  return moved
+
+def counted_shows(model, column, as_of):
+  # Correlated subqueries giving the true (upcoming, past) for each row of
+  # ``model``, usable in a SELECT or UPDATE against it.
+  count = db.select(db.func.count(Show.id)).where(column == model.__table__.c.id)
+  return (count.where(Show.start_time >= as_of).scalar_subquery(),
+          count.where(Show.start_time < as_of).scalar_subquery())
+
+def counter_drift(model, column, as_of):
+  table = model.__table__
+  upcoming, past = counted_shows(model, column, as_of)
+  return db.or_(table.c.upcoming_shows_count != upcoming, table.c.past_shows_count != past)
+
+def recount_counters(as_of, since=None):
+  # Rewrite the counters of every row that has drifted, or only of the
+  # venues and artists with a show written since ``since``. Returns the
+  # number of rows changed per model.
+  changed = {}
+  for model, column in COUNTED:
+    table = model.__table__
+    upcoming, past = counted_shows(model, column, as_of)
+    update = (table.update()
+              .where(counter_drift(model, column, as_of))
+              .values(upcoming_shows_count=upcoming, past_shows_count=past, updated_at=datetime.now()))
+    if since is not None:
+      update = update.where(table.c.id.in_(db.select(column).where(Show.updated_at >= since)))
+    changed[model.__tablename__] = db.session.execute(update).rowcount
+  return changed
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+def lock_bookings(venue_ids, artist_ids):
+  # Row-lock the venues and artists about to be booked until commit, so
+  # concurrent bookings of the same venue or artist take turns between
+  # booking_conflict() and the insert. The exclusion constraints only see
+  # within one month partition; this covers shows across a month boundary.
+  # Venues before artists, each in id order, so bookings can't deadlock.
+  for model, ids in ((Venue, venue_ids), (Artist, artist_ids)):
+    db.session.query(model.id).filter(model.id.in_(sorted(set(ids)))).order_by(model.id).with_for_update().all()
+
+def booking_conflict(venue_id, artist_id, start_time, end_time, exclude_id=None):
+  # The first show overlapping [start_time, end_time) at the venue or for the
+  # artist, or None. No show lasts longer than SHOW_MAX_DURATION_MINUTES, so
+  # only shows starting in that window before start_time can reach into the
+  # interval, and each side is a short range scan of the (venue_id,
+  # start_time) or (artist_id, start_time) index.
+  earliest = start_time - timedelta(minutes=current_app.config['SHOW_MAX_DURATION_MINUTES'])
+
+  def overlapping(column, value):
+    query = (db.select(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time)
+             .where(column == value, Show.start_time > earliest,
+                    Show.start_time < end_time, Show.end_time > start_time))
+    return query.where(Show.id != exclude_id) if exclude_id is not None else query
+
+  return db.session.execute(
+    overlapping(Show.venue_id, venue_id).union_all(overlapping(Show.artist_id, artist_id)).limit(1)
+  ).first()
+
+def conflict_message(conflict, venue_id):
+  who = 'Venue {}'.format(conflict.venue_id) if conflict.venue_id == int(venue_id) \
+    else 'Artist {}'.format(conflict.artist_id)
+  return '{} is already booked from {} to {} (show {}).'.format(
+    who, format_datetime(conflict.start_time), format_datetime(conflict.end_time), conflict.id)
+
+def import_conflicts(batch, lines):
+  # importer.import_rows()'s check for shows: rejects those overlapping a
+  # stored show or an earlier show in the file, as booking_conflict() does
+  # for the form. The stored shows that could be in the way come from one
+  # range query over the batch's span.
+  max_duration = timedelta(minutes=current_app.config['SHOW_MAX_DURATION_MINUTES'])
+  venue_ids = {values['venue_id'] for values in batch}
+  artist_ids = {values['artist_id'] for values in batch}
+  lock_bookings(venue_ids, artist_ids)
+  existing = db.session.execute(
+    db.select(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time)
+      .where(Show.start_time > min(values['start_time'] for values in batch) - max_duration,
+             Show.start_time < max(values['end_time'] for values in batch),
+             db.or_(Show.venue_id.in_(venue_ids), Show.artist_id.in_(artist_ids)))).all()
+  rejected = booking_rejections(
+    [(values['venue_id'], values['artist_id'], values['start_time'], values['end_time']) for values in batch],
+    [(row.venue_id, row.artist_id, row.start_time, row.end_time) for row in existing], max_duration)
+
+  errors = {}
+  for index, ((kind, id), source, other) in rejected.items():
+    if source == 'existing':
+      message = conflict_message(existing[other], batch[index]['venue_id'])
+    else:
+      message = '{} {} is already booked from {} to {} (line {}).'.format(
+        kind.capitalize(), id, format_datetime(batch[other]['start_time']),
+        format_datetime(batch[other]['end_time']), lines[other])
+    errors[index] = {'start_time': [message]}
+  return errors
+
+def is_booking_violation(error):
+  # exclusion_violation, raised by the ex_Show_*_overlap constraints.
+  return getattr(error.orig, 'pgcode', None) == '23P01'
+
+#----------------------------------------------------------------------------#
+# Deletes.
+#----------------------------------------------------------------------------#
+
+# Shows reference their venue and artist with ON DELETE CASCADE, so deleting
+# either is a single DELETE and the database removes its shows. For an
+# entity with more than PURGE_MIN_SHOWS shows even that one statement runs
+# and holds its locks for too long: the row only gets deleted_at, which
+# hides it everywhere at once (hide_deleted), and purge_deleted() (`flask
+# purge`, run every minute) removes its shows in batches and then the row.
+# The counters on the other side drop as the shows actually go.
+
+OTHER_SIDE = {Venue: ('venue', Show.venue_id, 'artist', Artist, Show.artist_id),
+              Artist: ('artist', Show.artist_id, 'venue', Venue, Show.venue_id)}
+
+def delete_entity(model, id):
+  # Delete, or mark for purging, venue or artist ``id`` in the caller's
+  # transaction. Returns the pages that showed it, or None if there is no
+  # such (undeleted) row.
+  kind, column, other_kind, other, other_column = OTHER_SIDE[model]
+  removed = count_shows(other_column, counters_as_of(), column == id)
+  pages = [(kind, id)] + [(other_kind, other_id) for other_id in removed]
+  table = model.__table__
+  undeleted = db.and_(table.c.id == id, table.c.deleted_at.is_(None))
+  threshold = current_app.config.get('PURGE_MIN_SHOWS', 0)
+  if threshold and sum(upcoming + past for upcoming, past in removed.values()) > threshold:
+    now = datetime.now()
+    found = db.session.execute(table.update().where(undeleted).values(deleted_at=now, updated_at=now)).rowcount
+    touch_pages(*pages[1:])
+  else:
+    found = db.session.execute(table.delete().where(undeleted)).rowcount
+    adjust_counters(other, {other_id: (-upcoming, -past) for other_id, (upcoming, past) in removed.items()})
+  return pages if found else None
+
+def purge_deleted(batch_size):
+  # Remove the shows of every venue and artist marked deleted, at most
+  # ``batch_size`` per transaction so no lock is held for long, then the row
+  # itself. Safe to interrupt and re-run. Returns {(kind, id): shows removed}.
+  purged = {}
+  for model, (kind, column, other_kind, other, other_column) in OTHER_SIDE.items():
+    ids = [row[0] for row in db.session
+           .query(model.id)
+           .filter(model.deleted_at.isnot(None))
+           .execution_options(include_deleted=True)]
+    db.session.rollback()
+    for id in ids:
+      purged[(kind, id)] = 0
+      while True:
+        show_ids = [row[0] for row in db.session
+                    .query(Show.id)
+                    .filter(column == id)
+                    .limit(batch_size)]
+        if not show_ids:
+          break
+        batch = db.and_(column == id, Show.id.in_(show_ids))
+        removed = count_shows(other_column, counters_as_of(), batch)
+        db.session.execute(db.delete(Show).where(batch))
+        adjust_counters(other, {other_id: (-upcoming, -past) for other_id, (upcoming, past) in removed.items()})
+        db.session.commit()
+        page_cache.invalidate(*[(other_kind, other_id) for other_id in removed])
+        purged[(kind, id)] += len(show_ids)
+      table = model.__table__
+      db.session.execute(table.delete().where(table.c.id == id, table.c.deleted_at.isnot(None)))
+      db.session.commit()
+  return purged
+
+#----------------------------------------------------------------------------#
+# Conditional GET validators.
+#----------------------------------------------------------------------------#
 
-app.jinja_env.filters['datetime'] = format_datetime
+# Each returns values that change whenever the page would (see
+# conditional.py), or None for a missing entity. Venue and artist pages
+# also change when a show moves from upcoming to past, which the start
+# time of the latest show to have begun captures.
+
+def venue_validator(venue_id):
+  return (db.session
+          .query(Venue.updated_at, db.func.max(Show.start_time))
+          .outerjoin(Show, db.and_(Show.venue_id == Venue.id, Show.start_time <= datetime.now()))
+          .filter(Venue.id == venue_id)
+          .group_by(Venue.id, Venue.updated_at)
+          .first())
+
+def artist_validator(artist_id):
+  return (db.session
+          .query(Artist.updated_at, db.func.max(Show.start_time))
+          .outerjoin(Show, db.and_(Show.artist_id == Artist.id, Show.start_time <= datetime.now()))
+          .filter(Artist.id == artist_id)
+          .group_by(Artist.id, Artist.updated_at)
+          .first())
+
+def show_validator(show_id):
+  return (db.session
+          .query(Show.updated_at, Venue.updated_at, Artist.updated_at)
+          .join(Venue, Show.venue_id == Venue.id)
+          .join(Artist, Show.artist_id == Artist.id)
+          .filter(Show.id == show_id)
+          .first())
+
+def table_state(*queries):
+  # Several single-value selects (max(updated_at), count(id), ...) in one round trip.
+  return db.session.execute(db.select(*[query.scalar_subquery() for query in queries])).one()
+
+def venues_validator():
+  # The upcoming show counts come from the Venue rows, so they are covered.
+  return table_state(
+    db.select(db.func.max(Venue.updated_at)),
+    db.select(db.func.count(Venue.id)))
+
+def artists_validator():
+  return table_state(
+    db.select(db.func.max(Artist.updated_at)),
+    db.select(db.func.count(Artist.id)))
+
+def shows_validator():
+  return table_state(
+    db.select(db.func.max(Show.updated_at)),
+    db.select(db.func.count(Show.id)),
+    db.select(db.func.max(Venue.updated_at)),
+    db.select(db.func.max(Artist.updated_at)))
+
+def partition_shows(rows, now=None):
+  # Split (entity, ..., start_time) rows ordered by start_time into past and
+  # upcoming shows in one pass. An entity without shows yields a single row
+  # whose start_time is NULL; a show whose other side is waiting to be
+  # purged comes through the outer join without it (row[1] is NULL).
+  now = now or datetime.now()
+  past, upcoming = [], []
+  for row in rows:
+    if row[-1] is None or row[1] is None:
+      continue
+    (past if row[-1] < now else upcoming).append(row)
+  return past, upcoming
+
+def page_cacheable():
+  # Pending flash messages are rendered into the layout, so those responses
+  # must neither be served from nor stored in the cache.
+  return '_flashes' not in session
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@bp.route('/')
 def index():
   return render_template('pages/home.html')
 
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@bp.route('/venues')
+@conditional(venues_validator)
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
+  # One read of the Venue table, using the maintained upcoming show counts,
+  # ordered so the city/state areas can be grouped in a single pass.
 
-  locations = Venue.query.distinct(Venue.city, Venue.state).all()
+  query = (db.session
+        .query(Venue.city, Venue.state, Venue.id, Venue.name, Venue.upcoming_shows_count))
 
-  data = []
+  # /venues?genre=Jazz&genre=Swing matches any of the genres, &match=all every one.
+  genres = genre_filter(Venue.genre_mask, request.args.getlist('genre'), request.args.get('match'))
+  if genres is not None:
+    query = query.filter(genres)
 
-  for location in locations:
-    venues = []
-    p_venues = Venue.query.filter(Venue.city == location.city, Venue.state == location.state).all()
-    venues_data = {
-      "city": location.city,
-      "state": location.state
-    }
+  rows = query.order_by(Venue.state, Venue.city, Venue.id).all()
 
-    for p_venue in p_venues:
-      num_upcoming_shows = Show.query.filter(Show.start_time >= datetime.now(), Show.venue_id == p_venue.id).count()
-      venue = {
-        "id": p_venue.id,
-        "name": p_venue.name,
-        "num_upcoming_shows": num_upcoming_shows
-      }
-      venues.append(venue)
+  data = []
 
-    venues_data["venues"] = venues
-    data.append(venues_data)
+  for (city, state), area_rows in groupby(rows, key=lambda row: (row[0], row[1])):
+    data.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": row[2],
+        "name": row[3],
+        "num_upcoming_shows": row[4]
+      } for row in area_rows]
+    })
 
   return render_template('pages/venues.html', areas=data)
 
-@app.route('/venues/search', methods=['POST'])
-def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-
-  search_term=request.form.get('search_term', '')
-
+def nearby_args(args):
+  # (latitude, longitude, km) from ?lat=&lon=&km=, or None without a usable
+  # location. km defaults to NEARBY_DEFAULT_KM and is capped at NEARBY_MAX_KM.
+  latitude = args.get('lat', type=float)
+  longitude = args.get('lon', type=float)
+  if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+    return None
+  km = args.get('km', type=float)
+  if km is None or not km > 0:
+    km = current_app.config['NEARBY_DEFAULT_KM']
+  return latitude, longitude, min(km, current_app.config['NEARBY_MAX_KM'])
+
+@bp.route('/venues/nearby')
+@conditional(venues_validator)
+def nearby_venues():
+  # Venues within ?km= of ?lat=&lon=, nearest first. The candidates come
+  # from the grid cells covering the circle: in memory, or from the indexed
+  # Venue.geocell column with NEARBY_INDEX = 'database'.
+
+  location = nearby_args(request.args)
   data = []
 
-  # Search term in venue name
-  venues = (db.session
-        .query(Venue.id, Venue.name)
-        .filter(Venue.name.ilike("%{}%".format(search_term)))
-        .all())
+  if location is not None:
+    latitude, longitude, km = location
+    limit = current_app.config['NEARBY_LIMIT']
+    if current_app.config['NEARBY_INDEX'] == 'database':
+      points = (db.session
+        .query(Venue.id, Venue.latitude, Venue.longitude)
+        .filter(db.or_(*[Venue.geocell.between(first, last)
+                         for first, last in geo.cell_ranges(latitude, longitude, km)])))
+      hits = geo.nearest(points, latitude, longitude, km, limit)
+    else:
+      hits = get_geo_index().within(latitude, longitude, km, limit)
+
+    venues = {row[0]: row for row in db.session
+      .query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_shows_count)
+      .filter(Venue.id.in_([id for id, distance in hits]))}
+    data = [{
+      "id": id,
+      "name": venues[id][1],
+      "city": venues[id][2],
+      "state": venues[id][3],
+      "num_upcoming_shows": venues[id][4],
+      "distance_km": distance
+    } for id, distance in hits if id in venues]
+
+  return render_template('pages/venues_nearby.html', venues=data, location=location)
+
+@bp.route('/venues/search', methods=['GET', 'POST'])
+def search_venues():
+  # Case-insensitive partial match on the venue name, followed by the venues
+  # where a matching artist has played. Searching for "Hop" returns
+  # "The Musical Hop".
 
-  count = len(venues)
+  search_term=request.values.get('search_term', '')
+  after, before, limit = page_args(request.args)
 
-  # Search term in artist name and display show venue
-  venues_artist = (db.session
-          .query(Venue.id, Venue.name)
-          .join(Show, Show.venue_id == Venue.id)
+  index = get_search_index()
+  venue_ids = index.venues.search(search_term)
+  artist_ids = index.artists.search(search_term)
+
+  if artist_ids:
+    played_at = (db.session
+          .query(Show.venue_id)
           .join(Artist, Show.artist_id == Artist.id)
-          .filter(Artist.name.ilike('%{}%'.format(search_term)))
+          .filter(matching_ids(Show.artist_id, Artist.name, artist_ids, search_term))
+          .distinct()
+          .order_by(Show.venue_id)
           .all())
+    venue_ids = list(dict.fromkeys(venue_ids + [row[0] for row in played_at]))
 
-  count = count + len(venues_artist)
+  page = list_page(venue_ids, after, before, limit)
 
-  venues_artist = list(dict.fromkeys(venues_artist))
+  names = dict(db.session
+        .query(Venue.id, Venue.name)
+        .filter(Venue.id.in_(page.items))
+        .all()) if page.items else {}
 
-  if len(venues) == 0:
-    data = venues_artist
-  elif len(venues_artist) == 0:
-    data = venues
-  else:
-    for venue in venues_artist:
-      if venue not in venues:
-        venues.append(venue)
-    
-    data = venues
+  data = [{"id": id, "name": names[id]} for id in page.items if id in names]
 
   response={
-    "count": count,
+    "count": len(venue_ids),
     "data": data
   }
 
-  return render_template('pages/search_venues.html', results=response, search_term=search_term)
+  return render_template('pages/search_venues.html', results=response, search_term=search_term, page=page)
 
-@app.route('/venues/<int:venue_id>')
+@bp.route('/venues/<int:venue_id>')
+@conditional(venue_validator)
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
 
-  data = {}
-
-  venues = Venue.query.filter(Venue.id == venue_id).all()
-
-  if len(venues) == 0:
-    flash('No data with Venue id = ' + venue_id + ' could be found!')
-    return redirect(url_for('venues'))
+  cacheable = page_cacheable()
+  if cacheable:
+    html = page_cache.get('venue', venue_id)
+    if html is not None:
+      return html
 
-  past_shows = []
+  data = {}
 
-  temp_past_shows = (db.session
-          .query(Artist.id, Artist.name, Artist.image_link, Show.start_time)
-          .join(Venue, Venue.id == Show.venue_id)
-          .join(Artist, Artist.id == Show.artist_id)
-          .filter(Show.start_time < db.func.current_timestamp(), Venue.id == venue_id)
+  # The venue and all of its shows in one round trip, split below
+  # against a single "now".
+  rows = (db.session
+          .query(Venue, Artist.id, Artist.name, Artist.image_link, Show.start_time)
+          .outerjoin(Show, Show.venue_id == Venue.id)
+          .outerjoin(Artist, Artist.id == Show.artist_id)
+          .filter(Venue.id == venue_id)
+          .order_by(Show.start_time)
           .all())
 
-  past_shows_count = len(temp_past_shows)
+  if len(rows) == 0:
+    flash('No data with Venue id = ' + str(venue_id) + ' could be found!')
+    return redirect(url_for('main.venues'))
 
-  if past_shows_count > 0:
-    for past_show in temp_past_shows:
-      past_shows.append({
-          "artist_id": past_show[0],
-          "artist_name": past_show[1],
-          "artist_image_link": past_show[2],
-          "start_time": str(past_show[3])
-      })
+  venue = rows[0][0]
+  temp_past_shows, temp_upcoming_shows = partition_shows(rows)
 
-  upcoming_shows = []
+  past_shows = [{
+    "artist_id": show[1],
+    "artist_name": show[2],
+    "artist_image_link": show[3],
+    "start_time": show[4]
+  } for show in temp_past_shows]
 
-  temp_upcoming_shows = (db.session
-          .query(Artist.id, Artist.name, Artist.image_link, Show.start_time)
-          .join(Venue, Venue.id == Show.venue_id)
-          .join(Artist, Artist.id == Show.artist_id)
-          .filter(Show.start_time >= db.func.current_timestamp(), Venue.id == venue_id)
-          .all())
-    
-  upcoming_shows_count = len(temp_upcoming_shows)
-
-  if upcoming_shows_count > 0:
-    for upcoming_show in temp_upcoming_shows:
-      upcoming_shows.append({
-          "artist_id": upcoming_show[0],
-          "artist_name": upcoming_show[1],
-          "artist_image_link": upcoming_show[2],
-          "start_time": str(upcoming_show[3])
-      })
+  upcoming_shows = [{
+    "artist_id": show[1],
+    "artist_name": show[2],
+    "artist_image_link": show[3],
+    "start_time": show[4]
+  } for show in temp_upcoming_shows]
 
   data['id'] = venue_id
-  data['name'] = venues[0].name
-  data['genres'] = venues[0].genres.split(',')
-  data['address'] = venues[0].address
-  data['city'] = venues[0].city
-  data['state'] = venues[0].state
-  data['phone'] = venues[0].phone
-  data['website'] = venues[0].website
-  data['facebook_link'] = venues[0].facebook_link
-  data['seeking_talent'] = venues[0].seeking_talent
-  data['seeking_description'] = venues[0].seeking_description
-  data['image_link'] =  venues[0].image_link
+  data['name'] = venue.name
+  data['genres'] = decode_genres(venue.genre_mask)
+  data['address'] = venue.address
+  data['city'] = venue.city
+  data['state'] = venue.state
+  data['phone'] = venue.phone
+  data['website'] = venue.website
+  data['facebook_link'] = venue.facebook_link
+  data['seeking_talent'] = venue.seeking_talent
+  data['seeking_description'] = venue.seeking_description
+  data['image_link'] =  venue.image_link
   data['past_shows'] = past_shows
   data['upcoming_shows'] = upcoming_shows
-  data['past_shows_count'] = past_shows_count
-  data['upcoming_shows_count'] = upcoming_shows_count
+  data['past_shows_count'] = len(past_shows)
+  data['upcoming_shows_count'] = len(upcoming_shows)
+
+  html = render_template('pages/show_venue.html', venue=data)
+  # A page read from a replica that is behind may predate a write whose
+  # invalidation already ran, so it is served but not stored.
+  if cacheable and not replica.reading_from_replica():
+    next_start = temp_upcoming_shows[0][4] if temp_upcoming_shows else None
+    page_cache.set('venue', venue_id, html, expires_at=next_start)
 
-  return render_template('pages/show_venue.html', venue=data)
+  return html
+
+@bp.route('/venues/<int:venue_id>/suggestions')
+def venue_suggestions(venue_id):
+  return render_suggestions('venue', venue_id, Artist)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   # TODO: insert form data as a new Venue record in the db, instead
   # TODO: modify data to be the data object returned from db insertion
 
   form = VenueForm(request.form)
+  location = venue_location(form.city.data, form.state.data)
 
   venue = Venue(
     name = form.name.data,
@@ -293,12 +922,13 @@ def create_venue_submission():
     state = form.state.data,
     address = form.address.data,
     phone = form.phone.data,
-    genres = ','.join(form.genres.data),
+    genre_mask = encode_genres(form.genres.data),
     image_link = form.image_link.data,
     facebook_link = form.facebook_link.data,
     website = form.website.data,
     seeking_talent = form.seeking_talent.data,
-    seeking_description = form.seeking_description.data
+    seeking_description = form.seeking_description.data,
+    **location
   )
 
   # TODO: on unsuccessful db insert, flash an error instead.
@@ -307,6 +937,9 @@ def create_venue_submission():
   try:
     db.session.add(venue)
     db.session.commit()
+    search_index.venues.add(venue.id, venue.name)
+    geo_index.add(venue.id, location['latitude'], location['longitude'])
+    matchmaker.update('venue', venue.id, venue_match_profile(form, location))
     # on successful db insert, flash success
     flash('Venue ' + form.name.data + ' was successfully added!')
   except:
@@ -317,7 +950,7 @@ def create_venue_submission():
 
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@bp.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
@@ -326,9 +959,15 @@ def delete_venue(venue_id):
   # clicking that button delete it from the db then redirect the user to the homepage
 
   try:
-    venue = Venue.query.filter(Venue.id==venue_id).first()
-    db.session.delete(venue)
+    # The venue's shows go with it, so the artists' counters drop too.
+    pages = delete_entity(Venue, int(venue_id))
+    if pages is None:
+      raise LookupError(venue_id)
     db.session.commit()
+    search_index.venues.remove(int(venue_id))
+    geo_index.remove(int(venue_id))
+    matchmaker.update('venue', int(venue_id), None)
+    page_cache.invalidate(*pages)
     flash('Venue ' + venue_id + ' was successfully deleted!')
   except:
     
@@ -337,131 +976,134 @@ def delete_venue(venue_id):
   finally:
     db.session.close()
 
-  return redirect(url_for('index'))
+  return redirect(url_for('main.index'))
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@bp.route('/artists')
+@conditional(artists_validator)
 def artists():
-  # TODO: replace with real data returned from querying the database
+  # Keyset pagination on (name, id): see pagination.py.
 
-  data = []
+  after, before, limit = page_args(request.args)
 
-  artists = Artist.query.all()
+  query = db.session.query(Artist.id, Artist.name)
 
-  for artist in artists:
-    temp = {}
-    temp['id'] = artist.id
-    temp['name'] = artist.name
-    data.append(temp)
+  genres = genre_filter(Artist.genre_mask, request.args.getlist('genre'), request.args.get('match'))
+  if genres is not None:
+    query = query.filter(genres)
+
+  page = keyset_page(
+    query, (Artist.name, Artist.id), lambda row: (row.name, row.id),
+    after, before, limit)
 
-  return render_template('pages/artists.html', artists=data)
+  data = [{'id': artist.id, 'name': artist.name} for artist in page.items]
 
-@app.route('/artists/search', methods=['POST'])
+  return render_template('pages/artists.html', artists=data, page=page, total=estimate_count(Artist))
+
+@bp.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+  # Case-insensitive partial match on the artist name.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
 
-  search_term = request.form.get('search_term', '')
-  
-  artists = (db.session
-          .query(Artist.id, Artist.name)
-          .filter(Artist.name.ilike('%{}%'.format(search_term)))
-          .all())
+  search_term = request.values.get('search_term', '')
+  after, before, limit = page_args(request.args)
 
-  count = len(artists)
+  artist_ids = get_search_index().artists.search(search_term)
+  page = list_page(artist_ids, after, before, limit)
 
-  data = []
+  names = dict(db.session
+          .query(Artist.id, Artist.name)
+          .filter(Artist.id.in_(page.items))
+          .all()) if page.items else {}
 
-  for artist in artists:
-    temp = {
-      'id': artist.id,
-      'name': artist.name
-    }
-    data.append(temp)
+  data = [{'id': id, 'name': names[id]} for id in page.items if id in names]
 
   response = {
-    "count": count,
+    "count": len(artist_ids),
     "data": data
   }
   
-  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+  return render_template('pages/search_artists.html', results=response, search_term=search_term, page=page)
 
-@app.route('/artists/<int:artist_id>')
+@bp.route('/artists/<int:artist_id>')
+@conditional(artist_validator)
 def show_artist(artist_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
  
-  data = {}
-
-  artists = Artist.query.filter(Artist.id == artist_id).all()
+  cacheable = page_cacheable()
+  if cacheable:
+    html = page_cache.get('artist', artist_id)
+    if html is not None:
+      return html
 
-  if len(artists) == 0:
-    flash('No data with Artist id = ' + artist_id + ' could be found!')
-    return redirect(url_for('artists'))
-
-  past_shows = []
+  data = {}
 
-  temp_past_shows = (db.session
-          .query(Venue.id, Venue.name, Venue.image_link, Show.start_time)
-          .join(Artist, Artist.id == Show.artist_id)
-          .join(Venue, Venue.id == Show.venue_id)
-          .filter(Show.start_time < db.func.current_timestamp(), Artist.id == artist_id)
+  # The artist and all of its shows in one round trip, split below
+  # against a single "now".
+  rows = (db.session
+          .query(Artist, Venue.id, Venue.name, Venue.image_link, Show.start_time)
+          .outerjoin(Show, Show.artist_id == Artist.id)
+          .outerjoin(Venue, Venue.id == Show.venue_id)
+          .filter(Artist.id == artist_id)
+          .order_by(Show.start_time)
           .all())
 
-  past_shows_count = len(temp_past_shows)
+  if len(rows) == 0:
+    flash('No data with Artist id = ' + str(artist_id) + ' could be found!')
+    return redirect(url_for('main.artists'))
 
-  if past_shows_count > 0:
-    for past_show in temp_past_shows:
-      past_shows.append({
-          "venue_id": past_show[0],
-          "venue_name": past_show[1],
-          "venue_image_link": past_show[2],
-          "start_time": str(past_show[3])
-      })
+  artist = rows[0][0]
+  temp_past_shows, temp_upcoming_shows = partition_shows(rows)
 
-  upcoming_shows = []
-
-  temp_upcoming_shows = (db.session
-          .query(Venue.id, Venue.name, Venue.image_link, Show.start_time)
-          .join(Artist, Artist.id == Show.artist_id)
-          .join(Venue, Venue.id == Show.venue_id)
-          .filter(Show.start_time >= db.func.current_timestamp(), Artist.id == artist_id)
-          .all())
-    
-  upcoming_shows_count = len(temp_upcoming_shows)
+  past_shows = [{
+    "venue_id": show[1],
+    "venue_name": show[2],
+    "venue_image_link": show[3],
+    "start_time": show[4]
+  } for show in temp_past_shows]
 
-  if upcoming_shows_count > 0:
-    for upcoming_show in temp_upcoming_shows:
-      upcoming_shows.append({
-          "venue_id": upcoming_show[0],
-          "venue_name": upcoming_show[1],
-          "venue_image_link": upcoming_show[2],
-          "start_time": str(upcoming_show[3])
-      })
+  upcoming_shows = [{
+    "venue_id": show[1],
+    "venue_name": show[2],
+    "venue_image_link": show[3],
+    "start_time": show[4]
+  } for show in temp_upcoming_shows]
 
   data['id'] = artist_id
-  data['name'] = artists[0].name
-  data['genres'] = artists[0].genres.split(',')
-  data['city'] = artists[0].city
-  data['state'] = artists[0].state
-  data['phone'] = artists[0].phone
-  data['website'] = artists[0].website
-  data['facebook_link'] = artists[0].facebook_link
-  data['seeking_venue'] = artists[0].seeking_venue
-  data['seeking_description'] = artists[0].seeking_description
-  data['image_link'] =  artists[0].image_link
+  data['name'] = artist.name
+  data['genres'] = decode_genres(artist.genre_mask)
+  data['city'] = artist.city
+  data['state'] = artist.state
+  data['phone'] = artist.phone
+  data['website'] = artist.website
+  data['facebook_link'] = artist.facebook_link
+  data['seeking_venue'] = artist.seeking_venue
+  data['seeking_description'] = artist.seeking_description
+  data['image_link'] =  artist.image_link
   data['past_shows'] = past_shows
   data['upcoming_shows'] = upcoming_shows
-  data['past_shows_count'] = past_shows_count
-  data['upcoming_shows_count'] = upcoming_shows_count
+  data['past_shows_count'] = len(past_shows)
+  data['upcoming_shows_count'] = len(upcoming_shows)
+
+  html = render_template('pages/show_artist.html', artist=data)
+  # A page read from a replica that is behind may predate a write whose
+  # invalidation already ran, so it is served but not stored.
+  if cacheable and not replica.reading_from_replica():
+    next_start = temp_upcoming_shows[0][4] if temp_upcoming_shows else None
+    page_cache.set('artist', artist_id, html, expires_at=next_start)
+
+  return html
 
-  return render_template('pages/show_artist.html', artist=data)
+@bp.route('/artists/<int:artist_id>/suggestions')
+def artist_suggestions(artist_id):
+  return render_suggestions('artist', artist_id, Venue)
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   # TODO: populate form with fields from artist with ID <artist_id>
 
@@ -471,11 +1113,11 @@ def edit_artist(artist_id):
 
   if len(artists) == 0:
     flash('No data with Artist id = ' + artist_id + ' could be found!')
-    return redirect(url_for('artists'))
+    return redirect(url_for('main.artists'))
 
   artist['id'] = artist_id
   artist['name'] = artists[0].name
-  artist['genres'] = artists[0].genres.split(',')
+  artist['genres'] = decode_genres(artists[0].genre_mask)
   artist['city'] = artists[0].city
   artist['state'] = artists[0].state
   artist['phone'] = artists[0].phone
@@ -489,7 +1131,7 @@ def edit_artist(artist_id):
 
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
@@ -501,7 +1143,7 @@ def edit_artist_submission(artist_id):
   artist.city = form.city.data
   artist.state = form.state.data
   artist.phone = form.phone.data
-  artist.genres = ','.join(form.genres.data)
+  artist.genre_mask = encode_genres(form.genres.data)
   artist.image_link = form.image_link.data
   artist.facebook_link = form.facebook_link.data
   artist.website = form.website.data
@@ -509,7 +1151,12 @@ def edit_artist_submission(artist_id):
   artist.seeking_description = form.seeking_description.data
 
   try:
+    pages = pages_showing_artist(artist_id)
+    touch_pages(*pages)
     db.session.commit()
+    search_index.artists.add(artist_id, form.name.data)
+    matchmaker.update('artist', artist_id, artist_match_profile(form))
+    page_cache.invalidate(*pages)
     # on successful db insert, flash success
     flash('Artist ' + form.name.data + ' was successfully added!')
   except:
@@ -519,9 +1166,9 @@ def edit_artist_submission(artist_id):
   finally:
     db.session.close()
 
-  return redirect(url_for('show_artist', artist_id=artist_id))
+  return redirect(url_for('main.show_artist', artist_id=artist_id))
 
-@app.route('/artists/<artist_id>', methods=['DELETE'])
+@bp.route('/artists/<artist_id>', methods=['DELETE'])
 def delete_artist(artist_id):
   # TODO: Complete this endpoint for taking a artist_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
@@ -530,9 +1177,13 @@ def delete_artist(artist_id):
   # clicking that button delete it from the db then redirect the user to the homepage
 
   try:
-    artist = Artist.query.filter(Artist.id==artist_id).first()
-    db.session.delete(artist)
+    pages = delete_entity(Artist, int(artist_id))
+    if pages is None:
+      raise LookupError(artist_id)
     db.session.commit()
+    search_index.artists.remove(int(artist_id))
+    matchmaker.update('artist', int(artist_id), None)
+    page_cache.invalidate(*pages)
     flash('Artist ' + artist_id + ' was successfully deleted!')
   except:
     
@@ -541,9 +1192,9 @@ def delete_artist(artist_id):
   finally:
     db.session.close()
 
-  return redirect(url_for('index'))
+  return redirect(url_for('main.index'))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   # TODO: populate form with values from venue with ID <venue_id>
 
@@ -553,11 +1204,11 @@ def edit_venue(venue_id):
 
   if len(venues) == 0:
     flash('No data with Venue id = ' + venue_id + ' could be found!')
-    return redirect(url_for('venues'))
+    return redirect(url_for('main.venues'))
 
   venue['id'] = venue_id
   venue['name'] = venues[0].name
-  venue['genres'] = venues[0].genres.split(',')
+  venue['genres'] = decode_genres(venues[0].genre_mask)
   venue['address'] = venues[0].address
   venue['city'] = venues[0].city
   venue['state'] = venues[0].state
@@ -572,7 +1223,7 @@ def edit_venue(venue_id):
 
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
@@ -585,15 +1236,24 @@ def edit_venue_submission(venue_id):
   venue.city = form.city.data
   venue.state = form.state.data
   venue.phone = form.phone.data
-  venue.genres = ','.join(form.genres.data)
+  venue.genre_mask = encode_genres(form.genres.data)
   venue.image_link = form.image_link.data
   venue.facebook_link = form.facebook_link.data
   venue.website = form.website.data
   venue.seeking_talent = form.seeking_talent.data
   venue.seeking_description = form.seeking_description.data
+  location = venue_location(venue.city, venue.state)
+  for column, value in location.items():
+    setattr(venue, column, value)
 
   try:
+    pages = pages_showing_venue(venue_id)
+    touch_pages(*pages)
     db.session.commit()
+    search_index.venues.add(venue_id, form.name.data)
+    geo_index.add(venue_id, location['latitude'], location['longitude'])
+    matchmaker.update('venue', venue_id, venue_match_profile(form, location))
+    page_cache.invalidate(*pages)
     # on successful db insert, flash success
     flash('Venue ' + form.name.data + ' was successfully added!')
   except:
@@ -603,17 +1263,17 @@ def edit_venue_submission(venue_id):
   finally:
     db.session.close()
 
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  return redirect(url_for('main.show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
   # TODO: insert form data as a new Artist record in the db, instead
@@ -626,7 +1286,7 @@ def create_artist_submission():
     city = form.city.data,
     state = form.state.data,
     phone = form.phone.data,
-    genres = ','.join(form.genres.data),
+    genre_mask = encode_genres(form.genres.data),
     image_link = form.image_link.data,
     facebook_link = form.facebook_link.data,
     website = form.website.data,
@@ -640,6 +1300,8 @@ def create_artist_submission():
   try:
     db.session.add(artist)
     db.session.commit()
+    search_index.artists.add(artist.id, artist.name)
+    matchmaker.update('artist', artist.id, artist_match_profile(form))
     # on successful db insert, flash success
     flash('Artist ' + form.name.data + ' was successfully added!')
   except:
@@ -655,21 +1317,43 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+def date_window(args):
+  # ?from=YYYY-MM-DD&to=YYYY-MM-DD, both optional and inclusive. Values that
+  # don't parse are ignored, like the other list arguments.
+  window = {}
+  for name in ('from', 'to'):
+    try:
+      window[name] = datetime.strptime(args.get(name, ''), '%Y-%m-%d')
+    except ValueError:
+      pass
+  return window
+
+@bp.route('/shows')
+@conditional(shows_validator)
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-
-  shows = (db.session
-      .query(Show.id, Venue.id, Venue.name, Artist.id, Artist.name, Artist.image_link, Show.start_time)
-      .join(Venue, Show.venue_id == Venue.id)
-      .join(Artist, Show.artist_id == Artist.id)
-      .all())
+  # displays list of shows at /shows, one keyset page on (start_time, id) at a time,
+  # optionally within a ?from=&to= date window -- on PostgreSQL only the
+  # month partitions overlapping the window are read
+
+  after, before, limit = page_args(request.args)
+  window = date_window(request.args)
+
+  query = (db.session
+    .query(Show.id, Venue.id, Venue.name, Artist.id, Artist.name, Artist.image_link, Show.start_time)
+    .join(Venue, Show.venue_id == Venue.id)
+    .join(Artist, Show.artist_id == Artist.id))
+  if 'from' in window:
+    query = query.filter(Show.start_time >= window['from'])
+  if 'to' in window:
+    query = query.filter(Show.start_time < window['to'] + timedelta(days=1))
+
+  page = keyset_page(
+    query, (Show.start_time, Show.id), lambda show: (show[6], show[0]),
+    after, before, limit)
 
   data = []
   
-  for show in shows:
+  for show in page.items:
     temp = {}
     temp['id'] = show[0]
     temp['venue_id'] = show[1]
@@ -677,29 +1361,50 @@ def shows():
     temp['artist_id'] = show[3] 
     temp['artist_name'] = show[4]
     temp['artist_image_link'] = show[5]
-    temp['start_time'] = str(show[6])
+    temp['start_time'] = show[6]
 
     data.append(temp)
 
-  return render_template('pages/shows.html', shows=data)
+  window = {name: '{:%Y-%m-%d}'.format(value) for name, value in window.items()}
+  return render_template('pages/shows.html', shows=data, page=page, window=window,
+                         total=None if window else estimate_count(Show))
 
-@app.route('/shows/create')
+@bp.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO: insert form data as a new Show record in the db, instead
 
   form = ShowForm(request.form)
 
+  duration = form.duration.data or current_app.config['SHOW_DURATION_MINUTES']
+  if not 0 < duration <= current_app.config['SHOW_MAX_DURATION_MINUTES']:
+    flash('A show lasts between 1 and {} minutes.'.format(current_app.config['SHOW_MAX_DURATION_MINUTES']))
+    return render_template('forms/new_show.html', form=form), 400
+
+  try:
+    venue_id, artist_id = int(form.venue_id.data), int(form.artist_id.data)
+  except (TypeError, ValueError):
+    flash('Pick the venue and the artist from the suggestions, or enter their IDs.')
+    return render_template('forms/new_show.html', form=form), 400
+  # Checked here so a typo gets a message rather than a foreign key error.
+  venue_found, artist_found = db.session.execute(db.select(
+    db.select(Venue.id).where(Venue.id == venue_id).exists(),
+    db.select(Artist.id).where(Artist.id == artist_id).exists())).one()
+  if not (venue_found and artist_found):
+    flash('There is no {} with ID {}.'.format(*(('venue', venue_id) if not venue_found else ('artist', artist_id))))
+    return render_template('forms/new_show.html', form=form), 400
+
   show = Show (
-    venue_id = form.venue_id.data,
-    artist_id = form.artist_id.data,
-    start_time = form.start_time.data
+    venue_id = venue_id,
+    artist_id = artist_id,
+    start_time = form.start_time.data,
+    end_time = form.start_time.data + timedelta(minutes=duration) if form.start_time.data else None
   )
 
   # TODO: on unsuccessful db insert, flash an error instead.
@@ -707,10 +1412,24 @@ def create_show_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
 
   try:
+    lock_bookings([venue_id], [artist_id])
+    conflict = booking_conflict(show.venue_id, show.artist_id, show.start_time, show.end_time)
+    if conflict is not None:
+      flash(conflict_message(conflict, show.venue_id))
+      return render_template('forms/new_show.html', form=form), 409
+
+    pages = [('venue', venue_id), ('artist', artist_id)]
     db.session.add(show)
+    show_counted(show)
     db.session.commit()
+    page_cache.invalidate(*pages)
     # on successful db insert, flash success
     flash('Show was successfully listed!')
+  except IntegrityError as e:
+    # A booking that committed between the check and this insert.
+    db.session.rollback()
+    flash('The venue or artist was booked at that time in the meantime. Show could not be added!'
+          if is_booking_violation(e) else 'An error occurred. Show could not be added!')
   except:
     
     db.session.rollback()
@@ -720,23 +1439,35 @@ def create_show_submission():
 
   return render_template('pages/home.html')
 
-@app.route('/shows/search', methods=['POST'])
+@bp.route('/shows/search', methods=['GET', 'POST'])
 def search_shows():
 
-  search_term = request.form.get('search_term', '')
-  
-  shows = (db.session
-          .query(Show.id, Venue.id, Venue.name, Artist.id, Artist.name, Artist.image_link, Show.start_time)
-          .join(Venue, Show.venue_id == Venue.id)
-          .join(Artist, Show.artist_id == Artist.id)
-          .filter(Venue.name.ilike('%{}%'.format(search_term)) | Artist.name.ilike('%{}%'.format(search_term)))
-          .all())
+  search_term = request.values.get('search_term', '')
+  after, before, limit = page_args(request.args)
+
+  index = get_search_index()
+  venue_ids = index.venues.search(search_term)
+  artist_ids = index.artists.search(search_term)
 
-  count = len(shows)
+  matching = (matching_ids(Show.venue_id, Venue.name, venue_ids, search_term) |
+              matching_ids(Show.artist_id, Artist.name, artist_ids, search_term))
+
+  def joined(query):
+    return (query
+      .join(Venue, Show.venue_id == Venue.id)
+      .join(Artist, Show.artist_id == Artist.id)
+      .filter(matching))
+
+  page = keyset_page(
+    joined(db.session.query(Show.id, Venue.id, Venue.name, Artist.id, Artist.name, Artist.image_link, Show.start_time)),
+    (Show.start_time, Show.id), lambda show: (show[6], show[0]),
+    after, before, limit)
+
+  count = joined(db.session.query(db.func.count(Show.id))).scalar()
 
   data = []
 
-  for show in shows:
+  for show in page.items:
     temp = {
       'id': show[0],
       'venue_id': show[1],
@@ -744,7 +1475,7 @@ def search_shows():
       'artist_id': show[3],
       'artist_name': show[4],
       'artist_image_link': show[5],
-      'start_time': str(show[6])
+      'start_time': show[6]
     }
 
     data.append(temp)
@@ -754,9 +1485,10 @@ def search_shows():
     "data": data
   }
   
-  return render_template('pages/search_shows.html', results=response, search_term=search_term)
+  return render_template('pages/search_shows.html', results=response, search_term=search_term, page=page)
 
-@app.route('/shows/<int:show_id>')
+@bp.route('/shows/<int:show_id>')
+@conditional(show_validator)
 def show_show(show_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
@@ -772,7 +1504,7 @@ def show_show(show_id):
 
   if len(shows) == 0:
     flash('No data with Show id = ' + str(show_id) + ' could be found!')
-    return redirect(url_for('shows'))
+    return redirect(url_for('main.shows'))
 
   data['id'] = show_id
   data['venue_id'] = shows[0][0]
@@ -780,28 +1512,476 @@ def show_show(show_id):
   data['artist_id'] = shows[0][2]
   data['artist_name'] = shows[0][3]
   data['artist_image_link'] = shows[0][4]
-  data['start_time'] = str(shows[0][5])
+  data['start_time'] = shows[0][5]
 
   return render_template('pages/show_show.html', show=data)
 
-@app.errorhandler(404)
+#  Images
+#  ----------------------------------------------------------------
+
+IMAGE_MODELS = {'venue': Venue, 'artist': Artist}
+
+@bp.route('/img/<kind>/<int:entity_id>/<size>')
+def image(kind, entity_id, size):
+  # serves a venue's or artist's image resized, from the thumbnail cache.
+  # Templates link here through image_url(), with ?v= the digest of the
+  # current image_link, so a response never goes stale.
+
+  model = IMAGE_MODELS.get(kind)
+  if model is None or size not in thumbnails.SIZES:
+    abort(404)
+  link = db.session.query(model.image_link).filter(model.id == entity_id).scalar()
+  if not link:
+    abort(404)
+
+  cache = current_app.extensions['thumbnails']
+  if cache is None:
+    return redirect(link)
+  if request.args.get('v') != thumbnails.link_digest(link):
+    return redirect(thumbnails.image_url(kind, entity_id, link, size))
+
+  # Only an explicit image/webp counts: browsers without WebP send */* too.
+  format = 'webp' if any(value == 'image/webp' for value, _ in request.accept_mimetypes) else 'jpeg'
+  try:
+    path = cache.resized(link, size, format)
+  except (OSError, ValueError) as e:
+    current_app.logger.warning('Could not resize %s image %s from %s: %s', kind, entity_id, link, e)
+    return redirect(link)
+
+  response = send_file(path, mimetype=thumbnails.FORMATS[format][1],
+                       max_age=current_app.config['IMAGE_MAX_AGE'])
+  response.vary.add('Accept')
+  response.cache_control.immutable = True
+  return response
+
+#  API
+#  ----------------------------------------------------------------
+
+# Rows fetched per round trip from the server-side cursor; memory use is
+# bounded by this no matter how many rows a response contains.
+API_FETCH_SIZE = 1000
+
+def api_json(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  raise TypeError(repr(value))
+
+def stream_rows(query, serialize):
+  # Stream the query as NDJSON (default) or, with ?format=json, as a single
+  # JSON array sent in chunks. yield_per() makes the PostgreSQL driver use a
+  # server-side cursor, so the first rows go out before the query finishes.
+  as_array = request.args.get('format') == 'json'
+
+  def generate():
+    separator = ''
+    if as_array:
+      yield '['
+    chunk = []
+    for row in query.yield_per(API_FETCH_SIZE):
+      chunk.append(json.dumps(serialize(row), default=api_json))
+      if len(chunk) == API_FETCH_SIZE:
+        yield separator + (',' if as_array else '\n').join(chunk)
+        separator = ',' if as_array else '\n'
+        chunk = []
+    if chunk:
+      yield separator + (',' if as_array else '\n').join(chunk)
+    yield ']' if as_array else '\n'
+
+  response = Response(stream_with_context(generate()),
+                      mimetype='application/json' if as_array else 'application/x-ndjson')
+  response.headers['X-Accel-Buffering'] = 'no'
+  return response
+
+def api_filters(query, model, order_by):
+  # The filters the HTML pages accept: ?search_term=, ?genre= (&match=all)
+  # and the keyset ?after= cursor of the matching listing.
+  search_term = request.args.get('search_term')
+  if search_term is not None:
+    index = get_search_index()
+    if model is Show:
+      # api_shows joins Venue and Artist.
+      query = query.filter(
+        matching_ids(Show.venue_id, Venue.name, index.venues.search(search_term), search_term) |
+        matching_ids(Show.artist_id, Artist.name, index.artists.search(search_term), search_term))
+    else:
+      names = index.venues if model is Venue else index.artists
+      query = query.filter(matching_ids(model.id, model.name, names.search(search_term), search_term))
+
+  if model is not Show:
+    genres = genre_filter(model.genre_mask, request.args.getlist('genre'), request.args.get('match'))
+    if genres is not None:
+      query = query.filter(genres)
+
+  after = decode_cursor(request.args.get('after'), len(order_by))
+  if after is not None:
+    query = query.filter(db.tuple_(*order_by) > db.tuple_(*after))
+
+  try:
+    limit = int(request.args['limit'])
+  except (KeyError, ValueError):
+    limit = None
+
+  return query.order_by(*order_by).limit(limit)
+
+@bp.route('/api/venues')
+def api_venues():
+  query = api_filters(
+    db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.address,
+                     Venue.phone, Venue.genre_mask, Venue.image_link, Venue.facebook_link,
+                     Venue.website, Venue.seeking_talent, Venue.seeking_description),
+    Venue, (Venue.id,))
+
+  return stream_rows(query, lambda row: {
+    "id": row.id,
+    "name": row.name,
+    "city": row.city,
+    "state": row.state,
+    "address": row.address,
+    "phone": row.phone,
+    "genres": decode_genres(row.genre_mask),
+    "image_link": row.image_link,
+    "facebook_link": row.facebook_link,
+    "website": row.website,
+    "seeking_talent": row.seeking_talent,
+    "seeking_description": row.seeking_description
+  })
+
+@bp.route('/api/artists')
+def api_artists():
+  query = api_filters(
+    db.session.query(Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone,
+                     Artist.genre_mask, Artist.image_link, Artist.facebook_link,
+                     Artist.website, Artist.seeking_venue, Artist.seeking_description),
+    Artist, (Artist.name, Artist.id))
+
+  return stream_rows(query, lambda row: {
+    "id": row.id,
+    "name": row.name,
+    "city": row.city,
+    "state": row.state,
+    "phone": row.phone,
+    "genres": decode_genres(row.genre_mask),
+    "image_link": row.image_link,
+    "facebook_link": row.facebook_link,
+    "website": row.website,
+    "seeking_venue": row.seeking_venue,
+    "seeking_description": row.seeking_description
+  })
+
+@bp.route('/api/shows')
+def api_shows():
+  query = api_filters(
+    db.session
+      .query(Show.id, Venue.id, Venue.name, Artist.id, Artist.name, Artist.image_link, Show.start_time)
+      .join(Venue, Show.venue_id == Venue.id)
+      .join(Artist, Show.artist_id == Artist.id),
+    Show, (Show.start_time, Show.id))
+
+  return stream_rows(query, lambda show: {
+    "id": show[0],
+    "venue_id": show[1],
+    "venue_name": show[2],
+    "artist_id": show[3],
+    "artist_name": show[4],
+    "artist_image_link": show[5],
+    "start_time": show[6]
+  })
+
+AUTOCOMPLETE_LIMIT = 10
+
+@bp.route('/autocomplete')
+def autocomplete():
+  # ?kind=artist|venue&q=<prefix>: up to ?limit= [{"id", "name"}] whose name
+  # has a word starting with q, from the in-memory prefix index.
+  kind = request.args.get('kind')
+  if kind not in ('artist', 'venue'):
+    abort(404)
+  index = get_search_index()
+  index = index.artists if kind == 'artist' else index.venues
+  limit = min(request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int), AUTOCOMPLETE_LIMIT * 5)
+  matches = index.complete(request.args.get('q', ''), limit)
+  return Response(json.dumps([{'id': id, 'name': name} for id, name in matches]),
+                  mimetype='application/json')
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
   return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(error):
   return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-  file_handler = FileHandler('error.log')
-  file_handler.setFormatter(
-      Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-  )
-  app.logger.setLevel(logging.INFO)
-  file_handler.setLevel(logging.INFO)
-  app.logger.addHandler(file_handler)
-  app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@bp.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(importer.KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=importer.BATCH_SIZE, show_default=True)
+def import_command(kind, path, batch_size):
+  """Bulk-load venues, artists or shows from a .csv, .json or .ndjson file."""
+  model = {'venues': Venue, 'artists': Artist, 'shows': Show}[kind]
+
+  known_ids = None
+  if kind == 'shows':
+    known_ids = {
+      'venue_id': {row[0] for row in db.session.query(Venue.id)},
+      'artist_id': {row[0] for row in db.session.query(Artist.id)},
+    }
+
+  started = datetime.now()
+  try:
+    loaded, rejected, seconds = importer.import_rows(
+      db.session, model.__table__, kind, importer.read_rows(path), batch_size, known_ids,
+      check=import_conflicts if kind == 'shows' else None)
+  except IntegrityError as e:
+    if not is_booking_violation(e):
+      raise
+    # Batches before this one are committed.
+    db.session.rollback()
+    raise click.ClickException('a batch double-books a venue or artist: {}'.format(e.orig))
+
+  if kind == 'shows' and loaded:
+    # Recount the venues and artists of the new shows; the importer stamps
+    # updated_at on every row it writes. This also moves their updated_at.
+    recount_counters(counters_as_of(), since=started)
+    db.session.commit()
+
+  if db.engine.dialect.name == 'postgresql':
+    # Rows may carry explicit ids; keep the sequence ahead of them.
+    db.session.execute(db.text(
+      'SELECT setval(pg_get_serial_sequence(:table, \'id\'), COALESCE(MAX(id), 1)) FROM "{}"'
+      .format(model.__tablename__)), {'table': '"{}"'.format(model.__tablename__)})
+    db.session.commit()
+
+  for line, errors in rejected:
+    click.echo('rejected line {}: {}'.format(line, json.dumps(errors)), err=True)
+  click.echo('{} {} loaded in {:.1f}s ({:.0f} rows/s), {} rejected'.format(
+    loaded, kind, seconds, loaded / seconds if seconds else 0, len(rejected)))
+
+@bp.cli.group('shows')
+def shows_command():
+  """Show bookings."""
+
+@shows_command.command('conflicts')
+def show_conflicts_command():
+  """List shows overlapping another at the same venue or for the same artist.
+
+  Streams the shows in (venue_id, start_time) and then (artist_id,
+  start_time) index order and sweeps each in a single pass.
+  """
+  found = 0
+  for label, column in (('Venue', Show.venue_id), ('Artist', Show.artist_id)):
+    rows = db.session.execute(
+      db.select(column, Show.start_time, Show.end_time, Show.id)
+        .order_by(column, Show.start_time)
+        .execution_options(yield_per=API_FETCH_SIZE))
+    for key, earlier, later in find_overlaps(rows):
+      found += 1
+      click.echo('{} {}: show {} overlaps show {}'.format(label, key, later, earlier))
+  click.echo('{} conflicting shows'.format(found))
+  if found:
+    raise SystemExit(1)
+
+@shows_command.command('partitions')
+@click.option('--ahead', type=int, help='Months to create ahead (default SHOW_PARTITION_MONTHS_AHEAD).')
+def show_partitions_command(ahead):
+  """Create the month partitions of Show ahead of time (PostgreSQL).
+
+  Also gives every month with rows in the default partition its own
+  partition and moves those rows into it. Run it daily.
+  """
+  if db.engine.dialect.name != 'postgresql':
+    raise click.ClickException('Show is only partitioned on PostgreSQL.')
+  if ahead is None:
+    ahead = current_app.config['SHOW_PARTITION_MONTHS_AHEAD']
+  created = partitions.maintain(db.session.connection(), datetime.now(), ahead)
+  db.session.commit()
+  for name, moved in created:
+    click.echo('created {} ({} rows moved from {})'.format(name, moved, partitions.DEFAULT))
+  click.echo('{} partitions created'.format(len(created)))
+
+@bp.cli.group('assets')
+def assets_command():
+  """Static asset bundles."""
+
+@assets_command.command('build')
+def build_assets_command():
+  """Bundle, fingerprint and precompress the static assets into static/dist.
+
+  Restart the app afterwards: the manifest is read at startup.
+  """
+  manifest = assets.build(current_app.static_folder)
+  for name, filename in sorted(manifest.items()):
+    click.echo('{} -> {}/{}'.format(name, assets.DIST, filename))
+
+@bp.cli.group('venues')
+def venues_command():
+  """Venues."""
+
+@venues_command.command('geocode')
+@click.option('--all', 'relocate', is_flag=True, help='Also re-locate venues that have a location.')
+def geocode_venues_command(relocate):
+  """Place venues at their city's centre from the gazetteer (GAZETTEER_PATH).
+
+  Works one distinct (city, state) at a time. Cities missing from the
+  gazetteer are listed; add them to the file and run this again. Running
+  workers pick the new locations up when they restart.
+  """
+  gazetteer = geo.load_gazetteer(current_app.config['GAZETTEER_PATH'])
+  pending = [] if relocate else [Venue.latitude.is_(None)]
+  places = db.session.query(Venue.city, Venue.state, db.func.count(Venue.id)).filter(*pending).group_by(Venue.city, Venue.state).all()
+
+  located, missing = 0, []
+  for city, state, count in places:
+    columns = geo.location_columns(gazetteer, city, state)
+    if columns['latitude'] is None:
+      missing.append((count, city, state))
+      continue
+    located += db.session.execute(db.update(Venue)
+      .where(Venue.city == city, Venue.state == state, *pending)
+      .values(updated_at=datetime.now(), **columns)).rowcount
+  db.session.commit()
+
+  for count, city, state in sorted(missing, reverse=True):
+    click.echo('not in the gazetteer: {}, {} ({} venues)'.format(city, state, count), err=True)
+  click.echo('{} venues located, {} left without a location'.format(
+    located, sum(count for count, city, state in missing)))
+
+@bp.cli.group('counters')
+def counters_command():
+  """Upcoming/past show counters on venues and artists."""
+
+@counters_command.command('rollover')
+@click.option('--every', type=int, help='Keep running, rolling over every this many seconds.')
+def counters_rollover_command(every):
+  """Move shows that have started from upcoming to past.
+
+  Run it every minute from cron, or leave it running with --every 60.
+  """
+  while True:
+    moved = roll_over_counters()
+    click.echo('{} shows moved to past, counters as of {}'.format(moved, counters_as_of()))
+    db.session.rollback()
+    if not every:
+      break
+    time.sleep(every)
+
+@counters_command.command('check')
+@click.option('--repair', is_flag=True, help='Rewrite the counters that have drifted.')
+def counters_check_command(repair):
+  """Compare the counters with the shows table; exit 1 on drift unless repaired."""
+  as_of = counters_as_of()
+  drifted = 0
+  for model, column in COUNTED:
+    table = model.__table__
+    upcoming, past = counted_shows(model, column, as_of)
+    rows = db.session.execute(
+      db.select(table.c.id, table.c.upcoming_shows_count, table.c.past_shows_count, upcoming, past)
+        .where(counter_drift(model, column, as_of))
+        .order_by(table.c.id)).all()
+    drifted += len(rows)
+    for id, stored_upcoming, stored_past, actual_upcoming, actual_past in rows[:20]:
+      click.echo('{} {}: upcoming {} (actual {}), past {} (actual {})'.format(
+        model.__tablename__, id, stored_upcoming, actual_upcoming, stored_past, actual_past))
+    if len(rows) > 20:
+      click.echo('{}: {} more'.format(model.__tablename__, len(rows) - 20))
+
+  if repair and drifted:
+    changed = recount_counters(as_of)
+    db.session.commit()
+    click.echo('repaired {}'.format(', '.join(
+      '{} {} rows'.format(count, name) for name, count in changed.items())))
+  else:
+    db.session.rollback()
+    click.echo('{} rows drifted (counters as of {})'.format(drifted, as_of))
+    if drifted:
+      raise SystemExit(1)
+
+@bp.cli.command('purge')
+@click.option('--batch-size', type=int, help='Shows per transaction (default PURGE_BATCH_SIZE).')
+@click.option('--every', type=int, help='Keep running, purging every this many seconds.')
+def purge_command(batch_size, every):
+  """Remove the venues and artists deleted with PURGE_MIN_SHOWS set, and their shows.
+
+  Run it every minute from cron, or leave it running with --every 60.
+  """
+  if batch_size is None:
+    batch_size = current_app.config['PURGE_BATCH_SIZE']
+  while True:
+    purged = purge_deleted(batch_size)
+    for (kind, id), shows in sorted(purged.items()):
+      click.echo('purged {} {} and {} shows'.format(kind, id, shows))
+    click.echo('{} venues and artists purged'.format(len(purged)))
+    if not every:
+      break
+    time.sleep(every)
+
+#----------------------------------------------------------------------------#
+# Application factory.
+#----------------------------------------------------------------------------#
+
+def engine_options(config, url=None):
+  # Pool settings for SQLAlchemy's engine, built from the DB_* config values.
+  url = make_url(url or config['SQLALCHEMY_DATABASE_URI'])
+  if url.get_backend_name() != 'postgresql':
+    return {}
+
+  if config.get('DB_EXTERNAL_POOLER'):
+    # PgBouncer-style proxy in front of Postgres: it does the pooling, so
+    # every checkout opens (and returns) a proxy connection. Timeouts are
+    # not sent as startup options, which poolers reject; set them on the
+    # database role instead (ALTER ROLE ... SET statement_timeout = ...).
+    return {'poolclass': NullPool}
+
+  options = []
+  if config.get('DB_STATEMENT_TIMEOUT_MS'):
+    options.append('-c statement_timeout={:d}'.format(config['DB_STATEMENT_TIMEOUT_MS']))
+  if config.get('DB_IDLE_IN_TRANSACTION_TIMEOUT_MS'):
+    options.append('-c idle_in_transaction_session_timeout={:d}'.format(
+      config['DB_IDLE_IN_TRANSACTION_TIMEOUT_MS']))
+
+  engine = {
+    'pool_size': config.get('DB_POOL_SIZE', 5),
+    'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+    'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+    'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+    'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+  }
+  if options:
+    engine['connect_args'] = {'options': ' '.join(options)}
+  return engine
+
+def create_app(config='config'):
+  app = Flask(__name__)
+  app.config.from_object(config)
+  app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+  replica.bind_config(app, engine_options(app.config, app.config.get('SQLALCHEMY_REPLICA_URI')))
+
+  moment.init_app(app)
+  db.init_app(app)
+  migrate.init_app(app, db)
+  page_cache.init_app(app)
+  query_pool.init_app(app)
+  static_assets.init_app(app)
+  images.init_app(app)
+  instrumentation.init_app(app)
+  replica.init_app(app, db)
+  app.register_blueprint(bp)
+
+  if not app.debug:
+    file_handler = FileHandler('error.log')
+    file_handler.setFormatter(
+        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    app.logger.setLevel(logging.INFO)
+    file_handler.setLevel(logging.INFO)
+    app.logger.addHandler(file_handler)
+    app.logger.info('errors')
+
+  return app
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -815,6 +1995,7 @@ if __name__ == '__main__':
 # Or specify port manually:
 '''
 if __name__ == '__main__':
+  app = create_app()
   port = int(os.environ.get('PORT', 5000))
   app.run(host='0.0.0.0', port=port)
 '''
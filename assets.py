@@ -0,0 +1,189 @@
+"""Fingerprinted, precompressed static assets.
+
+``flask assets build`` concatenates each bundle in BUNDLES (minifying the
+CSS and any JS not shipped minified) and copies FILES, writing every
+output to ``static/dist`` under a content-hashed name, next to ``.gz`` and
+-- with the optional ``brotli`` package -- ``.br`` variants of the text
+ones. ``static/dist/manifest.json`` maps the source names to the hashed
+files. static/dist sits beside static/css, so relative url()s in the
+stylesheets still resolve.
+
+Templates ask for ``static_urls(bundle)`` and ``static_url(path)``: the
+hashed file once built, the source files otherwise, so a checkout works
+without a build. The manifest is read when the app starts; build as part
+of a release and bump RELEASE_ID with it.
+
+/static/dist responses never change, so they are cacheable for a year and
+marked immutable, and the precompressed variant the client accepts is
+sent. A front server can do the same from these files (nginx
+``gzip_static``/``brotli_static``).
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from flask import current_app, request, send_from_directory, url_for
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+# Bundle name -> source files under static/, in load order.
+BUNDLES = {
+  'main.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+               'css/main.responsive.css', 'css/main.quickfix.css'],
+  'head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+  'main.js': ['js/libs/jquery-1.11.1.min.js', 'js/libs/bootstrap-3.1.1.min.js',
+              'js/plugins.js', 'js/script.js', 'js/autocomplete.js', 'js/nearby.js',
+              'js/suggestions.js'],
+}
+# Files fingerprinted on their own.
+FILES = ['img/front-splash.jpg']
+
+COMPRESSIBLE = ('.css', '.js', '.svg')
+# By preference.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+MAX_AGE = 365 * 24 * 60 * 60
+
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(text):
+  # Comments and whitespace only: enough for the hand-written stylesheets.
+  text = _CSS_COMMENT.sub('', text)
+  text = _CSS_SPACE.sub(' ', text)
+  return _CSS_PUNCTUATION.sub(r'\1', text).replace(';}', '}').strip()
+
+
+def minify_js(text):
+  try:
+    import rjsmin
+  except ImportError:
+    return text
+  return rjsmin.jsmin(text)
+
+
+def read_source(static_folder, path):
+  with open(os.path.join(static_folder, path), encoding='utf-8') as f:
+    text = f.read()
+  if '.min.' in path:
+    return text
+  return minify_css(text) if path.endswith('.css') else minify_js(text)
+
+
+def hashed_name(name, data):
+  stem, ext = os.path.splitext(os.path.basename(name))
+  return '{}.{}{}'.format(stem, hashlib.sha256(data).hexdigest()[:12], ext)
+
+
+def write_asset(dist, name, data):
+  """Write ``data`` under its hashed name, plus compressed variants; return the name."""
+  filename = hashed_name(name, data)
+  outputs = {filename: data}
+  if filename.endswith(COMPRESSIBLE):
+    outputs[filename + '.gz'] = gzip.compress(data, compresslevel=9, mtime=0)
+    try:
+      import brotli
+    except ImportError:
+      pass
+    else:
+      outputs[filename + '.br'] = brotli.compress(data, quality=11)
+  for output, content in outputs.items():
+    path = os.path.join(dist, output)
+    if not os.path.exists(path):
+      with open(path, 'wb') as f:
+        f.write(content)
+  return filename
+
+
+def build(static_folder):
+  """Build every bundle and file into static/dist; return the manifest.
+
+  Earlier builds are left in place, so pages rendered by the previous
+  release keep working while it drains.
+  """
+  dist = os.path.join(static_folder, DIST)
+  os.makedirs(dist, exist_ok=True)
+  manifest = {}
+  for name, sources in BUNDLES.items():
+    # A newline and semicolon between scripts keep one file's last
+    # statement from running into the next.
+    separator = '\n' if name.endswith('.css') else '\n;\n'
+    text = separator.join(read_source(static_folder, path) for path in sources)
+    manifest[name] = write_asset(dist, name, text.encode('utf-8'))
+  for path in FILES:
+    with open(os.path.join(static_folder, path), 'rb') as f:
+      manifest[path] = write_asset(dist, path, f.read())
+
+  path = os.path.join(dist, MANIFEST)
+  with open(path + '.tmp', 'w') as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+  os.replace(path + '.tmp', path)
+  return manifest
+
+
+class Assets:
+  """Reads the manifest at startup and serves /static/dist."""
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    dist = os.path.join(app.static_folder, DIST)
+    try:
+      with open(os.path.join(dist, MANIFEST)) as f:
+        manifest = json.load(f)
+    except FileNotFoundError:
+      manifest = {}
+    app.extensions['assets'] = {
+      'manifest': manifest,
+      'files': set(os.listdir(dist)) if manifest else set(),
+    }
+    app.add_url_rule('{}/{}/<path:filename>'.format(app.static_url_path, DIST),
+                     'assets', send_asset)
+    app.add_template_global(static_url)
+    app.add_template_global(static_urls)
+
+
+def static_url(path):
+  """URL of the static file ``path``, fingerprinted if built."""
+  filename = current_app.extensions['assets']['manifest'].get(path)
+  if filename is None:
+    return url_for('static', filename=path)
+  return url_for('assets', filename=filename)
+
+
+def static_urls(bundle):
+  """URLs to load for ``bundle``: the built file, or else its sources."""
+  filename = current_app.extensions['assets']['manifest'].get(bundle)
+  if filename is None:
+    return [url_for('static', filename=path) for path in BUNDLES[bundle]]
+  return [url_for('assets', filename=filename)]
+
+
+def send_asset(filename):
+  files = current_app.extensions['assets']['files']
+  encoding = None
+  for name, suffix in ENCODINGS:
+    if request.accept_encodings[name] and filename + suffix in files:
+      encoding = name
+      break
+
+  dist = os.path.join(current_app.static_folder, DIST)
+  if encoding is None:
+    response = send_from_directory(dist, filename, max_age=MAX_AGE)
+  else:
+    # Typed after the original file, not the .gz/.br.
+    response = send_from_directory(dist, filename + dict(ENCODINGS)[encoding], max_age=MAX_AGE,
+                                   mimetype=mimetypes.guess_type(filename)[0])
+    response.content_encoding = encoding
+  if filename.endswith(COMPRESSIBLE):
+    response.vary.add('Accept-Encoding')
+  response.cache_control.immutable = True
+  return response
@@ -0,0 +1,125 @@
+"""Shared helpers for the scripts in this package.
+
+Run every script from the project root as a module, e.g.
+
+    $ BENCH_DATABASE_URL=postgresql://localhost/fyyur_bench python -m benchmarks.venues_queries
+
+When ``BENCH_DATABASE_URL`` is not set an in-memory SQLite database is used.
+Never point it at a database holding real data: the tables are dropped and
+re-created on every run.
+"""
+
+import os
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event
+
+import config
+from genres import encode_genres
+
+GENRES = ['Jazz', 'Reggae', 'Swing', 'Classical', 'Folk', 'Rock n Roll', 'Blues', 'Hip-Hop']
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Chicago', 'IL'),
+          ('Seattle', 'WA'), ('Boston', 'MA'), ('Denver', 'CO'), ('Miami', 'FL')]
+WORDS = ['The', 'Musical', 'Hop', 'Dueling', 'Pianos', 'Bar', 'Park', 'Square', 'Live',
+         'Music', 'Coffee', 'Guns', 'Petals', 'Wild', 'Sax', 'Band', 'Blue', 'Room', 'Hall']
+
+
+def load_app():
+  """Return ``(app_module, app)`` with the app bound to the benchmark database."""
+  config.SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL', 'sqlite://')
+  config.WTF_CSRF_ENABLED = False
+  import app as app_module
+  return app_module, app_module.create_app(config)
+
+
+def _name(rng, i):
+  return '{} {} {}'.format(rng.choice(WORDS), rng.choice(WORDS), i)
+
+
+def seed(app_module, venues=100, artists=100, shows=1000, seed=0):
+  """Drop, re-create and fill the tables with a reproducible synthetic dataset."""
+  db = app_module.db
+  rng = random.Random(seed)
+  now = datetime.now()
+
+  db.drop_all()
+  if db.engine.dialect.name == 'postgresql':
+    db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+    db.session.commit()
+  db.create_all()
+
+  venue_rows = []
+  for i in range(1, venues + 1):
+    city, state = rng.choice(CITIES)
+    venue_rows.append({
+      'id': i, 'name': _name(rng, i), 'city': city, 'state': state,
+      'address': '{} Main Street'.format(i), 'phone': '555-000-0000',
+      'genre_mask': encode_genres(rng.sample(GENRES, 2)), 'seeking_talent': rng.random() < 0.5,
+      'seeking_description': ''
+    })
+
+  artist_rows = []
+  for i in range(1, artists + 1):
+    city, state = rng.choice(CITIES)
+    artist_rows.append({
+      'id': i, 'name': _name(rng, i), 'city': city, 'state': state,
+      'phone': '555-000-0000', 'genre_mask': encode_genres(rng.sample(GENRES, 2)),
+      'seeking_venue': rng.random() < 0.5, 'seeking_description': ''
+    })
+
+  # Shows fill whole slots of one show length within a year either side of
+  # now, with at most one show per venue and per artist in a slot, so the
+  # dataset has no double bookings.
+  length = timedelta(minutes=current_app.config.get('SHOW_DURATION_MINUTES', 120))
+  slots = int(timedelta(days=365) / length)
+  taken = set()
+  show_rows = []
+  for i in range(1, shows + 1):
+    while True:
+      venue, artist, slot = rng.randint(1, venues), rng.randint(1, artists), rng.randint(-slots, slots)
+      if ('venue', venue, slot) not in taken and ('artist', artist, slot) not in taken:
+        break
+    taken.update([('venue', venue, slot), ('artist', artist, slot)])
+    show_rows.append({
+      'id': i,
+      'venue_id': venue,
+      'artist_id': artist,
+      'start_time': now + slot * length,
+      'end_time': now + (slot + 1) * length
+    })
+
+  for model, rows in ((app_module.Venue, venue_rows),
+                      (app_module.Artist, artist_rows),
+                      (app_module.Show, show_rows)):
+    for start in range(0, len(rows), 10000):
+      db.session.execute(model.__table__.insert(), rows[start:start + 10000])
+  app_module.init_counters()
+  db.session.commit()
+
+  if db.engine.dialect.name == 'postgresql':
+    # Explicit ids were inserted, so move the sequences past them.
+    for table in ('Venue', 'Artist', 'Show'):
+      db.session.execute(db.text(
+        'SELECT setval(pg_get_serial_sequence(\'"{0}"\', \'id\'), '
+        'COALESCE(MAX(id), 1)) FROM "{0}"'.format(table)))
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+
+
+@contextmanager
+def count_statements(engine):
+  """Collect every SQL statement the engine sends while the block runs."""
+  statements = []
+
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+  event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+  try:
+    yield statements
+  finally:
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
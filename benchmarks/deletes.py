@@ -0,0 +1,90 @@
+"""Deleting a venue with many shows: ORM cascade, database cascade, soft delete.
+
+Three venues get --shows shows each. The first is deleted the way the
+ORM cascades (every show loaded into the session and deleted with it),
+the second with delete_entity()'s single DELETE, and the third is marked
+deleted and then purged in --batch-size batches; the longest purge
+transaction is what holds locks. Fails if the counters drift.
+
+    $ python -m benchmarks.deletes --shows 20000
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event
+
+from benchmarks.common import load_app, seed
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--shows', type=int, default=20000)
+  parser.add_argument('--artists', type=int, default=500)
+  parser.add_argument('--batch-size', type=int, default=1000)
+  args = parser.parse_args()
+
+  app_module, app = load_app()
+  Venue, Show, db = app_module.Venue, app_module.Show, app_module.db
+
+  with app.app_context():
+    seed(app_module, venues=3, artists=args.artists, shows=0)
+    # Every show in its own slot, so no venue or artist is double-booked.
+    length = timedelta(minutes=current_app.config['SHOW_DURATION_MINUTES'])
+    first = datetime.now() - 1.5 * args.shows * length
+    rows = [{'venue_id': venue, 'artist_id': i % args.artists + 1,
+             'start_time': first + ((venue - 1) * args.shows + i) * length,
+             'end_time': first + ((venue - 1) * args.shows + i + 1) * length}
+            for venue in (1, 2, 3) for i in range(args.shows)]
+    for start in range(0, len(rows), 10000):
+      db.session.execute(Show.__table__.insert(), rows[start:start + 10000])
+    app_module.recount_counters(app_module.counters_as_of())
+    db.session.commit()
+
+    started = time.perf_counter()
+    venue = db.session.get(Venue, 1)
+    for show in venue.shows:
+      db.session.delete(show)
+    db.session.delete(venue)
+    db.session.commit()
+    print('ORM cascade:      {:8.0f} ms'.format((time.perf_counter() - started) * 1000))
+    app_module.recount_counters(app_module.counters_as_of())
+    db.session.commit()
+
+    started = time.perf_counter()
+    app_module.delete_entity(Venue, 2)
+    db.session.commit()
+    print('database cascade: {:8.0f} ms'.format((time.perf_counter() - started) * 1000))
+
+    current_app.config['PURGE_MIN_SHOWS'] = 1
+    started = time.perf_counter()
+    app_module.delete_entity(Venue, 3)
+    db.session.commit()
+    print('soft delete:      {:8.0f} ms'.format((time.perf_counter() - started) * 1000))
+
+    batches = []
+    def committed(session):
+      batches.append(time.perf_counter())
+    event.listen(db.session, 'after_commit', committed)
+    started = time.perf_counter()
+    try:
+      app_module.purge_deleted(args.batch_size)
+    finally:
+      event.remove(db.session, 'after_commit', committed)
+    longest = max(end - begin for begin, end in zip([started] + batches, batches))
+    print('purge:            {:8.0f} ms in {} transactions, longest {:.0f} ms'.format(
+      (batches[-1] - started) * 1000, len(batches), longest * 1000))
+
+    as_of = app_module.counters_as_of()
+    drifted = sum(db.session.query(model.id).filter(app_module.counter_drift(model, column, as_of)).count()
+                  for model, column in app_module.COUNTED)
+    left = db.session.query(Show.id).count()
+    print('{} shows left, {} counters drifted'.format(left, drifted))
+  return 0 if not left and not drifted else 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,71 @@
+"""Render ``shows.html`` with many shows using the old and new datetime filter.
+
+The old path passed ``str(start_time)`` and let the filter re-parse it with
+dateutil and babel on every tile. The new path passes the datetime itself
+and reuses the compiled babel pattern.
+
+    $ python -m benchmarks.format_datetime --shows 10000
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from benchmarks.common import load_app
+
+
+def legacy_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+
+def render(app, shows, repeat):
+  from flask import render_template
+  timings = []
+  with app.test_request_context('/shows'):
+    for _ in range(repeat):
+      started = time.perf_counter()
+      render_template('pages/shows.html', shows=shows, page=None, window={}, total=len(shows))
+      timings.append((time.perf_counter() - started) * 1000)
+  return statistics.median(timings)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--shows', type=int, default=10000)
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  app_module, app = load_app()
+  start = datetime(2030, 1, 1, 20, 0)
+  shows = [{
+    'id': i, 'venue_id': 1, 'venue_name': 'The Musical Hop', 'artist_id': 1,
+    'artist_name': 'Guns N Petals', 'artist_image_link': '',
+    'start_time': start + timedelta(hours=i)
+  } for i in range(args.shows)]
+  legacy_shows = [dict(show, start_time=str(show['start_time'])) for show in shows]
+
+  app.jinja_env.filters['datetime'] = legacy_format_datetime
+  app.jinja_env.cache.clear()
+  before = render(app, legacy_shows, args.repeat)
+
+  app.jinja_env.filters['datetime'] = app_module.format_datetime
+  app.jinja_env.cache.clear()
+  after = render(app, shows, args.repeat)
+
+  print('render shows.html with {} shows: {:.1f} ms -> {:.1f} ms ({:.1f}x)'.format(
+    args.shows, before, after, before / after))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
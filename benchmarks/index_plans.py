@@ -0,0 +1,80 @@
+"""Show query plans and timings for the indexed access paths.
+
+Needs PostgreSQL (``BENCH_DATABASE_URL``). The dataset is seeded with the
+indexes declared on the models; the "before" numbers are taken with index
+and bitmap scans disabled for the session, which gives the plans the
+planner had before the indexes existed without dropping anything.
+
+    $ BENCH_DATABASE_URL=postgresql://localhost/fyyur_bench \\
+        python -m benchmarks.index_plans --venues 20000 --artists 50000 --shows 1000000
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+from benchmarks.common import load_app, seed
+
+QUERIES = [
+  ('venue upcoming shows',
+   'SELECT * FROM "Show" WHERE venue_id = :id AND start_time >= now()'),
+  ('artist upcoming shows',
+   'SELECT * FROM "Show" WHERE artist_id = :id AND start_time >= now()'),
+  ('venues by city/state',
+   'SELECT id, name FROM "Venue" WHERE city = :city AND state = :state'),
+  ('venue name search',
+   'SELECT id, name FROM "Venue" WHERE name ILIKE :term'),
+  ('artist name search',
+   'SELECT id, name FROM "Artist" WHERE name ILIKE :term'),
+]
+PARAMS = {'id': 7, 'city': 'San Francisco', 'state': 'CA', 'term': '%musical hop 1%'}
+NO_INDEXES = ('SET enable_indexscan = off; SET enable_bitmapscan = off; '
+              'SET enable_indexonlyscan = off')
+WITH_INDEXES = 'RESET enable_indexscan; RESET enable_bitmapscan; RESET enable_indexonlyscan'
+
+
+def measure(db, sql, repeat):
+  plan = '\n'.join(row[0] for row in db.session.execute(
+    db.text('EXPLAIN (ANALYZE, BUFFERS) ' + sql), PARAMS))
+  timings = []
+  for _ in range(repeat):
+    started = time.perf_counter()
+    db.session.execute(db.text(sql), PARAMS).fetchall()
+    timings.append((time.perf_counter() - started) * 1000)
+  return plan, statistics.median(timings)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--venues', type=int, default=20000)
+  parser.add_argument('--artists', type=int, default=50000)
+  parser.add_argument('--shows', type=int, default=500000)
+  parser.add_argument('--repeat', type=int, default=20)
+  args = parser.parse_args()
+
+  app_module, app = load_app()
+  with app.app_context():
+    db = app_module.db
+    if db.engine.dialect.name != 'postgresql':
+      print('index_plans needs a PostgreSQL BENCH_DATABASE_URL')
+      return 1
+
+    seed(app_module, venues=args.venues, artists=args.artists, shows=args.shows)
+
+    for label, sql in QUERIES:
+      db.session.execute(db.text(NO_INDEXES))
+      before_plan, before_ms = measure(db, sql, args.repeat)
+      db.session.execute(db.text(WITH_INDEXES))
+      after_plan, after_ms = measure(db, sql, args.repeat)
+
+      print('=== {}: {:.2f} ms -> {:.2f} ms (median of {})'.format(
+        label, before_ms, after_ms, args.repeat))
+      print('--- before\n' + before_plan)
+      print('--- after\n' + after_plan + '\n')
+    db.session.rollback()
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,84 @@
+"""Radius queries over many venues: in-memory grid, indexed geocell, full scan.
+
+Venues are scattered uniformly over the continental US (seed() places them
+only by city name). All three methods must return the same venues.
+
+    $ python -m benchmarks.nearby --rows 200000
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from benchmarks.common import load_app, seed
+import geo
+
+QUERIES = [(40.7128, -74.0060, 5), (40.7128, -74.0060, 25), (39.7392, -104.9903, 100),
+           (29.7604, -95.3698, 250)]
+
+
+def median_ms(fn, repeat):
+  timings = []
+  for _ in range(repeat):
+    started = time.perf_counter()
+    result = fn()
+    timings.append((time.perf_counter() - started) * 1000)
+  return statistics.median(timings), result
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--rows', type=int, default=200000)
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  app_module, app = load_app()
+  Venue, db = app_module.Venue, app_module.db
+  limit = app.config['NEARBY_LIMIT']
+
+  with app.app_context():
+    seed(app_module, venues=args.rows, artists=1, shows=0)
+    rng = random.Random(0)
+    points = []
+    for id in range(1, args.rows + 1):
+      latitude, longitude = rng.uniform(25, 49), rng.uniform(-124, -67)
+      points.append({'row_id': id, 'latitude': latitude, 'longitude': longitude,
+                     'geocell': geo.cell(latitude, longitude)})
+    table = Venue.__table__
+    db.session.execute(
+      table.update().where(table.c.id == db.bindparam('row_id'))
+        .values(latitude=db.bindparam('latitude'), longitude=db.bindparam('longitude'),
+                geocell=db.bindparam('geocell')),
+      points)
+    db.session.commit()
+
+    started = time.perf_counter()
+    index = app_module.get_geo_index()
+    print('built grid over {} venues in {:.0f} ms'.format(
+      len(index), (time.perf_counter() - started) * 1000))
+
+    def indexed_cells(latitude, longitude, km):
+      rows = (db.session
+        .query(Venue.id, Venue.latitude, Venue.longitude)
+        .filter(db.or_(*[Venue.geocell.between(first, last)
+                         for first, last in geo.cell_ranges(latitude, longitude, km)])))
+      return geo.nearest(rows, latitude, longitude, km, limit)
+
+    def full_scan(latitude, longitude, km):
+      rows = db.session.query(Venue.id, Venue.latitude, Venue.longitude).filter(Venue.latitude.isnot(None))
+      return geo.nearest(rows, latitude, longitude, km, limit)
+
+    for latitude, longitude, km in QUERIES:
+      memory_ms, expected = median_ms(lambda: index.within(latitude, longitude, km, limit), args.repeat)
+      cells_ms, cells = median_ms(lambda: indexed_cells(latitude, longitude, km), args.repeat)
+      scan_ms, scanned = median_ms(lambda: full_scan(latitude, longitude, km), args.repeat)
+      assert expected == cells == scanned, (latitude, longitude, km)
+      print('{:>8.3f},{:>9.3f} {:>4} km: {:4d} hits  memory {:8.2f} ms  geocell {:8.2f} ms  '
+            'scan {:8.2f} ms'.format(latitude, longitude, km, len(expected), memory_ms, cells_ms, scan_ms))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,81 @@
+"""Page latency with and without QUERY_POOL_WORKERS under simulated DB latency.
+
+Every statement is delayed by ``--latency`` milliseconds, standing in for
+the network round trip to a remote database. Each page is requested without
+validators (a first visit), so the conditional GET validator and the page
+query both run; with the query pool they overlap.
+
+    $ python -m benchmarks.query_latency --latency 5 --workers 4
+
+Without ``BENCH_DATABASE_URL`` a temporary SQLite file is used: an
+in-memory database has a single connection that the pool threads would
+have to share.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+from benchmarks.common import load_app, seed
+
+PAGES = ['/venues/{}', '/artists/{}', '/shows/{}', '/venues', '/artists', '/shows']
+
+
+def median_ms(client, url, requests):
+  timings = []
+  for _ in range(requests):
+    started = time.perf_counter()
+    response = client.get(url)
+    response.get_data()
+    timings.append((time.perf_counter() - started) * 1000)
+    assert response.status_code == 200, (url, response.status_code)
+  return statistics.median(timings)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--latency', type=float, default=5.0, help='milliseconds added per statement')
+  parser.add_argument('--workers', type=int, default=4)
+  parser.add_argument('--requests', type=int, default=20)
+  args = parser.parse_args()
+
+  if 'BENCH_DATABASE_URL' not in os.environ:
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['BENCH_DATABASE_URL'] = 'sqlite:///' + path
+
+  import config
+  config.PAGE_CACHE_BACKEND = 'none'
+  config.QUERY_POOL_WORKERS = 0
+  app_module, sequential = load_app()
+  config.QUERY_POOL_WORKERS = args.workers
+  pooled = app_module.create_app(config)
+
+  with sequential.app_context():
+    seed(app_module, venues=200, artists=200, shows=2000)
+    engine = app_module.db.engine
+  with pooled.app_context():
+    pooled_engine = app_module.db.engine
+
+  def delay(conn, cursor, statement, parameters, context, executemany):
+    time.sleep(args.latency / 1000)
+
+  for e in (engine, pooled_engine):
+    event.listen(e, 'before_cursor_execute', delay)
+
+  print('{:<14} {:>12} {:>12} {:>8}'.format('page', 'sequential', 'pooled', 'change'))
+  for page in PAGES:
+    url = page.format(1)
+    before = median_ms(sequential.test_client(), url, args.requests)
+    after = median_ms(pooled.test_client(), url, args.requests)
+    print('{:<14} {:>9.2f} ms {:>9.2f} ms {:>+7.1f}%'.format(
+      url, before, after, (after - before) / before * 100))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,105 @@
+"""Scoring every seeking artist against every seeking venue, and rescoring one.
+
+Profiles are synthetic and never touch the database: one to three genres
+each, in a random gazetteer city (a few with an unknown one). Every
+--check'th artist's and venue's list is compared with a dense top-k of its
+full row or column of scores; the script fails on any difference. Needs
+NumPy.
+
+    $ python -m benchmarks.recommendations --artists 100000 --venues 10000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import config
+import geo
+import recommendations
+from genres import GENRES, encode_genres
+
+# Nearness is worked out in float32 from dot products of about SHARPNESS,
+# so the same pair can score this differently in a batch and on its own.
+TOLERANCE = 1e-3
+
+
+def profiles(rng, count, places, first_id=1):
+  rows = []
+  for id in range(first_id, first_id + count):
+    genres = encode_genres(rng.sample(GENRES, rng.randint(1, 3)))
+    if rng.random() < 0.05:
+      rows.append((id, genres, None, None, rng.choice(['', 'ZZ', places[0][0][1]])))
+    else:
+      (city, state), (latitude, longitude) = rng.choice(places)
+      rows.append((id, genres, latitude, longitude, state.upper()))
+  return rows
+
+
+def check(matchmaker, kind, ids, other_count):
+  np = recommendations.np
+  everyone = np.arange(other_count)
+  for id in ids:
+    if id not in (matchmaker.artists if kind == 'artist' else matchmaker.venues).rows:
+      continue
+    if kind == 'artist':
+      row = matchmaker.artists.rows[id]
+      scores = matchmaker.scores(np.array([row]), everyone)[0]
+    else:
+      row = matchmaker.venues.rows[id]
+      scores = matchmaker.scores(everyone, np.array([row]))[:, 0]
+    expected = np.sort(scores[scores > 0])[::-1][:matchmaker.top_k]
+    found = np.array([score for _, score in matchmaker.suggestions(kind, id)], dtype=np.float32)
+    if len(found) != len(expected) or not np.allclose(found, expected, rtol=0, atol=TOLERANCE):
+      print('{} {}: expected {} got {}'.format(kind, id, expected, found))
+      return False
+  return True
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--artists', type=int, default=100000)
+  parser.add_argument('--venues', type=int, default=10000)
+  parser.add_argument('--updates', type=int, default=20)
+  parser.add_argument('--check', type=int, default=97, help='check every n-th list')
+  parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+  args = parser.parse_args()
+  if not recommendations.available():
+    print('NumPy is not installed')
+    return 1
+
+  rng = random.Random(0)
+  places = [((city, state), point) for (city, state), point in
+            geo.load_gazetteer(config.GAZETTEER_PATH).items()]
+  artists = profiles(rng, args.artists, places)
+  venues = profiles(rng, args.venues, places)
+
+  matchmaker = recommendations.Matchmaker()
+  started = time.perf_counter()
+  matchmaker.build(artists, venues, workers=args.workers)
+  elapsed = time.perf_counter() - started
+  print('{} x {} pairs scored in {:.2f} s on {} threads ({:.1f} M pairs/s)'.format(
+    args.artists, args.venues, elapsed, args.workers, args.artists * args.venues / elapsed / 1e6))
+
+  timings = {'artist': [], 'venue': []}
+  for update in range(args.updates):
+    for kind, count in (('artist', args.artists), ('venue', args.venues)):
+      id = rng.randint(1, count)
+      # Every fifth one stops seeking.
+      profile = None if update % 5 == 4 else profiles(rng, 1, places, id)[0][1:]
+      started = time.perf_counter()
+      matchmaker.update(kind, id, profile)
+      timings[kind].append((time.perf_counter() - started) * 1000)
+  for kind, values in timings.items():
+    print('{} update: median {:.1f} ms, max {:.1f} ms'.format(kind, statistics.median(values), max(values)))
+
+  ok = (check(matchmaker, 'artist', range(1, args.artists + 1, args.check), len(matchmaker.venues.ids)) and
+        check(matchmaker, 'venue', range(1, args.venues + 1, args.check), len(matchmaker.artists.ids)))
+  print('lists match dense top-k' if ok else 'lists differ from dense top-k')
+  return 0 if ok else 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,243 @@
+"""Drive every route through the Flask test client on a synthetic dataset.
+
+Records latency percentiles and SQL statement counts per route and writes
+them to a JSON file. Pass an earlier file as ``--baseline`` to print the
+change per route.
+
+    $ python -m benchmarks.routes --venues 10000 --artists 50000 --shows 1000000 \\
+        --output bench-$(git rev-parse --short HEAD).json --baseline bench-main.json
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+import assets
+import config
+import geo
+import thumbnails
+from benchmarks.common import CITIES, count_statements, load_app, seed
+from benchmarks.thumbnails import generated_jpeg, origin_server
+
+SEARCH_TERMS = ['hop', 'music', 'sax band', 'a', 'petals 1']
+COMPLETE_TERMS = ['t', 'the', 'pia', 'hop mu', 'blue room 4']
+NEARBY_KM = [5, 25, 100, 250]
+# Artists given an image_link on the local origin server; they share the
+# image, so /img is fetched and resized once and then served from the cache.
+IMAGE_ARTISTS = 20
+
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def venue_form(rng, i):
+  return {'name': 'Bench Venue {}'.format(i), 'city': 'San Francisco', 'state': 'CA',
+          'address': '1 Bench Street', 'phone': '555-000-0000', 'genres': ['Jazz', 'Swing'],
+          'facebook_link': 'https://www.facebook.com/bench', 'website': 'https://bench.example.com',
+          'seeking_description': ''}
+
+
+def artist_form(rng, i):
+  return {'name': 'Bench Artist {}'.format(i), 'city': 'San Francisco', 'state': 'CA',
+          'phone': '555-000-0000', 'genres': ['Jazz'],
+          'facebook_link': 'https://www.facebook.com/bench', 'website': 'https://bench.example.com',
+          'seeking_description': ''}
+
+
+def scenarios(sizes, asset_url, image_link):
+  """Map each endpoint to ``(method, url(rng, i), form data(rng, i) or None)``.
+
+  Read-only routes come first. The write routes run afterwards, and the
+  deletes remove the highest ids so that earlier requests never miss.
+  A second scenario for an endpoint is named ``endpoint:variant``.
+  ``asset_url`` is the fingerprinted URL of a built bundle, and
+  ``image_link`` the image of the first IMAGE_ARTISTS artists.
+  """
+  venues, artists, shows = sizes
+  venue = lambda rng: rng.randint(1, venues // 2)
+  artist = lambda rng: rng.randint(1, artists // 2)
+  term = lambda rng: {'search_term': rng.choice(SEARCH_TERMS)}
+  complete = lambda rng: quote(rng.choice(COMPLETE_TERMS))
+  gazetteer = geo.load_gazetteer(config.GAZETTEER_PATH)
+  places = [gazetteer[geo.place_key(city, state)] for city, state in CITIES]
+  def nearby(rng):
+    latitude, longitude = rng.choice(places)
+    return '/venues/nearby?lat={:.4f}&lon={:.4f}&km={}'.format(
+      latitude + rng.uniform(-0.02, 0.02), longitude + rng.uniform(-0.02, 0.02), rng.choice(NEARBY_KM))
+
+  return {
+    'index': ('GET', lambda rng, i: '/', None),
+    'venues': ('GET', lambda rng, i: '/venues', None),
+    'nearby_venues': ('GET', lambda rng, i: nearby(rng), None),
+    'search_venues': ('POST', lambda rng, i: '/venues/search', lambda rng, i: term(rng)),
+    'show_venue': ('GET', lambda rng, i: '/venues/{}'.format(venue(rng)), None),
+    'venue_suggestions': ('GET', lambda rng, i: '/venues/{}/suggestions'.format(venue(rng)), None),
+    'create_venue_form': ('GET', lambda rng, i: '/venues/create', None),
+    'edit_venue': ('GET', lambda rng, i: '/venues/{}/edit'.format(venue(rng)), None),
+    'artists': ('GET', lambda rng, i: '/artists', None),
+    'search_artists': ('POST', lambda rng, i: '/artists/search', lambda rng, i: term(rng)),
+    'show_artist': ('GET', lambda rng, i: '/artists/{}'.format(artist(rng)), None),
+    'artist_suggestions': ('GET', lambda rng, i: '/artists/{}/suggestions'.format(artist(rng)), None),
+    'create_artist_form': ('GET', lambda rng, i: '/artists/create', None),
+    'edit_artist': ('GET', lambda rng, i: '/artists/{}/edit'.format(artist(rng)), None),
+    'shows': ('GET', lambda rng, i: '/shows', None),
+    'create_shows': ('GET', lambda rng, i: '/shows/create', None),
+    'search_shows': ('POST', lambda rng, i: '/shows/search', lambda rng, i: term(rng)),
+    'show_show': ('GET', lambda rng, i: '/shows/{}'.format(rng.randint(1, shows)), None),
+    'api_venues': ('GET', lambda rng, i: '/api/venues?limit=1000', None),
+    'api_artists': ('GET', lambda rng, i: '/api/artists?limit=1000', None),
+    'api_shows': ('GET', lambda rng, i: '/api/shows?limit=1000', None),
+    'autocomplete': ('GET', lambda rng, i: '/autocomplete?kind=venue&q={}'.format(complete(rng)), None),
+    'autocomplete:artist': ('GET', lambda rng, i: '/autocomplete?kind=artist&q={}'.format(complete(rng)), None),
+    'static': ('GET', lambda rng, i: '/static/css/main.css', None),
+    'assets': ('GET', lambda rng, i: asset_url, None),
+    'image': ('GET', lambda rng, i: '/img/artist/{}/tile?v={}'.format(
+      rng.randint(1, IMAGE_ARTISTS), thumbnails.link_digest(image_link)), None),
+    'create_venue_submission': ('POST', lambda rng, i: '/venues/create', venue_form),
+    'create_artist_submission': ('POST', lambda rng, i: '/artists/create', artist_form),
+    'create_show_submission': ('POST', lambda rng, i: '/shows/create', lambda rng, i: {
+      'venue_id': venue(rng), 'artist_id': artist(rng), 'start_time': '2030-01-01 20:00:00'}),
+    'edit_venue_submission': ('POST', lambda rng, i: '/venues/{}/edit'.format(venue(rng)), venue_form),
+    'edit_artist_submission': ('POST', lambda rng, i: '/artists/{}/edit'.format(artist(rng)), artist_form),
+    'delete_venue': ('DELETE', lambda rng, i: '/venues/{}'.format(venues - i), None),
+    'delete_artist': ('DELETE', lambda rng, i: '/artists/{}'.format(artists - i), None),
+  }
+
+
+def run_route(client, engine, method, url, data, requests, rng):
+  latencies, statements, statuses = [], [], {}
+  for i in range(requests):
+    with count_statements(engine) as executed:
+      started = time.perf_counter()
+      response = client.open(url(rng, i), method=method, data=data(rng, i) if data else None)
+      response.get_data()
+      latencies.append((time.perf_counter() - started) * 1000)
+    statements.append(len(executed))
+    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    response.close()
+
+  return {
+    'requests': requests,
+    'status': statuses,
+    'p50_ms': round(percentile(latencies, 0.50), 3),
+    'p90_ms': round(percentile(latencies, 0.90), 3),
+    'p99_ms': round(percentile(latencies, 0.99), 3),
+    'max_ms': round(max(latencies), 3),
+    'mean_ms': round(statistics.mean(latencies), 3),
+    'statements_mean': round(statistics.mean(statements), 2),
+    'statements_max': max(statements),
+  }
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def compare(results, baseline_path):
+  with open(baseline_path) as f:
+    baseline = json.load(f)['routes']
+  print('\n{:<26} {:>10} {:>10} {:>8} {:>10}'.format('route', 'p50 base', 'p50 now', 'change', 'stmts'))
+  for name, now in results.items():
+    before = baseline.get(name)
+    if before is None:
+      continue
+    change = (now['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+    print('{:<26} {:>10.2f} {:>10.2f} {:>+7.1f}% {:>4g} -> {:<4g}'.format(
+      name, before['p50_ms'], now['p50_ms'], change,
+      before['statements_max'], now['statements_max']))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--venues', type=int, default=1000)
+  parser.add_argument('--artists', type=int, default=5000)
+  parser.add_argument('--shows', type=int, default=20000)
+  parser.add_argument('--requests', type=int, default=50, help='requests per route')
+  parser.add_argument('--route', action='append', help='only run these endpoints')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output', default='bench_routes.json')
+  parser.add_argument('--baseline', help='earlier output file to compare against')
+  args = parser.parse_args()
+
+  # /static/dist is only served once built, as after a deploy.
+  assets.build(os.path.join(os.path.dirname(os.path.abspath(assets.__file__)), 'static'))
+  # Images come from a local server into a fresh cache. Without Pillow, /img
+  # redirects to the link and the server is never asked.
+  try:
+    body = generated_jpeg(1200)
+  except ImportError:
+    body = b''
+  server, _ = origin_server(body)
+  image_link = 'http://127.0.0.1:{}/image.jpg'.format(server.server_port)
+  config.IMAGE_CACHE_DIR = tempfile.mkdtemp()
+  config.IMAGE_FETCH_PRIVATE_ADDRESSES = True
+  app_module, app = load_app()
+  with app.test_request_context():
+    asset_url = assets.static_urls('main.js')[0]
+
+  started = time.perf_counter()
+  with app.app_context():
+    seed(app_module, venues=args.venues, artists=args.artists, shows=args.shows, seed=args.seed)
+    # Venues are placed at their city's centre, as `flask venues geocode` does.
+    Venue = app_module.Venue
+    gazetteer = geo.load_gazetteer(config.GAZETTEER_PATH)
+    for city, state in CITIES:
+      app_module.db.session.execute(Venue.__table__.update()
+        .where(Venue.city == city, Venue.state == state)
+        .values(**geo.location_columns(gazetteer, city, state)))
+    Artist = app_module.Artist
+    app_module.db.session.execute(
+      Artist.__table__.update().where(Artist.id <= IMAGE_ARTISTS).values(image_link=image_link))
+    app_module.db.session.commit()
+    engine = app_module.db.engine
+  print('seeded {} venues, {} artists, {} shows in {:.1f}s'.format(
+    args.venues, args.artists, args.shows, time.perf_counter() - started))
+
+  routes = scenarios((args.venues, args.artists, args.shows), asset_url, image_link)
+  missing = ({endpoint.rpartition('.')[2] for endpoint in app.view_functions}
+             - {name.partition(':')[0] for name in routes})
+  if missing:
+    print('warning: no benchmark scenario for ' + ', '.join(sorted(missing)))
+
+  client = app.test_client()
+  results = {}
+  for name, (method, url, data) in routes.items():
+    if args.route and name not in args.route:
+      continue
+    rng = random.Random('{}:{}'.format(args.seed, name))
+    results[name] = run_route(client, engine, method, url, data, args.requests, rng)
+    result = results[name]
+    print('{:<26} p50 {:8.2f} ms  p99 {:8.2f} ms  statements {:>4g} (max {})'.format(
+      name, result['p50_ms'], result['p99_ms'], result['statements_mean'], result['statements_max']))
+
+  with open(args.output, 'w') as f:
+    json.dump({
+      'commit': git_commit(),
+      'created': datetime.now().isoformat(timespec='seconds'),
+      'database': engine.dialect.name,
+      'dataset': {'venues': args.venues, 'artists': args.artists, 'shows': args.shows},
+      'requests_per_route': args.requests,
+      'routes': results,
+    }, f, indent=2, sort_keys=True)
+  print('wrote ' + args.output)
+
+  if args.baseline:
+    compare(results, args.baseline)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
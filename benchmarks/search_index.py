@@ -0,0 +1,80 @@
+"""Compare the in-memory trigram index with ``ILIKE '%term%'``.
+
+Also times /autocomplete's prefix completion, which fails the run if any
+term takes over ``COMPLETE_BUDGET_MS``.
+
+    $ python -m benchmarks.search_index --rows 100000
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+from benchmarks.common import load_app, seed
+from search import NgramIndex
+
+TERMS = ['hop', 'Music', 'sax band', 'petals 12', 'a', 'zzz']
+COMPLETE_TERMS = ['t', 'the', 'pia', 'hop mu', 'blue room 4', 'zzz']
+COMPLETE_BUDGET_MS = 1.0
+
+
+def median_ms(fn, repeat):
+  timings = []
+  for _ in range(repeat):
+    started = time.perf_counter()
+    result = fn()
+    timings.append((time.perf_counter() - started) * 1000)
+  return statistics.median(timings), result
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--rows', type=int, default=100000)
+  parser.add_argument('--repeat', type=int, default=10)
+  args = parser.parse_args()
+
+  app_module, app = load_app()
+  Venue, db = app_module.Venue, app_module.db
+
+  with app.app_context():
+    seed(app_module, venues=args.rows, artists=1, shows=0)
+    rows = db.session.query(Venue.id, Venue.name).all()
+
+    started = time.perf_counter()
+    index = NgramIndex()
+    index.load(rows)
+    print('built index over {} names in {:.0f} ms'.format(
+      len(index), (time.perf_counter() - started) * 1000))
+
+    for term in TERMS:
+      ilike_ms, ilike_rows = median_ms(lambda: db.session
+        .query(Venue.id, Venue.name)
+        .filter(Venue.name.ilike('%{}%'.format(term)))
+        .all(), args.repeat)
+
+      def indexed():
+        ids = index.search(term)
+        return (db.session
+          .query(Venue.id, Venue.name)
+          .filter(Venue.id.in_(ids[:100]))
+          .all()), ids
+
+      index_ms, (page, ids) = median_ms(indexed, args.repeat)
+      search_ms, _ = median_ms(lambda: index.search(term), args.repeat)
+
+      assert sorted(ids) == sorted(row.id for row in ilike_rows), term
+      print('{!r:>12}: {:6d} hits  ilike {:8.2f} ms  index {:8.2f} ms '
+            '(+ hydrate first 100: {:8.2f} ms)'.format(
+              term, len(ids), ilike_ms, search_ms, index_ms))
+
+    slow = 0
+    for term in COMPLETE_TERMS:
+      complete_ms, matches = median_ms(lambda: index.complete(term), args.repeat)
+      slow += complete_ms > COMPLETE_BUDGET_MS
+      print('{!r:>12}: {:6d} completions  {:8.3f} ms'.format(term, len(matches), complete_ms))
+  return 1 if slow else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,105 @@
+"""Image bytes and latency of a /shows page, originals vs /img thumbnails.
+
+A local HTTP server stands in for the image hosts: every artist's
+image_link points at it, and it serves one large generated JPEG. The page's
+<img> URLs are requested cold (fetch, resize, store) and again warm, and
+the script fails if any original is fetched more than once. Needs Pillow.
+
+    $ python -m benchmarks.thumbnails --width 3000
+"""
+
+import argparse
+import io
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.common import load_app, seed
+
+
+def origin_server(body):
+  fetched = Counter()
+
+  class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+      fetched[self.path] += 1
+      self.send_response(200)
+      self.send_header('Content-Type', 'image/jpeg')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def log_message(self, *args):
+      pass
+
+  server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server, fetched
+
+
+def generated_jpeg(width):
+  from PIL import Image
+
+  image = Image.effect_mandelbrot((width, width * 3 // 4), (-2.0, -1.0, 1.0, 1.0), 100).convert('RGB')
+  output = io.BytesIO()
+  image.save(output, 'JPEG', quality=90)
+  return output.getvalue()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--width', type=int, default=3000, help='width of the original image')
+  parser.add_argument('--limit', type=int, default=60, help='shows per page')
+  args = parser.parse_args()
+
+  import config
+  config.IMAGE_CACHE_DIR = tempfile.mkdtemp()
+  # The origin server is on 127.0.0.1.
+  config.IMAGE_FETCH_PRIVATE_ADDRESSES = True
+  config.PAGE_CACHE_BACKEND = 'none'
+  body = generated_jpeg(args.width)
+  server, fetched = origin_server(body)
+  app_module, app = load_app()
+  if app.extensions['thumbnails'] is None:
+    print('Pillow is not installed')
+    return 1
+
+  with app.app_context():
+    seed(app_module, venues=50, artists=50, shows=500)
+    db, Artist = app_module.db, app_module.Artist
+    for artist in db.session.query(Artist):
+      artist.image_link = 'http://127.0.0.1:{}/artist-{}.jpg'.format(server.server_port, artist.id)
+    db.session.commit()
+
+  client = app.test_client()
+  page = client.get('/shows?limit={}'.format(args.limit)).get_data(as_text=True)
+  urls = re.findall(r'<img src="([^"]+)"', page)
+  urls = [url.replace('&amp;', '&') for url in urls if url.startswith('/img/')]
+  unique = sorted(set(urls))
+
+  headers = {'Accept': 'image/webp,*/*'}
+  results = {}
+  for label in ('cold', 'warm'):
+    started = time.perf_counter()
+    sizes = [len(client.get(url, headers=headers).data) for url in urls]
+    results[label] = (time.perf_counter() - started) * 1000, sum(sizes)
+
+  print('{} images ({} distinct) on /shows?limit={}'.format(len(urls), len(unique), args.limit))
+  print('originals   {:>10.1f} KB'.format(len(body) * len(urls) / 1024))
+  for label, (ms, total) in results.items():
+    print('/img {:<6} {:>10.1f} KB {:>9.1f} ms'.format(label, total / 1024, ms))
+  server.shutdown()
+
+  refetched = {path: count for path, count in fetched.items() if count > 1}
+  if refetched:
+    print('originals fetched more than once: {}'.format(refetched))
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,35 @@
+"""Guard against the N+1 query pattern coming back to ``/venues``.
+
+Seeds a dataset, requests the page and fails if the route issues more SQL
+statements than ``MAX_STATEMENTS``, regardless of how many venues exist.
+"""
+
+import sys
+
+from benchmarks.common import count_statements, load_app, seed
+
+# The conditional GET validator, then the page query.
+MAX_STATEMENTS = 2
+
+
+def main():
+  app_module, app = load_app()
+
+  with app.app_context():
+    seed(app_module, venues=2000, artists=200, shows=5000)
+    engine = app_module.db.engine
+
+  client = app.test_client()
+  with count_statements(engine) as statements:
+    response = client.get('/venues')
+
+  print('GET /venues -> {} in {} statement(s)'.format(response.status_code, len(statements)))
+  if response.status_code != 200 or len(statements) > MAX_STATEMENTS:
+    for statement in statements[:5]:
+      print('  ' + ' '.join(statement.split()))
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,70 @@
+"""Double-booking detection over show intervals.
+
+A show occupies ``[start_time, end_time)`` at its venue and for its artist,
+and neither may be in two shows at once. On PostgreSQL two exclusion
+constraints on each month partition of ``Show`` enforce this within the
+month; app.booking_conflict() runs the same check across the whole table as
+an indexed range query, so the form can name the show in the way, and
+the importer checks each batch with booking_rejections(). Both hold row
+locks on the venues and artists involved (app.lock_bookings()) from the
+check to the commit, which keeps concurrent bookings across a month
+boundary apart.
+"""
+
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+
+def find_overlaps(intervals):
+  """Yield ``(key, earlier_id, later_id)`` for each interval that overlaps another.
+
+  ``intervals`` are ``(key, start, end, id)`` tuples sorted by key, then
+  start -- e.g. rows of ``ORDER BY venue_id, start_time``. In one pass, every
+  interval is compared with the furthest-reaching earlier interval of the
+  same key: it overlaps some earlier interval exactly when it overlaps that
+  one. Each conflicting interval is reported once.
+  """
+  key = reach_end = reach_id = None
+  for interval_key, start, end, id in intervals:
+    if interval_key != key:
+      key, reach_end, reach_id = interval_key, end, id
+      continue
+    if start < reach_end:
+      yield key, reach_id, id
+    if end > reach_end:
+      reach_end, reach_id = end, id
+
+
+def booking_rejections(new, existing, max_duration):
+  """Which ``new`` intervals can't be booked, and what is in the way of each.
+
+  Both are sequences of ``(venue_id, artist_id, start, end)``; ``existing``
+  must hold every stored show that could overlap a new one, and no interval
+  may last longer than ``max_duration``. New intervals are booked in order,
+  as if submitted one by one: one is rejected when it overlaps, at its venue
+  or for its artist, a stored interval or an earlier new one that was
+  booked. Returns ``{index in new: (key, 'existing' or 'new', index)}``,
+  ``key`` being ``('venue', venue_id)`` or ``('artist', artist_id)``.
+  """
+  booked = defaultdict(list)
+
+  def book(venue_id, artist_id, start, end, source, index):
+    for key in (('venue', venue_id), ('artist', artist_id)):
+      insort(booked[key], (start, end, source, index))
+
+  for index, (venue_id, artist_id, start, end) in enumerate(existing):
+    book(venue_id, artist_id, start, end, 'existing', index)
+
+  rejected = {}
+  for index, (venue_id, artist_id, start, end) in enumerate(new):
+    for key in (('venue', venue_id), ('artist', artist_id)):
+      intervals = booked[key]
+      # Only intervals starting after start - max_duration can reach it.
+      blocker = next((interval for interval in intervals[bisect_left(intervals, (start - max_duration,)):]
+                      if interval[0] >= end or interval[1] > start), None)
+      if blocker is not None and blocker[0] < end:
+        rejected[index] = (key, blocker[2], blocker[3])
+        break
+    else:
+      book(venue_id, artist_id, start, end, 'new', index)
+  return rejected
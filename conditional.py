@@ -0,0 +1,95 @@
+"""Conditional GET (ETag / Last-Modified) for pages built from the database.
+
+A view wrapped in ``@conditional(validator)`` first calls
+``validator(**view_args)``. It returns a small tuple that changes whenever
+the page would -- ``updated_at`` columns, row counts, the start time of the
+latest show to have begun -- or None to skip the check. A request whose
+``If-None-Match`` (or, failing that, ``If-Modified-Since``) matches gets a
+304 without the view running. Other responses carry the validators and
+``Cache-Control: no-cache``, so browsers revalidate on every visit.
+A request without validators can't be answered early, so its validator
+query runs through parallel.submit() alongside the view instead of
+before it. The two reads then have no order: a write committed between
+them could leave a new tag on an old page, which would be revalidated as
+current until the next change. Such a response is sent without
+validators whenever a timestamp in the validator is within
+``CONCURRENT_MARGIN`` of the request's start.
+
+Last-Modified is only sent when every part of the validator is a time;
+a count can change without any timestamp moving (a delete). Datetimes are
+naive local time, like the rest of the app. ``RELEASE_ID`` is mixed into
+the ETag so a deploy with new templates doesn't match old tags.
+"""
+
+import functools
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, make_response, request, session
+
+import parallel
+
+CONCURRENT_MARGIN = timedelta(seconds=1)
+
+
+def entity_tag(values):
+  token = repr((current_app.config.get('RELEASE_ID'), tuple(values)))
+  return hashlib.sha1(token.encode('utf-8')).hexdigest()
+
+
+def last_modified(values):
+  """Latest of ``values`` as an aware UTC datetime, or None if not all are times."""
+  times = [value for value in values if value is not None]
+  if not times or not all(isinstance(value, datetime) for value in times):
+    return None
+  return max(times).astimezone(timezone.utc).replace(microsecond=0)
+
+
+def changed_since(values, since):
+  return any(isinstance(value, datetime) and value >= since for value in values)
+
+
+def not_modified(etag, modified):
+  if request.if_none_match:
+    return request.if_none_match.contains_weak(etag)
+  since = request.if_modified_since
+  return modified is not None and since is not None and modified <= since
+
+
+def conditional(validator):
+  """Decorate a view so it answers 304 when ``validator`` is unchanged."""
+  def decorate(view):
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+      # Pending flash messages are rendered into the page; such a response
+      # must be sent in full.
+      if '_flashes' in session:
+        return view(**kwargs)
+
+      if not (request.if_none_match or request.if_modified_since):
+        started = datetime.now()
+        pending = parallel.submit(validator, **kwargs)
+        response = make_response(view(**kwargs))
+        values = pending.result()
+        if values is None or response.status_code != 200 \
+            or changed_since(values, started - CONCURRENT_MARGIN):
+          return response
+        etag, modified = entity_tag(values), last_modified(values)
+      else:
+        values = validator(**kwargs)
+        if values is None:
+          return view(**kwargs)
+        etag, modified = entity_tag(values), last_modified(values)
+        if not_modified(etag, modified):
+          response = current_app.response_class(status=304)
+        else:
+          response = make_response(view(**kwargs))
+          if response.status_code != 200:
+            return response
+      response.set_etag(etag, weak=True)
+      if modified is not None:
+        response.last_modified = modified
+      response.cache_control.no_cache = True
+      return response
+    return wrapper
+  return decorate
@@ -17,4 +17,108 @@ DB = cfg.postgressql['db']
 
 # TODO IMPLEMENT DATABASE URL
 SQLALCHEMY_DATABASE_URI = f'postgresql://{USER}:{PASSWD}@{HOST}:{PORT}/{DB}'
-SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Connection pool, per worker process. pool_size + max_overflow times the
+# number of workers must stay below the server's max_connections.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+# Seconds to wait for a free connection before failing the request.
+DB_POOL_TIMEOUT = 10
+# Replace connections older than this many seconds, ahead of any server or
+# firewall idle timeout.
+DB_POOL_RECYCLE = 1800
+# Test each connection on checkout so a restarted server costs one retry
+# instead of a 500.
+DB_POOL_PRE_PING = True
+# Set on every new connection. A runaway query or a transaction left open
+# by a crashed request is cut off instead of holding locks.
+DB_STATEMENT_TIMEOUT_MS = 5000
+DB_IDLE_IN_TRANSACTION_TIMEOUT_MS = 10000
+# Set when connecting through PgBouncer (transaction pooling) or another
+# external pooler: the app then keeps no pool of its own (NullPool) and the
+# timeouts above must be set on the database role instead.
+DB_EXTERNAL_POOLER = os.environ.get('DB_EXTERNAL_POOLER') == '1'
+
+# Threads per worker process for reads that run alongside the request's
+# own queries (see parallel.py); 0 runs them inline. Each busy thread holds
+# a connection, so DB_POOL_SIZE should cover the request threads plus these.
+QUERY_POOL_WORKERS = int(os.environ.get('QUERY_POOL_WORKERS', 0))
+
+# Optional read replica (streaming standby). GET/HEAD requests read from it
+# unless it is more than REPLICA_MAX_LAG_SECONDS behind (checked at most
+# every REPLICA_LAG_CHECK_SECONDS) or the client wrote within the last
+# REPLICA_STICKY_SECONDS.
+SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
+REPLICA_MAX_LAG_SECONDS = 5
+REPLICA_LAG_CHECK_SECONDS = 5
+REPLICA_STICKY_SECONDS = 10
+
+# Rendered-page cache for the venue and artist pages: 'memory' (per worker
+# process), 'redis' (shared, needs PAGE_CACHE_URL) or 'none'.
+PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+PAGE_CACHE_URL = os.environ.get('PAGE_CACHE_URL')
+PAGE_CACHE_MAX_ENTRIES = 2048
+PAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Upper bound on an entry's life in seconds; bounds staleness across workers.
+PAGE_CACHE_TIMEOUT = 300
+
+# Per-request SQL/template timing: Server-Timing header, a structured log
+# line per request and a warning when one statement shape repeats more than
+# INSTRUMENTATION_N_PLUS_ONE times in a request.
+INSTRUMENTATION = os.environ.get('INSTRUMENTATION') == '1'
+INSTRUMENTATION_N_PLUS_ONE = 10
+
+# Identifies the deployed code. It is mixed into page ETags, so set it to
+# something new (e.g. the commit hash) on every release that changes
+# templates.
+RELEASE_ID = os.environ.get('RELEASE_ID', '')
+
+# Length of a show listed without one, and the longest allowed. The
+# double-booking check scans back SHOW_MAX_DURATION_MINUTES from a new
+# show's start, so keep it tight.
+SHOW_DURATION_MINUTES = 120
+SHOW_MAX_DURATION_MINUTES = 12 * 60
+
+# On PostgreSQL, Show is partitioned by month of start_time. `flask shows
+# partitions` (run it daily) keeps this many months created ahead.
+SHOW_PARTITION_MONTHS_AHEAD = 12
+
+# Resized venue/artist images (/img/...), cached on disk. Needs Pillow;
+# without it pages link to the original image_link.
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join(basedir, 'image_cache'))
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+IMAGE_FETCH_TIMEOUT = 5
+IMAGE_MAX_ORIGINAL_BYTES = 20 * 1024 * 1024
+IMAGE_MAX_AGE = 365 * 24 * 60 * 60
+# Hosts image links may be fetched from ('.example.com' also matches its
+# subdomains); empty allows any host with a public address.
+IMAGE_ALLOWED_HOSTS = [host for host in os.environ.get('IMAGE_ALLOWED_HOSTS', '').split(',') if host]
+# Lets links reach loopback and private addresses: only for local image
+# servers in development and benchmarks, never in production.
+IMAGE_FETCH_PRIVATE_ADDRESSES = False
+
+# Venue locations (see geo.py): the (city, state) -> centre gazetteer, and
+# /venues/nearby's default radius, largest radius and most results.
+# NEARBY_INDEX is 'memory' (a grid in each worker) or 'database' (the
+# indexed Venue.geocell column, always current across workers).
+GAZETTEER_PATH = os.path.join(basedir, 'data', 'gazetteer.csv')
+NEARBY_DEFAULT_KM = 25
+NEARBY_MAX_KM = 250
+NEARBY_LIMIT = 100
+NEARBY_INDEX = os.environ.get('NEARBY_INDEX', 'memory')
+
+# Suggested artists on venue pages and venues on artist pages (see
+# recommendations.py; needs NumPy). Each worker scores every pair on first
+# use, on this many threads.
+RECOMMENDATION_WORKERS = int(os.environ.get('RECOMMENDATION_WORKERS', os.cpu_count() or 1))
+
+# Deleting a venue or artist with more than PURGE_MIN_SHOWS shows only
+# hides it; `flask purge` (run it every minute) then removes its shows
+# PURGE_BATCH_SIZE per transaction, and the row. 0 always deletes at once.
+PURGE_MIN_SHOWS = int(os.environ.get('PURGE_MIN_SHOWS', 0))
+PURGE_BATCH_SIZE = 1000
+
+# Name searches bind at most this many matching venue or artist ids into a
+# query; a term matching more is matched with ILIKE in SQL instead.
+SEARCH_MAX_BOUND_IDS = 1000
@@ -56,3 +56,12 @@ def deploy():
 
 def rollback():
     local("heroku rollback")
+
+# benchmarks
+
+
+def bench(baseline=None):
+    command = "python -m benchmarks.routes --output bench-$(git rev-parse --short HEAD).json"
+    if baseline:
+        command += " --baseline {}".format(baseline)
+    local(command)
@@ -0,0 +1,63 @@
+"""Genres as a fixed enumerated set stored in an integer bitmask.
+
+Each genre owns one bit of ``Venue.genre_mask`` / ``Artist.genre_mask``.
+A genre's position in ``GENRES`` is its bit number, so this tuple is part of
+the database format: only ever append to it.
+"""
+
+from sqlalchemy import and_, literal_column, or_
+
+GENRES = (
+  'Alternative',
+  'Blues',
+  'Classical',
+  'Country',
+  'Electronic',
+  'Folk',
+  'Funk',
+  'Hip-Hop',
+  'Heavy Metal',
+  'Instrumental',
+  'Jazz',
+  'Musical Theatre',
+  'Pop',
+  'Punk',
+  'R&B',
+  'Reggae',
+  'Rock n Roll',
+  'Soul',
+  'Other',
+  'Swing',
+)
+
+GENRE_BITS = {genre: 1 << position for position, genre in enumerate(GENRES)}
+
+GENRE_CHOICES = [(genre, genre) for genre in GENRES]
+
+
+def encode_genres(genres):
+  """Return the bitmask for an iterable of genre names; unknown names are skipped."""
+  mask = 0
+  for genre in genres:
+    mask |= GENRE_BITS.get(genre, 0)
+  return mask
+
+
+def decode_genres(mask):
+  """Return the genre names set in ``mask``, in ``GENRES`` order."""
+  return [genre for genre, bit in GENRE_BITS.items() if mask & bit]
+
+
+def genre_filter(column, genres, match='any'):
+  """Build a WHERE clause matching rows with any (or all) of ``genres``.
+
+  Every genre becomes its own ``column & <bit> <> 0`` term with the bit
+  rendered inline, which is exactly the predicate of that genre's partial
+  index. PostgreSQL can then combine the indexes with BitmapOr/BitmapAnd
+  instead of scanning the table. Returns None when no known genre is given.
+  """
+  terms = [column.op('&')(literal_column(str(GENRE_BITS[genre]))) != literal_column('0')
+           for genre in genres if genre in GENRE_BITS]
+  if not terms:
+    return None
+  return and_(*terms) if match == 'all' else or_(*terms)
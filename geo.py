@@ -0,0 +1,156 @@
+"""Venue locations: offline geocoding and radius queries.
+
+Venues are placed at their city's centre, looked up by (city, state) in a
+bundled gazetteer (data/gazetteer.csv); street addresses aren't geocoded.
+Add rows to the file for cities it lacks and run ``flask venues geocode``.
+
+A located venue also gets ``geocell``: its cell in a fixed grid of
+CELL_DEGREES squares, numbered west to east, row by row from the south
+pole. The column is indexed, so the database answers a radius query by
+reading the few runs of consecutive cells covering the circle
+(``cell_ranges``) before the exact distance check. GridIndex keeps the same
+grid in memory, loaded lazily and kept current by the venue handlers like
+the search index.
+"""
+
+import csv
+import math
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# About 28 km north to south: a city and its surroundings in a cell or four.
+CELL_DEGREES = 0.25
+COLUMNS = round(360 / CELL_DEGREES)
+ROWS = round(180 / CELL_DEGREES)
+
+
+def place_key(city, state):
+  return ' '.join((city or '').split()).casefold(), (state or '').strip().casefold()
+
+
+@lru_cache(maxsize=4)
+def load_gazetteer(path):
+  """``{place_key: (latitude, longitude)}`` from a city,state,latitude,longitude CSV."""
+  with open(path, newline='', encoding='utf-8') as f:
+    return {place_key(row['city'], row['state']): (float(row['latitude']), float(row['longitude']))
+            for row in csv.DictReader(f)}
+
+
+def cell(latitude, longitude):
+  row = min(int((latitude + 90) // CELL_DEGREES), ROWS - 1)
+  column = int((longitude + 180) // CELL_DEGREES) % COLUMNS
+  return row * COLUMNS + column
+
+
+def location_columns(gazetteer, city, state):
+  """Venue ``latitude``/``longitude``/``geocell`` values for a city; all None if unknown."""
+  place = gazetteer.get(place_key(city, state))
+  if place is None:
+    return {'latitude': None, 'longitude': None, 'geocell': None}
+  return {'latitude': place[0], 'longitude': place[1], 'geocell': cell(*place)}
+
+
+def distance_km(latitude, longitude, other_latitude, other_longitude):
+  # Haversine.
+  phi, other_phi = math.radians(latitude), math.radians(other_latitude)
+  a = (math.sin((other_phi - phi) / 2) ** 2 + math.cos(phi) * math.cos(other_phi)
+       * math.sin(math.radians(other_longitude - longitude) / 2) ** 2)
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell_ranges(latitude, longitude, km):
+  """Inclusive ``(first, last)`` runs of cells covering every point within ``km``."""
+  angle = km / EARTH_RADIUS_KM
+  south, north = latitude - math.degrees(angle), latitude + math.degrees(angle)
+  # The widest longitude span of the circle, from its centre's latitude;
+  # a circle over a pole spans every longitude.
+  if south <= -90 or north >= 90 or math.sin(angle) >= math.cos(math.radians(latitude)):
+    span = 180
+  else:
+    span = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(latitude))))
+
+  west = int((longitude - span + 180) // CELL_DEGREES)
+  east = int((longitude + span + 180) // CELL_DEGREES)
+  ranges = []
+  for row in range(cell(max(south, -90), 0) // COLUMNS, cell(min(north, 90), 0) // COLUMNS + 1):
+    base = row * COLUMNS
+    if east - west + 1 >= COLUMNS:
+      ranges.append((base, base + COLUMNS - 1))
+    elif west < 0:
+      ranges += [(base, base + east), (base + COLUMNS + west, base + COLUMNS - 1)]
+    elif east >= COLUMNS:
+      ranges += [(base + west, base + COLUMNS - 1), (base, base + east - COLUMNS)]
+    else:
+      ranges.append((base + west, base + east))
+  return ranges
+
+
+def nearest(points, latitude, longitude, km, limit):
+  """The ``(id, distance_km)`` of up to ``limit`` ``(id, latitude, longitude)`` points
+  within ``km``, nearest first."""
+  hits = []
+  for id, point_latitude, point_longitude in points:
+    distance = distance_km(latitude, longitude, point_latitude, point_longitude)
+    if distance <= km:
+      hits.append((distance, id))
+  hits.sort()
+  return [(id, distance) for distance, id in hits[:limit]]
+
+
+class GridIndex:
+  """In-memory venue points bucketed by geocell, for radius queries."""
+
+  def __init__(self):
+    self._lock = threading.RLock()
+    self._cells = defaultdict(dict)
+    self._points = {}
+    self.loaded = False
+
+  def __len__(self):
+    return len(self._points)
+
+  def add(self, id, latitude, longitude):
+    """Place ``id`` at the point, replacing its earlier one; a None coordinate just removes it."""
+    with self._lock:
+      self.remove(id)
+      if latitude is None or longitude is None:
+        return
+      point_cell = cell(latitude, longitude)
+      self._cells[point_cell][id] = (latitude, longitude)
+      self._points[id] = point_cell
+
+  def remove(self, id):
+    with self._lock:
+      point_cell = self._points.pop(id, None)
+      if point_cell is None:
+        return
+      points = self._cells[point_cell]
+      del points[id]
+      if not points:
+        del self._cells[point_cell]
+
+  def ensure_loaded(self, load):
+    """Fill the index once, from a callable returning ``(id, latitude, longitude)`` rows."""
+    if self.loaded:
+      return self
+    with self._lock:
+      if not self.loaded:
+        self._cells, self._points = defaultdict(dict), {}
+        for id, latitude, longitude in load():
+          self.add(id, latitude, longitude)
+        self.loaded = True
+    return self
+
+  def within(self, latitude, longitude, km, limit):
+    """Like ``nearest``, over the indexed points."""
+    with self._lock:
+      candidates = []
+      for first, last in cell_ranges(latitude, longitude, km):
+        for point_cell in range(first, last + 1):
+          points = self._cells.get(point_cell)
+          if points:
+            candidates.extend((id, point[0], point[1]) for id, point in points.items())
+    return nearest(candidates, latitude, longitude, km, limit)
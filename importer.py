@@ -0,0 +1,231 @@
+"""Bulk loading of venues, artists and shows from CSV, JSON or NDJSON files.
+
+Rows are validated with the same WTForms rules as the create forms, turned
+into column dicts and written in large batches. The batches go through COPY
+on PostgreSQL (psycopg2) and a single executemany INSERT elsewhere.
+"""
+
+import csv
+import io
+import json
+import time
+from datetime import datetime, timedelta
+
+import dateutil.parser
+from flask import current_app
+from werkzeug.datastructures import MultiDict
+
+from forms import ArtistForm, ShowForm, VenueForm
+from genres import encode_genres
+import geo
+
+BATCH_SIZE = 5000
+NULL = '\\N'
+
+
+def read_rows(path):
+  """Yield ``(line, row)`` pairs from a .csv, .json or .ndjson file.
+
+  JSON files hold a list of objects shaped like the data in
+  sample_venue_data.py. In CSV files the genres column is comma-separated
+  inside a single quoted field.
+  """
+  with open(path, newline='', encoding='utf-8') as f:
+    if path.endswith('.csv'):
+      for line, row in enumerate(csv.DictReader(f), start=2):
+        if row.get('genres'):
+          row['genres'] = [genre.strip() for genre in row['genres'].split(',')]
+        yield line, row
+    elif path.endswith('.ndjson'):
+      for line, text in enumerate(f, start=1):
+        if text.strip():
+          yield line, json.loads(text)
+    else:
+      data = json.load(f)
+      for line, row in enumerate(data if isinstance(data, list) else data['data'], start=1):
+        yield line, row
+
+
+def _formdata(row):
+  data = MultiDict()
+  for key, value in row.items():
+    if value is None:
+      continue
+    if isinstance(value, bool):
+      if value:
+        data.add(key, 'y')
+    elif isinstance(value, (list, tuple)):
+      for item in value:
+        data.add(key, item)
+    else:
+      data.add(key, str(value))
+  return data
+
+
+def _start_time(value):
+  # Accept ISO timestamps such as "2019-05-21T21:30:00.000Z" and store them as
+  # naive local time, like the rest of the app.
+  value = dateutil.parser.parse(value) if isinstance(value, str) else value
+  if value.tzinfo is not None:
+    value = value.astimezone().replace(tzinfo=None)
+  return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _venue_columns(form):
+  return {
+    'name': form.name.data,
+    'city': form.city.data,
+    'state': form.state.data,
+    'address': form.address.data,
+    'phone': form.phone.data or '',
+    'genre_mask': encode_genres(form.genres.data),
+    'image_link': form.image_link.data or None,
+    'facebook_link': form.facebook_link.data or None,
+    'website': form.website.data or None,
+    'seeking_talent': bool(form.seeking_talent.data),
+    'seeking_description': form.seeking_description.data or '',
+    'updated_at': datetime.now(),
+    **geo.location_columns(geo.load_gazetteer(current_app.config['GAZETTEER_PATH']),
+                           form.city.data, form.state.data),
+  }
+
+
+def _artist_columns(form):
+  return {
+    'name': form.name.data,
+    'city': form.city.data,
+    'state': form.state.data,
+    'phone': form.phone.data or '',
+    'genre_mask': encode_genres(form.genres.data),
+    'image_link': form.image_link.data or None,
+    'facebook_link': form.facebook_link.data or None,
+    'website': form.website.data or None,
+    'seeking_venue': bool(form.seeking_venue.data),
+    'seeking_description': form.seeking_description.data or '',
+    'updated_at': datetime.now(),
+  }
+
+
+def _show_columns(form):
+  duration = form.duration.data or current_app.config['SHOW_DURATION_MINUTES']
+  if not 0 < duration <= current_app.config['SHOW_MAX_DURATION_MINUTES']:
+    raise ValueError('duration must be between 1 and {} minutes'.format(
+      current_app.config['SHOW_MAX_DURATION_MINUTES']))
+  return {
+    'venue_id': int(form.venue_id.data),
+    'artist_id': int(form.artist_id.data),
+    'start_time': form.start_time.data,
+    'end_time': form.start_time.data + timedelta(minutes=duration),
+    'updated_at': datetime.now(),
+  }
+
+
+KINDS = {
+  'venues': (VenueForm, _venue_columns),
+  'artists': (ArtistForm, _artist_columns),
+  'shows': (ShowForm, _show_columns),
+}
+
+
+def validate(kind, row, known_ids=None):
+  """Return ``(columns, None)`` for a valid row or ``(None, errors)``.
+
+  ``known_ids`` maps 'venue_id'/'artist_id' to the ids that exist, so a show
+  pointing at a missing venue or artist is rejected here instead of failing
+  its whole batch on the foreign key.
+  """
+  form_class, columns = KINDS[kind]
+  row = dict(row)
+  if kind == 'shows' and row.get('start_time'):
+    try:
+      row['start_time'] = _start_time(row['start_time'])
+    except (ValueError, OverflowError):
+      return None, {'start_time': ['Not a valid datetime value.']}
+
+  form = form_class(formdata=_formdata(row), meta={'csrf': False})
+  if not form.validate():
+    return None, form.errors
+
+  try:
+    values = columns(form)
+  except (TypeError, ValueError) as e:
+    return None, {'row': [str(e)]}
+
+  for key, ids in (known_ids or {}).items():
+    if values[key] not in ids:
+      return None, {key: ['No such id: {}'.format(values[key])]}
+
+  if row.get('id') not in (None, ''):
+    values['id'] = int(row['id'])
+  return values, None
+
+
+def _copy(connection, table, batch):
+  columns = list(batch[0].keys())
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for values in batch:
+    writer.writerow([NULL if values[column] is None else values[column] for column in columns])
+  buffer.seek(0)
+
+  cursor = connection.connection.cursor()
+  cursor.copy_expert(
+    'COPY "{}" ({}) FROM STDIN WITH (FORMAT csv, NULL \'{}\')'.format(
+      table.name, ', '.join('"{}"'.format(column) for column in columns), NULL),
+    buffer)
+
+
+def load(session, table, batch):
+  """Write one batch of column dicts; all rows must share the same keys."""
+  connection = session.connection()
+  if connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2':
+    _copy(connection, table, batch)
+  else:
+    session.execute(table.insert(), batch)
+
+
+def import_rows(session, table, kind, rows, batch_size=BATCH_SIZE, known_ids=None, check=None):
+  """Validate and load ``(line, row)`` pairs; return ``(loaded, rejected, seconds)``.
+
+  ``rejected`` is a list of ``(line, errors)``, in line order. Every batch is
+  committed on its own, so a failure part way through keeps the batches
+  already loaded. ``check(batch, lines)``, if given, runs in each batch's
+  transaction just before it is written and returns ``{index: errors}`` for
+  the rows to reject, e.g. shows that double-book against the database.
+  """
+  started = time.perf_counter()
+  loaded = 0
+  rejected = []
+  batches = {}
+
+  def flush(batch, lines):
+    if check is not None:
+      failed = check(batch, lines)
+      rejected.extend((lines[index], errors) for index, errors in failed.items())
+      batch = [values for index, values in enumerate(batch) if index not in failed]
+    if batch:
+      load(session, table, batch)
+    session.commit()
+    return len(batch)
+
+  for line, row in rows:
+    values, errors = validate(kind, row, known_ids)
+    if errors:
+      rejected.append((line, errors))
+      continue
+    # Rows with and without explicit ids go into separate batches so that
+    # each COPY / INSERT has a single column list.
+    key = tuple(values)
+    batch, lines = batches.setdefault(key, ([], []))
+    batch.append(values)
+    lines.append(line)
+    if len(batch) >= batch_size:
+      loaded += flush(batch, lines)
+      batches[key] = ([], [])
+
+  for batch, lines in batches.values():
+    if batch:
+      loaded += flush(batch, lines)
+
+  rejected.sort(key=lambda rejection: rejection[0])
+  return loaded, rejected, time.perf_counter() - started
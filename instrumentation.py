@@ -0,0 +1,137 @@
+"""Opt-in per-request timing of SQL and template rendering.
+
+Enable with ``INSTRUMENTATION = True``. Every response then carries a
+``Server-Timing`` header (visible in the browser's network panel) and a
+structured log line, and a warning is logged when one statement shape runs
+more than ``INSTRUMENTATION_N_PLUS_ONE`` times in a request -- the signature
+of an N+1 query loop.
+
+Streamed responses are measured up to the point the headers are sent.
+"""
+
+import json
+import re
+import time
+from collections import Counter
+
+from flask import before_render_template, g, has_app_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_IN_LIST = re.compile(r'\bIN \((?:[^()]*)\)', re.IGNORECASE)
+_NUMBER = re.compile(r'\b\d+\b')
+_SPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+  """Reduce a statement to its shape: literals and IN lists collapsed."""
+  shape = _SPACE.sub(' ', statement).strip()
+  shape = _IN_LIST.sub('IN (...)', shape)
+  return _NUMBER.sub('?', shape)
+
+
+class RequestMetrics:
+
+  def __init__(self):
+    self.started = time.perf_counter()
+    self.statements = 0
+    self.db_time = 0.0
+    self.slowest = (0.0, None)
+    self.template_time = 0.0
+    self.shapes = Counter()
+    self._template_started = []
+
+  def server_timing(self, total):
+    return ', '.join([
+      'db;dur={:.2f};desc="{} queries"'.format(self.db_time * 1000, self.statements),
+      'db-slowest;dur={:.2f}'.format(self.slowest[0] * 1000),
+      'tmpl;dur={:.2f}'.format(self.template_time * 1000),
+      'total;dur={:.2f}'.format(total * 1000),
+    ])
+
+
+def _metrics():
+  return g.get('_request_metrics') if has_app_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  if _metrics() is not None:
+    conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  metrics = _metrics()
+  started = conn.info.get('_query_started')
+  if metrics is None or not started:
+    return
+  elapsed = time.perf_counter() - started.pop()
+  metrics.statements += 1
+  metrics.db_time += elapsed
+  metrics.shapes[statement_shape(statement)] += 1
+  if elapsed > metrics.slowest[0]:
+    metrics.slowest = (elapsed, statement)
+
+
+def _before_render(sender, template, context, **extra):
+  metrics = _metrics()
+  if metrics is not None:
+    metrics._template_started.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+  metrics = _metrics()
+  if metrics is not None and metrics._template_started:
+    metrics.template_time += time.perf_counter() - metrics._template_started.pop()
+
+
+def init_app(app):
+  """Register the engine events and request hooks if INSTRUMENTATION is on."""
+  if not app.config.get('INSTRUMENTATION'):
+    return
+
+  threshold = app.config.get('INSTRUMENTATION_N_PLUS_ONE', 10)
+
+  # Listening on the Engine class covers every engine, including extra binds.
+  if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+  before_render_template.connect(_before_render, app)
+  template_rendered.connect(_after_render, app)
+
+  @app.before_request
+  def start_request_metrics():
+    g._request_metrics = RequestMetrics()
+
+  @app.after_request
+  def report_request_metrics(response):
+    metrics = g.pop('_request_metrics', None)
+    if metrics is None:
+      return response
+
+    total = time.perf_counter() - metrics.started
+    response.headers['Server-Timing'] = metrics.server_timing(total)
+
+    app.logger.info(json.dumps({
+      'event': 'request',
+      'method': request.method,
+      'path': request.path,
+      'endpoint': request.endpoint,
+      'status': response.status_code,
+      'total_ms': round(total * 1000, 2),
+      'db_ms': round(metrics.db_time * 1000, 2),
+      'statements': metrics.statements,
+      'slowest_ms': round(metrics.slowest[0] * 1000, 2),
+      'slowest_statement': statement_shape(metrics.slowest[1]) if metrics.slowest[1] else None,
+      'template_ms': round(metrics.template_time * 1000, 2),
+    }))
+
+    for shape, count in metrics.shapes.items():
+      if count > threshold:
+        app.logger.warning(json.dumps({
+          'event': 'n_plus_one',
+          'endpoint': request.endpoint,
+          'path': request.path,
+          'count': count,
+          'statement': shape,
+        }))
+    return response
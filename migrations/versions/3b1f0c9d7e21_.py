@@ -0,0 +1,57 @@
+"""add show, venue and search indexes
+
+Revision ID: 3b1f0c9d7e21
+Revises: fd727b2c9ff5
+Create Date: 2026-10-18 10:12:40.318227
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b1f0c9d7e21'
+down_revision = 'fd727b2c9ff5'
+branch_labels = None
+depends_on = None
+
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction block, so every
+# index is built in an autocommit block. The tables stay writable meanwhile.
+def upgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+        if postgresql:
+            # Trigram GIN indexes let the planner answer name ILIKE '%term%'.
+            op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            op.create_index('ix_Venue_name_trgm', 'Venue', [sa.text('name gin_trgm_ops')],
+                            postgresql_using='gin', postgresql_concurrently=True,
+                            if_not_exists=True)
+            op.create_index('ix_Artist_name_trgm', 'Artist', [sa.text('name gin_trgm_ops')],
+                            postgresql_using='gin', postgresql_concurrently=True,
+                            if_not_exists=True)
+
+
+def downgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    with op.get_context().autocommit_block():
+        if postgresql:
+            op.drop_index('ix_Artist_name_trgm', table_name='Artist',
+                          postgresql_concurrently=True, if_exists=True)
+            op.drop_index('ix_Venue_name_trgm', table_name='Venue',
+                          postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_Venue_city_state', table_name='Venue',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_Show_artist_id_start_time', table_name='Show',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_Show_venue_id_start_time', table_name='Show',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,91 @@
+"""store genres as a bitmask with per-genre partial indexes
+
+Revision ID: 5e7a9b1c3d24
+Revises: 8c2d4e6f0a13
+Create Date: 2026-10-18 12:26:51.904377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7a9b1c3d24'
+down_revision = '8c2d4e6f0a13'
+branch_labels = None
+depends_on = None
+
+# Frozen copy of genres.GENRES at this revision; a genre's position is its bit.
+GENRES = (
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk',
+    'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop',
+    'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other', 'Swing',
+)
+OTHER = 1 << GENRES.index('Other')
+INDEX_COLUMNS = {'Venue': ['state', 'city'], 'Artist': ['name', 'id']}
+BATCH = 5000
+
+
+def encode(genres):
+    mask = 0
+    for genre in filter(None, (genre.strip() for genre in (genres or '').split(','))):
+        # Values outside the enumerated set are kept as 'Other'.
+        mask |= (1 << GENRES.index(genre)) if genre in GENRES else OTHER
+    return mask
+
+
+def decode(mask):
+    return ','.join(genre for position, genre in enumerate(GENRES) if mask & (1 << position))
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('genre_mask', sa.Integer(), nullable=False, server_default='0'))
+
+        t = sa.table(table, sa.column('id', sa.Integer), sa.column('genres', sa.String),
+                     sa.column('genre_mask', sa.Integer))
+        rows = bind.execute(sa.select(t.c.id, t.c.genres)).fetchall()
+        update = (t.update()
+                  .where(t.c.id == sa.bindparam('row_id'))
+                  .values(genre_mask=sa.bindparam('mask')))
+        for start in range(0, len(rows), BATCH):
+            bind.execute(update, [{'row_id': id, 'mask': encode(genres)}
+                                  for id, genres in rows[start:start + BATCH]])
+
+        op.drop_column(table, 'genres')
+
+    with op.get_context().autocommit_block():
+        for table, columns in INDEX_COLUMNS.items():
+            for position in range(len(GENRES)):
+                op.create_index('ix_{}_genre_{}'.format(table, position), table, columns,
+                                postgresql_where=sa.text('genre_mask & {} <> 0'.format(1 << position)),
+                                sqlite_where=sa.text('genre_mask & {} <> 0'.format(1 << position)),
+                                postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    bind = op.get_bind()
+
+    with op.get_context().autocommit_block():
+        for table in INDEX_COLUMNS:
+            for position in range(len(GENRES)):
+                op.drop_index('ix_{}_genre_{}'.format(table, position), table_name=table,
+                              postgresql_concurrently=True, if_exists=True)
+
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('genres', sa.String(length=120), nullable=True))
+
+        t = sa.table(table, sa.column('id', sa.Integer), sa.column('genres', sa.String),
+                     sa.column('genre_mask', sa.Integer))
+        rows = bind.execute(sa.select(t.c.id, t.c.genre_mask)).fetchall()
+        update = (t.update()
+                  .where(t.c.id == sa.bindparam('row_id'))
+                  .values(genres=sa.bindparam('names')))
+        for start in range(0, len(rows), BATCH):
+            bind.execute(update, [{'row_id': id, 'names': decode(mask)}
+                                  for id, mask in rows[start:start + BATCH]])
+
+        op.alter_column(table, 'genres', existing_type=sa.String(length=120), nullable=False)
+        op.drop_column(table, 'genre_mask')
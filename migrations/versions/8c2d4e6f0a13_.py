@@ -0,0 +1,32 @@
+"""add keyset pagination indexes
+
+Revision ID: 8c2d4e6f0a13
+Revises: 3b1f0c9d7e21
+Create Date: 2026-10-18 11:02:17.540961
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2d4e6f0a13'
+down_revision = '3b1f0c9d7e21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Artist_name_id', table_name='Artist',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_Show_start_time_id', table_name='Show',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,41 @@
+"""add updated_at to venues, artists and shows for conditional GET
+
+Revision ID: a4d6f8b0c235
+Revises: 5e7a9b1c3d24
+Create Date: 2026-10-18 15:02:11.318620
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d6f8b0c235'
+down_revision = '5e7a9b1c3d24'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def upgrade():
+    # The server default fills existing rows and covers COPY loads that
+    # leave the column out; the app sets the value itself otherwise.
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.func.now()))
+
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index('ix_{}_updated_at'.format(table), table, ['updated_at'],
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.drop_index('ix_{}_updated_at'.format(table), table_name=table,
+                          postgresql_concurrently=True, if_exists=True)
+
+    for table in TABLES:
+        op.drop_column(table, 'updated_at')
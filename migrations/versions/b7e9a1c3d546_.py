@@ -0,0 +1,51 @@
+"""maintained upcoming/past show counters on venues and artists
+
+Revision ID: b7e9a1c3d546
+Revises: a4d6f8b0c235
+Create Date: 2026-10-18 16:20:43.507112
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e9a1c3d546'
+down_revision = 'a4d6f8b0c235'
+branch_labels = None
+depends_on = None
+
+COUNTED = {'Venue': 'venue_id', 'Artist': 'artist_id'}
+
+
+def upgrade():
+    for table in COUNTED:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), nullable=False, server_default='0'))
+
+    state = op.create_table(
+        'CounterState',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('as_of', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'))
+
+    # Fill the counters as of one instant and record it; `flask counters
+    # rollover` takes over from there.
+    as_of = datetime.now()
+    op.bulk_insert(state, [{'id': 1, 'as_of': as_of}])
+    for table, column in COUNTED.items():
+        op.get_bind().execute(sa.text(
+            'UPDATE "{0}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{1} = "{0}".id '
+            'AND "Show".start_time >= :as_of), '
+            'past_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{1} = "{0}".id '
+            'AND "Show".start_time < :as_of)'.format(table, column)), {'as_of': as_of})
+
+
+def downgrade():
+    op.drop_table('CounterState')
+    for table in COUNTED:
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
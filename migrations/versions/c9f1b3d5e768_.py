@@ -0,0 +1,62 @@
+"""add Show.end_time and reject double bookings
+
+Revision ID: c9f1b3d5e768
+Revises: b7e9a1c3d546
+Create Date: 2026-10-18 17:41:05.226734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9f1b3d5e768'
+down_revision = 'b7e9a1c3d546'
+branch_labels = None
+depends_on = None
+
+# config.SHOW_DURATION_MINUTES at this revision; existing shows get it.
+DURATION_MINUTES = 120
+CONSTRAINTS = {'venue_id': 'ex_Show_venue_id_overlap', 'artist_id': 'ex_Show_artist_id_overlap'}
+
+
+def upgrade():
+    bind = op.get_bind()
+    postgresql = bind.dialect.name == 'postgresql'
+
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    if postgresql:
+        op.execute('UPDATE "Show" SET end_time = start_time + interval \'{} minutes\''
+                   .format(DURATION_MINUTES))
+    else:
+        op.execute('UPDATE "Show" SET end_time = datetime(start_time, \'+{} minutes\')'
+                   .format(DURATION_MINUTES))
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+
+    if not postgresql:
+        return
+
+    for column in CONSTRAINTS:
+        clashes = bind.execute(sa.text(
+            'SELECT a.id, b.id FROM "Show" a JOIN "Show" b ON a.{0} = b.{0} AND a.id < b.id '
+            'AND a.start_time < b.end_time AND b.start_time < a.end_time LIMIT 10'
+            .format(column))).fetchall()
+        if clashes:
+            raise RuntimeError(
+                'Existing shows overlap on {}: {}. Move or delete them (`flask shows '
+                'conflicts` lists them all once end_time exists), then upgrade again.'
+                .format(column, ', '.join('{}/{}'.format(a, b) for a, b in clashes)))
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for column, name in CONSTRAINTS.items():
+        op.execute('ALTER TABLE "Show" ADD CONSTRAINT "{}" EXCLUDE USING gist '
+                   '({} WITH =, tsrange(start_time, end_time) WITH &&)'.format(name, column))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for name in CONSTRAINTS.values():
+            op.execute('ALTER TABLE "Show" DROP CONSTRAINT IF EXISTS "{}"'.format(name))
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('end_time')
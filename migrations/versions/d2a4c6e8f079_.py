@@ -0,0 +1,111 @@
+"""partition Show by month of start_time
+
+Revision ID: d2a4c6e8f079
+Revises: c9f1b3d5e768
+Create Date: 2026-10-18 18:52:37.604118
+
+"""
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a4c6e8f079'
+down_revision = 'c9f1b3d5e768'
+branch_labels = None
+depends_on = None
+
+# config.SHOW_PARTITION_MONTHS_AHEAD at this revision.
+MONTHS_AHEAD = 12
+OLD = 'Show_unpartitioned'
+COLUMNS = 'id, start_time, end_time, venue_id, artist_id, updated_at'
+INDEXES = {
+    'ix_Show_venue_id_start_time': 'venue_id, start_time',
+    'ix_Show_artist_id_start_time': 'artist_id, start_time',
+    'ix_Show_start_time_id': 'start_time, id',
+    'ix_Show_updated_at': 'updated_at',
+}
+BOOKING_COLUMNS = ('venue_id', 'artist_id')
+
+# "Show" as the earlier revisions leave it; the partitioned table differs
+# only in its primary key and PARTITION BY clause.
+CREATE_SHOW = '''
+CREATE TABLE "Show" (
+    id INTEGER NOT NULL DEFAULT nextval('"Show_id_seq"'),
+    start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    end_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    venue_id INTEGER NOT NULL REFERENCES "Venue" (id) ON UPDATE CASCADE ON DELETE CASCADE,
+    artist_id INTEGER NOT NULL REFERENCES "Artist" (id) ON UPDATE CASCADE ON DELETE CASCADE,
+    updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+    {}
+)'''
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def add_booking_constraints(table):
+    for column in BOOKING_COLUMNS:
+        op.execute('ALTER TABLE "{0}" ADD CONSTRAINT "ex_{0}_{1}_overlap" EXCLUDE USING gist '
+                   '({1} WITH =, tsrange(start_time, end_time) WITH &&)'.format(table, column))
+
+
+def swap_out_show():
+    # Free the names the new table's indexes and constraints will take, and
+    # keep the id sequence alive when the old table goes.
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    for name in INDEXES:
+        op.execute('DROP INDEX IF EXISTS "{}"'.format(name))
+    for column in BOOKING_COLUMNS:
+        op.execute('ALTER TABLE "Show" DROP CONSTRAINT IF EXISTS "ex_Show_{}_overlap"'.format(column))
+    op.execute('ALTER TABLE "Show" RENAME CONSTRAINT "Show_pkey" TO "{}_pkey"'.format(OLD))
+    op.execute('ALTER TABLE "Show" RENAME TO "{}"'.format(OLD))
+
+
+def swap_in_show():
+    op.execute('INSERT INTO "Show" ({0}) SELECT {0} FROM "{1}"'.format(COLUMNS, OLD))
+    op.execute('DROP TABLE "{}" CASCADE'.format(OLD))
+    for name, columns in INDEXES.items():
+        op.execute('CREATE INDEX "{}" ON "Show" ({})'.format(name, columns))
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    swap_out_show()
+    op.execute(CREATE_SHOW.format('PRIMARY KEY (id, start_time)') + ' PARTITION BY RANGE (start_time)')
+
+    # A partition for every month from the oldest show to MONTHS_AHEAD
+    # from now; shows further out land in the default partition until
+    # `flask shows partitions` gives them their month.
+    oldest = bind.execute(sa.text('SELECT min(start_time) FROM "{}"'.format(OLD))).scalar()
+    now = datetime.now()
+    month = date((oldest or now).year, (oldest or now).month, 1)
+    last = add_months(date(now.year, now.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        name = 'Show_{:%Y_%m}'.format(month)
+        op.execute('CREATE TABLE "{}" PARTITION OF "Show" FOR VALUES FROM (\'{:%Y-%m-%d}\') TO (\'{:%Y-%m-%d}\')'
+                   .format(name, month, add_months(month, 1)))
+        add_booking_constraints(name)
+        month = add_months(month, 1)
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+    add_booking_constraints('Show_default')
+
+    swap_in_show()
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    swap_out_show()
+    op.execute(CREATE_SHOW.format('PRIMARY KEY (id)'))
+    add_booking_constraints('Show')
+    swap_in_show()
@@ -0,0 +1,38 @@
+"""add Venue latitude, longitude and geocell for nearby search
+
+Revision ID: e4b6d8f0a18a
+Revises: d2a4c6e8f079
+Create Date: 2026-10-18 20:14:52.418306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b6d8f0a18a'
+down_revision = 'd2a4c6e8f079'
+branch_labels = None
+depends_on = None
+
+
+# Existing venues are left unlocated: run `flask venues geocode` afterwards.
+def upgrade():
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('geocell', sa.Integer(), nullable=True))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Venue_geocell', 'Venue', ['geocell'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Venue_geocell', table_name='Venue',
+                      postgresql_concurrently=True, if_exists=True)
+
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.drop_column('geocell')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
@@ -0,0 +1,40 @@
+"""add Venue and Artist deleted_at for soft deletes
+
+Revision ID: f1c3a5e7b920
+Revises: e4b6d8f0a18a
+Create Date: 2026-10-18 23:02:17.583140
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c3a5e7b920'
+down_revision = 'e4b6d8f0a18a'
+branch_labels = None
+depends_on = None
+
+
+# The Show foreign keys already cascade on delete (c46ee2e120c6).
+def upgrade():
+    op.add_column('Venue', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.add_column('Artist', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    with op.get_context().autocommit_block():
+        for table in ('Venue', 'Artist'):
+            op.create_index('ix_{}_deleted_at'.format(table), table, ['deleted_at'],
+                            postgresql_where=sa.text('deleted_at IS NOT NULL'),
+                            sqlite_where=sa.text('deleted_at IS NOT NULL'),
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in ('Venue', 'Artist'):
+            op.drop_index('ix_{}_deleted_at'.format(table), table_name=table,
+                          postgresql_concurrently=True, if_exists=True)
+
+    for table in ('Artist', 'Venue'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('deleted_at')
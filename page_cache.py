@@ -0,0 +1,137 @@
+"""Cache of rendered entity pages (venue and artist detail pages).
+
+Entries are keyed by ``(kind, id)`` and carry an absolute expiry time, so a
+page can be dropped the moment its earliest upcoming show starts and moves
+to the past shows list. The write handlers in app.py invalidate the exact
+pages a change touches.
+
+The default backend lives in the worker process. With several workers an
+edit only evicts the page in the worker that served it, so entries are
+also capped by ``PAGE_CACHE_TIMEOUT``. The redis backend is shared by every
+worker and gives exact invalidation.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBackend:
+  """Bounded LRU map held in this process."""
+
+  def __init__(self, max_entries=2048, max_bytes=64 * 1024 * 1024):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self._entries = OrderedDict()
+    self._bytes = 0
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      value, expires_at = entry
+      if expires_at is not None and expires_at <= time.time():
+        self._discard(key)
+        return None
+      self._entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, expires_at=None):
+    with self._lock:
+      self._discard(key)
+      self._entries[key] = (value, expires_at)
+      self._bytes += len(value)
+      while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+        self._discard(next(iter(self._entries)))
+
+  def delete(self, *keys):
+    with self._lock:
+      for key in keys:
+        self._discard(key)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def _discard(self, key):
+    entry = self._entries.pop(key, None)
+    if entry is not None:
+      self._bytes -= len(entry[0])
+
+
+class RedisBackend:
+  """Store shared by every worker. Eviction follows the server's maxmemory policy."""
+
+  def __init__(self, url, prefix='fyyur:page:'):
+    import redis
+    self._redis = redis.Redis.from_url(url)
+    self.prefix = prefix
+
+  def get(self, key):
+    value = self._redis.get(self.prefix + key)
+    return value.decode('utf-8') if value is not None else None
+
+  def set(self, key, value, expires_at=None):
+    ttl = None
+    if expires_at is not None:
+      ttl = int((expires_at - time.time()) * 1000)
+      if ttl <= 0:
+        return
+    self._redis.set(self.prefix + key, value.encode('utf-8'), px=ttl)
+
+  def delete(self, *keys):
+    if keys:
+      self._redis.delete(*[self.prefix + key for key in keys])
+
+  def clear(self):
+    for key in self._redis.scan_iter(self.prefix + '*'):
+      self._redis.delete(key)
+
+
+class PageCache:
+  """Rendered HTML by ``(kind, id)``, with an optional lifetime cap."""
+
+  def __init__(self, backend=None, timeout=None):
+    self.backend = backend
+    self.timeout = timeout
+
+  def init_app(self, app):
+    """Pick the backend named by ``PAGE_CACHE_BACKEND`` in the app config."""
+    config = app.config
+    name = config.get('PAGE_CACHE_BACKEND', 'memory')
+    if name == 'memory':
+      self.backend = MemoryBackend(
+        max_entries=config.get('PAGE_CACHE_MAX_ENTRIES', 2048),
+        max_bytes=config.get('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    elif name == 'redis':
+      self.backend = RedisBackend(config['PAGE_CACHE_URL'])
+    else:
+      self.backend = None
+    self.timeout = config.get('PAGE_CACHE_TIMEOUT')
+
+  @staticmethod
+  def key(kind, id):
+    return '{}:{}'.format(kind, id)
+
+  def get(self, kind, id):
+    if self.backend is None:
+      return None
+    return self.backend.get(self.key(kind, id))
+
+  def set(self, kind, id, html, expires_at=None):
+    """Store ``html``; ``expires_at`` is a naive local datetime or None."""
+    if self.backend is None:
+      return
+    deadline = expires_at.timestamp() if expires_at is not None else None
+    if self.timeout:
+      cap = time.time() + self.timeout
+      deadline = cap if deadline is None else min(deadline, cap)
+    self.backend.set(self.key(kind, id), html, deadline)
+
+  def invalidate(self, *pages):
+    """Drop every ``(kind, id)`` page given."""
+    if self.backend is not None and pages:
+      self.backend.delete(*[self.key(kind, id) for kind, id in pages])
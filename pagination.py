@@ -0,0 +1,125 @@
+"""Keyset (cursor) pagination.
+
+A page is addressed by the sort key of the row just before it (``after``)
+or just after it (``before``). The key travels as an opaque, URL-safe
+cursor, so walking deep into a listing costs the same index range scan as
+reading its first page.
+"""
+
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+DEFAULT_LIMIT = 30
+MAX_LIMIT = 200
+
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor', 'limit'])
+
+
+def _encode_value(value):
+  if isinstance(value, datetime):
+    return {'dt': value.isoformat()}
+  return value
+
+
+def _decode_value(value):
+  if isinstance(value, dict):
+    return datetime.fromisoformat(value['dt'])
+  if isinstance(value, list):
+    raise TypeError('not a key value')
+  return value
+
+
+def encode_cursor(values):
+  payload = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+  return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length=None):
+  """Return the key tuple stored in ``cursor``, or None if it is malformed.
+
+  A key of other than ``length`` values, when given, counts as malformed.
+  """
+  if not cursor:
+    return None
+  try:
+    payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    key = tuple(_decode_value(value) for value in json.loads(payload))
+  except (binascii.Error, ValueError, TypeError, KeyError):
+    return None
+  return _key_of_length(key, length)
+
+
+def _key_of_length(key, length):
+  if key is None or (length is not None and len(key) != length):
+    return None
+  return key
+
+
+def page_args(args):
+  """Read ``after``, ``before`` and ``limit`` from a request args mapping."""
+  try:
+    limit = int(args.get('limit', DEFAULT_LIMIT))
+  except ValueError:
+    limit = DEFAULT_LIMIT
+  limit = max(1, min(limit, MAX_LIMIT))
+  return decode_cursor(args.get('after')), decode_cursor(args.get('before')), limit
+
+
+def keyset_page(query, columns, key, after=None, before=None, limit=DEFAULT_LIMIT):
+  """Return one page of ``query`` ordered ascending by ``columns``.
+
+  ``key(row)`` must return the values of ``columns`` for a result row, and
+  the last column must be unique (the primary key) so the order is total.
+  A cursor key that doesn't have one value per column is ignored.
+  """
+  after, before = _key_of_length(after, len(columns)), _key_of_length(before, len(columns))
+  if before is not None:
+    query = (query
+      .filter(tuple_(*columns) < tuple_(*before))
+      .order_by(*[column.desc() for column in columns]))
+  else:
+    if after is not None:
+      query = query.filter(tuple_(*columns) > tuple_(*after))
+    query = query.order_by(*columns)
+
+  rows = query.limit(limit + 1).all()
+  has_more = len(rows) > limit
+  rows = rows[:limit]
+  if before is not None:
+    rows.reverse()
+
+  if not rows:
+    return Page(rows, None, None, limit)
+
+  more_after = has_more if before is None else True
+  more_before = after is not None if before is None else has_more
+  return Page(
+    rows,
+    encode_cursor(key(rows[-1])) if more_after else None,
+    encode_cursor(key(rows[0])) if more_before else None,
+    limit)
+
+
+def list_page(ids, after=None, before=None, limit=DEFAULT_LIMIT):
+  """Page through an already ranked list of ids, using ids as the cursor."""
+  after, before = _key_of_length(after, 1), _key_of_length(before, 1)
+  if before is not None:
+    end = ids.index(before[0]) if before[0] in ids else 0
+    start = max(0, end - limit)
+  else:
+    start = ids.index(after[0]) + 1 if after is not None and after[0] in ids else 0
+    end = start + limit
+
+  items = ids[start:end]
+  if not items:
+    return Page(items, None, None, limit)
+  return Page(
+    items,
+    encode_cursor((items[-1],)) if end < len(ids) else None,
+    encode_cursor((items[0],)) if start > 0 else None,
+    limit)
@@ -0,0 +1,54 @@
+"""Run independent reads of one request side by side.
+
+``submit(fn, *args)`` hands ``fn`` to a bounded thread pool when
+``QUERY_POOL_WORKERS`` is set, and returns a future; otherwise ``fn`` runs
+on the spot and the future is already done. Each task runs in a copy of
+the current request context with its own app context -- and so its own
+SQLAlchemy session and connection -- seeded with the request's ``g``
+values, so replica routing and instrumentation carry over.
+
+Every task holds a pool connection while it runs: size ``DB_POOL_SIZE``
+for the request threads plus ``QUERY_POOL_WORKERS``.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from flask import copy_current_request_context, current_app, g
+
+
+class QueryPool:
+  """Per-app thread pool; the executor lives in ``app.extensions``."""
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    workers = app.config.get('QUERY_POOL_WORKERS', 0)
+    app.extensions['query_pool'] = ThreadPoolExecutor(
+      max_workers=workers, thread_name_prefix='query') if workers else None
+
+
+def _done(fn, *args, **kwargs):
+  future = Future()
+  try:
+    future.set_result(fn(*args, **kwargs))
+  except Exception as e:
+    future.set_exception(e)
+  return future
+
+
+def submit(fn, *args, **kwargs):
+  """Run ``fn`` on the app's query pool, or inline if it has none."""
+  executor = current_app.extensions.get('query_pool')
+  if executor is None:
+    return _done(fn, *args, **kwargs)
+
+  state = dict(g.__dict__)
+
+  @copy_current_request_context
+  def task():
+    g.__dict__.update(state)
+    return fn(*args, **kwargs)
+
+  return executor.submit(task)
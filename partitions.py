@@ -0,0 +1,106 @@
+"""Monthly range partitions of the Show table (PostgreSQL only).
+
+"Show" is partitioned by RANGE (start_time) into one table per calendar
+month, "Show_YYYY_MM", plus "Show_default" for rows outside all of them.
+A query with a start_time bound -- upcoming shows, /shows?from=&to=, the
+counter roll-over -- only reads the partitions that can hold its rows.
+
+``flask shows partitions`` creates the months ahead of time and moves rows
+that landed in the default partition into their own month; run it daily
+from cron. The double-booking exclusion constraints are per partition, as
+PostgreSQL can't enforce them across partitions: a show running past
+midnight at the end of a month is checked by the app, which locks the
+venue and artist rows while it checks and inserts (app.lock_bookings).
+"""
+
+from datetime import date
+
+from sqlalchemy import PrimaryKeyConstraint, text
+from sqlalchemy.ext.compiler import compiles
+
+TABLE = 'Show'
+DEFAULT = 'Show_default'
+BOOKING_COLUMNS = ('venue_id', 'artist_id')
+
+
+@compiles(PrimaryKeyConstraint, 'postgresql')
+def _primary_key(constraint, compiler, **kw):
+  # A partitioned table's primary key must include the partition key. The
+  # model keeps id alone as its key (so SQLite still assigns ids); on
+  # PostgreSQL the table's key is extended with info['partition_key'].
+  key = constraint.table.info.get('partition_key')
+  if key is None or key in constraint.columns:
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+  quote = compiler.preparer.quote
+  return 'PRIMARY KEY ({})'.format(', '.join([quote(column.name) for column in constraint.columns] + [quote(key)]))
+
+
+def month_start(value):
+  return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+  index = month.year * 12 + month.month - 1 + count
+  return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+  return '{}_{:%Y_%m}'.format(TABLE, month)
+
+
+def existing(connection):
+  """Names of the current partitions of Show."""
+  return {row[0] for row in connection.execute(text(
+    'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+    'WHERE i.inhparent = to_regclass(:table)'), {'table': '"{}"'.format(TABLE)})}
+
+
+def add_booking_constraints(connection, name):
+  for column in BOOKING_COLUMNS:
+    connection.execute(text(
+      'ALTER TABLE "{0}" ADD CONSTRAINT "ex_{0}_{1}_overlap" EXCLUDE USING gist '
+      '({1} WITH =, tsrange(start_time, end_time) WITH &&)'.format(name, column)))
+
+
+def create_default(connection):
+  connection.execute(text('CREATE TABLE "{}" PARTITION OF "{}" DEFAULT'.format(DEFAULT, TABLE)))
+  add_booking_constraints(connection, DEFAULT)
+
+
+def create_month(connection, month, has_default=True):
+  """Create the partition for ``month``; return how many rows it took over from the default."""
+  name, end = partition_name(month), add_months(month, 1)
+  # Built detached and attached last: a partition can't be created over
+  # rows still sitting in the default partition.
+  connection.execute(text('CREATE TABLE "{}" (LIKE "{}" INCLUDING DEFAULTS)'.format(name, TABLE)))
+  add_booking_constraints(connection, name)
+  moved = 0
+  if has_default:
+    moved = connection.execute(text(
+      'WITH moved AS (DELETE FROM "{}" WHERE start_time >= :start AND start_time < :end RETURNING *) '
+      'INSERT INTO "{}" SELECT * FROM moved'.format(DEFAULT, name)), {'start': month, 'end': end}).rowcount
+  connection.execute(text(
+    'ALTER TABLE "{}" ATTACH PARTITION "{}" FOR VALUES FROM (\'{:%Y-%m-%d}\') TO (\'{:%Y-%m-%d}\')'
+    .format(TABLE, name, month, end)))
+  return moved
+
+
+def maintain(connection, today, months_ahead, months_back=0):
+  """Ensure the default partition and the months from ``months_back`` before
+  ``today``'s to ``months_ahead`` after it, plus every month that has rows
+  in the default partition. Returns ``[(partition, rows moved)]`` for the
+  partitions created."""
+  names = existing(connection)
+  if DEFAULT not in names:
+    create_default(connection)
+
+  current = month_start(today)
+  months = {add_months(current, offset) for offset in range(-months_back, months_ahead + 1)}
+  months.update(month_start(row[0]) for row in connection.execute(text(
+    'SELECT DISTINCT date_trunc(\'month\', start_time) FROM "{}"'.format(DEFAULT))))
+
+  created = []
+  for month in sorted(months):
+    if partition_name(month) not in names:
+      created.append((partition_name(month), create_month(connection, month)))
+  return created
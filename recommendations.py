@@ -0,0 +1,336 @@
+"""Suggested matches between artists seeking venues and venues seeking talent.
+
+Every seeking artist is scored against every seeking venue with NumPy, a
+batch of artists at a time:
+
+    score = genre similarity * (1 - LOCAL_SHARE + LOCAL_SHARE * nearness)
+
+Genre similarity is the cosine of the two genre bit vectors, so a pair with
+no genre in common scores 0 and is never suggested. Nearness falls off with
+distance as exp(-(km / DISTANCE_SCALE_KM) ** 2), with SAME_STATE as a floor
+for two profiles in the same state (which covers profiles whose city isn't
+in the gazetteer). Venues are placed by their latitude/longitude columns,
+artists by looking their city up in the gazetteer.
+
+Each profile keeps its TOP_K best matches. A batch's scores are only
+selected from after dropping every pair that can't make a list: those no
+better than the list's current last entry, and those below the TOP_K-th
+best of a sample of the batch row, which is a lower bound on the row's own
+TOP_K-th best. Against 10,000 venues that leaves about 200 per artist.
+
+Like the search index, each worker loads its own Matchmaker on first use
+and the venue and artist handlers keep it current. A changed profile is
+rescored against the other side, which is one row or column of the full
+matrix; the lists it was on are rebuilt in full, since dropping it leaves
+their last place open. A removed profile leaves a blank row behind until
+the next load.
+
+Needs NumPy. Without it there are no suggestions.
+"""
+
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from genres import GENRES
+from geo import EARTH_RADIUS_KM
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+TOP_K = 10
+DISTANCE_SCALE_KM = 150.0
+LOCAL_SHARE = 0.5
+SAME_STATE = 0.25
+# Artists scored per batch: the batch's scores take BATCH_ROWS x venues x 4 bytes.
+BATCH_ROWS = 256
+# Columns in the sample a row's lower bound is taken from, for rows at least
+# twice as wide.
+SAMPLE_COLUMNS = 32 * TOP_K
+
+# exp(SHARPNESS * (cos(angle) - 1)) ~ exp(-(km / DISTANCE_SCALE_KM) ** 2)
+# for distances up to a few scales, where it matters.
+SHARPNESS = 2 * (EARTH_RADIUS_KM / DISTANCE_SCALE_KM) ** 2
+# Nearness of anything further than about 9 scales.
+FAR_EXPONENT = -80.0
+
+# Matchmaker.scores() works in nearness / SAME_STATE, so that the same-state
+# floor is 1, and folds the constant factors into the artist vectors:
+#   score = (genre similarity * LOCAL_SHARE * SAME_STATE) * (nearness / SAME_STATE + BASE)
+ARTIST_GENRE_SCALE = LOCAL_SHARE * SAME_STATE
+ARTIST_PLACE_OFFSET = -SHARPNESS - math.log(SAME_STATE)
+BASE = (1 - LOCAL_SHARE) / (LOCAL_SHARE * SAME_STATE)
+
+def available():
+  return np is not None
+
+
+def genre_vectors(masks, scale=1.0):
+  """Rows of genre bits of length ``scale``; all-zero for no genres."""
+  masks = np.asarray(masks, dtype=np.int64)
+  bits = ((masks[:, None] >> np.arange(len(GENRES))) & 1).astype(np.float32)
+  bits *= scale / np.sqrt(np.maximum(bits.sum(axis=1, keepdims=True), 1))
+  return bits
+
+
+def place_vectors(latitudes, longitudes, offset, unplaced_offset):
+  """Points on a sphere of radius sqrt(SHARPNESS), plus ``offset``.
+
+  An artist's offset is ARTIST_PLACE_OFFSET and a venue's 1, so that the
+  dot product of the two is the log of nearness / SAME_STATE. Without a
+  place, the point is 0 and the offset ``unplaced_offset``.
+  """
+  latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+  longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+  scale = math.sqrt(SHARPNESS)
+  vectors = np.stack([scale * np.cos(latitudes) * np.cos(longitudes),
+                      scale * np.cos(latitudes) * np.sin(longitudes),
+                      scale * np.sin(latitudes),
+                      np.full(len(latitudes), float(offset))], axis=1)
+  unplaced = np.isnan(vectors).any(axis=1)
+  vectors[unplaced] = (0, 0, 0, unplaced_offset)
+  return vectors.astype(np.float32)
+
+
+def ranks_within(groups):
+  """Each entry's position within its run of equal ``groups``, which are sorted."""
+  firsts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+  return np.arange(len(groups)) - np.repeat(firsts, np.diff(np.r_[firsts, len(groups)]))
+
+
+def top_k(scores, items, k):
+  """The k highest ``scores`` of each row and their ``items``, best first."""
+  if scores.shape[1] > k:
+    best = np.argpartition(scores, -k, axis=1)[:, -k:]
+    scores, items = np.take_along_axis(scores, best, 1), np.take_along_axis(items, best, 1)
+  order = np.lexsort((items, -scores), axis=1)
+  return np.take_along_axis(scores, order, 1), np.take_along_axis(items, order, 1)
+
+
+class Profiles:
+  """One side's features, a row per profile, with each row's best matches.
+
+  Best matches are stored as rows of the other side, -1 for an empty place.
+  """
+
+  def __init__(self, genre_scale, offset, unplaced_offset, unknown_state, top_k):
+    self.genre_scale = genre_scale
+    self.offset = offset
+    self.unplaced_offset = unplaced_offset
+    self.unknown_state = unknown_state
+    self.ids = np.zeros(0, dtype=np.int64)
+    self.genres = np.zeros((0, len(GENRES)), dtype=np.float32)
+    self.places = np.zeros((0, 4), dtype=np.float32)
+    self.states = np.zeros(0, dtype=np.int32)
+    self.best_items = np.full((0, top_k), -1, dtype=np.int32)
+    self.best_scores = np.zeros((0, top_k), dtype=np.float32)
+    self.rows = {}
+
+  def __len__(self):
+    return len(self.rows)
+
+  def append(self, profiles, state_codes):
+    """Add ``(id, genre_mask, latitude, longitude, state)`` profiles."""
+    first, count = len(self.ids), len(profiles)
+    self.ids = np.concatenate([self.ids, [profile[0] for profile in profiles]]).astype(np.int64)
+    self.genres = np.concatenate([self.genres, np.zeros((count, len(GENRES)), np.float32)])
+    self.places = np.concatenate([self.places, np.zeros((count, 4), np.float32)])
+    self.states = np.concatenate([self.states, np.zeros(count, np.int32)])
+    self.best_items = np.concatenate([self.best_items, np.full((count, self.best_items.shape[1]), -1, np.int32)])
+    self.best_scores = np.concatenate([self.best_scores, np.zeros((count, self.best_scores.shape[1]), np.float32)])
+    rows = np.arange(first, first + count)
+    self.rows.update(zip(self.ids[first:].tolist(), rows.tolist()))
+    self.set(rows, [profile[1:] for profile in profiles], state_codes)
+
+  def put(self, id, profile, state_codes):
+    """Add or replace one ``(genre_mask, latitude, longitude, state)`` profile; returns its row."""
+    if id not in self.rows:
+      self.append([(id,) + tuple(profile)], state_codes)
+      return self.rows[id]
+    row = self.rows[id]
+    self.set([row], [profile], state_codes)
+    self.clear([row])
+    return row
+
+  def set(self, rows, profiles, state_codes):
+    if not len(rows):
+      return
+    masks, latitudes, longitudes, states = zip(*profiles)
+    self.genres[rows] = genre_vectors(masks, self.genre_scale)
+    self.places[rows] = place_vectors(
+      [np.nan if value is None else value for value in latitudes],
+      [np.nan if value is None else value for value in longitudes], self.offset, self.unplaced_offset)
+    self.states[rows] = [self.unknown_state if not state else state_codes.setdefault(state, len(state_codes))
+                         for state in states]
+
+  def drop(self, id):
+    """Blank out ``id``'s row so that it scores 0 with everything; returns the row or None."""
+    row = self.rows.pop(id, None)
+    if row is not None:
+      self.genres[row] = 0
+      self.clear([row])
+    return row
+
+  def clear(self, rows):
+    self.best_items[rows] = -1
+    self.best_scores[rows] = 0
+
+  def listing(self, rows):
+    """Rows of this side whose best matches include any of ``rows`` of the other side."""
+    return np.flatnonzero(np.isin(self.best_items, rows).any(axis=1))
+
+  def merge(self, groups, scores, items):
+    """Fold candidate ``scores`` (groups x items) into the groups' best matches."""
+    k = self.best_items.shape[1]
+    kth = self.best_scores[groups, -1]
+    live = np.flatnonzero(scores.max(axis=1) > kth)
+    if len(live) == 0:
+      return
+    if len(live) < len(groups):
+      groups, scores, kth = groups[live], scores[live], kth[live]
+    scores = np.ascontiguousarray(scores)
+    width = scores.shape[1]
+
+    # Flat indexes of the scores that may make a list.
+    sampled = width >= 2 * SAMPLE_COLUMNS
+    if not sampled:
+      candidates = np.flatnonzero(scores > kth[:, None])
+    else:
+      floor = np.partition(scores[:, ::width // SAMPLE_COLUMNS], -k, axis=1)[:, -k]
+      candidates = np.flatnonzero(scores > np.maximum(kth, floor)[:, None])
+      # Scores level with the sampled floor fill the lists it left short.
+      short = k - np.bincount(candidates // width, minlength=len(groups))
+      tied = np.flatnonzero((short > 0) & (floor > kth))
+      if len(tied):
+        tie_groups, tie_items = np.divmod(np.flatnonzero(scores[tied] == floor[tied, None]), width)
+        fill = ranks_within(tie_groups) < short[tied][tie_groups]
+        candidates = np.sort(np.concatenate([candidates, tied[tie_groups[fill]] * width + tie_items[fill]]))
+    if len(candidates) == 0:
+      return
+    candidate_groups, candidate_items = np.divmod(candidates, width)
+
+    # Each touched group's list and candidates side by side in one row,
+    # padded with empty places.
+    counts = np.bincount(candidate_groups, minlength=len(groups))
+    touched = np.flatnonzero(counts)
+    lists = groups[touched]
+    width = k + counts.max()
+    pool_scores = np.zeros((len(touched), width), dtype=np.float32)
+    pool_items = np.full((len(touched), width), -1, dtype=np.int32)
+    pool_scores[:, :k] = self.best_scores[lists]
+    pool_items[:, :k] = self.best_items[lists]
+    pool_rows = (np.cumsum(counts > 0) - 1)[candidate_groups]
+    pool_columns = k + ranks_within(candidate_groups)
+    pool_scores[pool_rows, pool_columns] = scores.ravel()[candidates]
+    pool_items[pool_rows, pool_columns] = items[candidate_items]
+    self.best_scores[lists], self.best_items[lists] = top_k(pool_scores, pool_items, k)
+
+
+class Matchmaker:
+  """Top matches of every seeking artist and venue, loaded lazily on first use."""
+
+  def __init__(self, top_k=TOP_K):
+    self.top_k = top_k
+    self.loaded = False
+    self._lock = threading.RLock()
+
+  def ensure_loaded(self, load, workers=1):
+    """Score everything once; ``load()`` returns the artist and venue profile lists."""
+    if self.loaded:
+      return self
+    with self._lock:
+      if not self.loaded:
+        self.build(*load(), workers=workers)
+    return self
+
+  def build(self, artists, venues, workers=1):
+    """Score ``(id, genre_mask, latitude, longitude, state)`` profiles from scratch.
+
+    With ``workers`` above 1, batches are scored on that many threads;
+    NumPy lets go of the GIL for the heavy parts.
+    """
+    with self._lock:
+      self._state_codes = {}
+      # Unplaced artists get an offset that is far from every venue, and
+      # unknown states never equal each other or any real state.
+      self.artists = Profiles(ARTIST_GENRE_SCALE, ARTIST_PLACE_OFFSET, -2 * SHARPNESS, -1, self.top_k)
+      self.venues = Profiles(1.0, 1.0, 1.0, -2, self.top_k)
+      self.artists.append(artists, self._state_codes)
+      self.venues.append(venues, self._state_codes)
+      self._match(np.arange(len(self.artists.ids)), np.arange(len(self.venues.ids)), True, True, workers)
+      self.loaded = True
+
+  def scores(self, artist_rows, venue_rows):
+    """Scores of the given artist rows (down) against venue rows (across)."""
+    artists, venues = self.artists, self.venues
+    scores = artists.places[artist_rows] @ venues.places[venue_rows].T
+    # Below about -87, exp() gives subnormals, which are many times slower.
+    np.maximum(scores, FAR_EXPONENT, out=scores)
+    np.exp(scores, out=scores)
+    same_state = artists.states[artist_rows, None] == venues.states[None, venue_rows]
+    np.maximum(scores, same_state, out=scores)
+    scores += BASE
+    scores *= artists.genres[artist_rows] @ venues.genres[venue_rows].T
+    return scores
+
+  def _match(self, artist_rows, venue_rows, rank_artists, rank_venues, workers=1):
+    venue_lock = threading.Lock()
+
+    def batch(rows):
+      scores = self.scores(rows, venue_rows)
+      # Batches have artist rows of their own but share the venue rows.
+      if rank_artists:
+        self.artists.merge(rows, scores, venue_rows)
+      if rank_venues:
+        with venue_lock:
+          self.venues.merge(venue_rows, scores.T, rows)
+
+    batches = [artist_rows[start:start + BATCH_ROWS] for start in range(0, len(artist_rows), BATCH_ROWS)]
+    if workers > 1 and len(batches) > 1:
+      with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recommendations') as executor:
+        list(executor.map(batch, batches))
+    else:
+      for rows in batches:
+        batch(rows)
+
+  def update(self, kind, id, profile):
+    """Rescore ``kind`` ``id`` after its profile changed.
+
+    ``profile`` is ``(genre_mask, latitude, longitude, state)``, or None for
+    a profile that was deleted or is no longer seeking. Does nothing until
+    the matchmaker is loaded.
+    """
+    if not self.loaded:
+      return
+    with self._lock:
+      side, other = (self.artists, self.venues) if kind == 'artist' else (self.venues, self.artists)
+      if profile is not None:
+        row = side.put(id, profile, self._state_codes)
+      else:
+        row = side.drop(id)
+        if row is None:
+          return
+      row = np.array([row])
+      everyone = np.arange(len(other.ids))
+      listing = other.listing(row)
+      other.clear(listing)
+      if kind == 'artist':
+        self._match(row, everyone, True, False)
+        self._match(np.arange(len(side.ids)), listing, False, True)
+        self._match(row, np.setdiff1d(everyone, listing), False, True)
+      else:
+        self._match(everyone, row, False, True)
+        self._match(listing, np.arange(len(side.ids)), True, False)
+        self._match(np.setdiff1d(everyone, listing), row, True, False)
+
+  def suggestions(self, kind, id):
+    """``(id, score)`` of the best matches for ``kind`` ``id``, best first."""
+    with self._lock:
+      side, other = (self.artists, self.venues) if kind == 'artist' else (self.venues, self.artists)
+      row = side.rows.get(id)
+      if row is None:
+        return []
+      return [(int(other.ids[item]), float(score))
+              for item, score in zip(side.best_items[row], side.best_scores[row]) if item >= 0]
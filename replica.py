@@ -0,0 +1,113 @@
+"""Send the reads of safe requests to a read replica.
+
+Enable by setting ``SQLALCHEMY_REPLICA_URI``; the replica becomes the
+``replica`` bind. GET and HEAD requests then read from it, with three
+exceptions that stay on the primary:
+
+* a client that wrote within the last ``REPLICA_STICKY_SECONDS`` (tracked in
+  its session cookie), so it always sees its own changes;
+* any replica whose lag exceeds ``REPLICA_MAX_LAG_SECONDS`` or that cannot
+  be reached -- measured at most every ``REPLICA_LAG_CHECK_SECONDS`` per
+  worker;
+* a session that has pending changes to flush.
+
+Everything outside a request (CLI commands, migrations) uses the primary.
+"""
+
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+BIND = 'replica'
+SAFE_METHODS = frozenset(['GET', 'HEAD'])
+
+# Zero while the standby has replayed everything it received, so an idle
+# primary doesn't read as lag; NULL on a server that isn't a standby.
+_PG_LAG = text(
+  'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+  'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END')
+
+
+class LagMonitor:
+  """Replica lag in seconds, re-measured at most once per ``interval``."""
+
+  def __init__(self, interval=5.0):
+    self.interval = interval
+    self._lag = None
+    self._checked = 0.0
+    self._lock = threading.Lock()
+
+  def lag(self, engine):
+    """Return the cached lag, or None if the replica is unreachable."""
+    now = time.monotonic()
+    if now - self._checked < self.interval:
+      return self._lag
+    with self._lock:
+      if now - self._checked >= self.interval:
+        self._lag = self._measure(engine)
+        self._checked = time.monotonic()
+      return self._lag
+
+  @staticmethod
+  def _measure(engine):
+    try:
+      with engine.connect() as connection:
+        if connection.dialect.name != 'postgresql':
+          return 0.0
+        lag = connection.execute(_PG_LAG).scalar()
+    except SQLAlchemyError:
+      current_app.logger.warning('replica unreachable, reading from the primary', exc_info=True)
+      return None
+    return float(lag or 0)
+
+
+class RoutingSession(Session):
+  """Session that hands reads to the replica bind when the request allows it."""
+
+  def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+    if bind is None and has_request_context() and g.get('_use_replica') \
+        and not (self._flushing or self.new or self.dirty or self.deleted):
+      return self._db.engines[BIND]
+    return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def reading_from_replica():
+  """True when this request's reads go to a replica that may be behind."""
+  return bool(g.get('_use_replica')) and g.get('_replica_lag', 0) > 0
+
+
+def bind_config(app, engine_options):
+  """Add the ``replica`` bind to ``SQLALCHEMY_BINDS`` if a replica is configured."""
+  url = app.config.get('SQLALCHEMY_REPLICA_URI')
+  if url:
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds.setdefault(BIND, dict(engine_options, url=url))
+
+
+def init_app(app, db):
+  """Register the request hooks; ``db`` must be built with RoutingSession."""
+  if not app.config.get('SQLALCHEMY_REPLICA_URI'):
+    return
+
+  sticky = app.config.get('REPLICA_STICKY_SECONDS', 10)
+  max_lag = app.config.get('REPLICA_MAX_LAG_SECONDS', 5)
+  monitor = LagMonitor(app.config.get('REPLICA_LAG_CHECK_SECONDS', 5))
+
+  @app.before_request
+  def choose_database():
+    if request.method not in SAFE_METHODS or session.get('_primary_until', 0) > time.time():
+      return
+    lag = monitor.lag(db.engines[BIND])
+    if lag is not None and lag <= max_lag:
+      g._use_replica = True
+      g._replica_lag = lag
+
+  @app.after_request
+  def remember_write(response):
+    if request.method not in SAFE_METHODS and response.status_code < 500:
+      session['_primary_until'] = time.time() + sticky
+    return response
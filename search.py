@@ -0,0 +1,205 @@
+"""In-memory trigram search and prefix completion over venue and artist names.
+
+Each worker process keeps its own index. It is loaded from the database the
+first time a search runs and is then kept current by the create, edit and
+delete handlers in app.py, so edits made through another worker process only
+show up here after that worker restarts.
+"""
+
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+N = 3
+
+
+def normalize(text):
+  return (text or '').casefold()
+
+
+def ngrams(text):
+  return {text[i:i + N] for i in range(len(text) - N + 1)}
+
+
+def word_starts(text):
+  """The tails of ``text`` beginning at each word, first word first:
+  'the hop' -> ['the hop', 'hop']."""
+  return [text[match.start():] for match in re.finditer(r'\w+', text)] or [text]
+
+
+class PrefixIndex:
+  """Sorted arrays of ``(tail, id)`` keys answering typeahead prefix queries.
+
+  One array holds whole names, the other the tails starting at each later
+  word, so 'pia' also completes 'The Dueling Pianos Bar'. A query is a
+  binary search plus a scan of the matching run in each. Not thread-safe
+  on its own: NgramIndex guards it with its lock.
+  """
+
+  # Later-word keys examined per requested result, at most: a very common
+  # word would otherwise mean a long scan of ids already found.
+  SCAN = 20
+
+  def __init__(self):
+    self._names = {}
+    self._leading = []
+    self._inner = []
+
+  @staticmethod
+  def _keys(id, name):
+    tails = word_starts(normalize(name))
+    return (tails[0], id), [(tail, id) for tail in tails[1:]]
+
+  def add(self, id, name):
+    self._names[id] = name
+    leading, inner = self._keys(id, name)
+    insort(self._leading, leading)
+    for key in inner:
+      insort(self._inner, key)
+
+  def remove(self, id):
+    name = self._names.pop(id, None)
+    if name is None:
+      return
+    leading, inner = self._keys(id, name)
+    for keys, key in [(self._leading, leading)] + [(self._inner, key) for key in inner]:
+      position = bisect_left(keys, key)
+      if position < len(keys) and keys[position] == key:
+        del keys[position]
+
+  def load(self, rows):
+    self._names = dict(rows)
+    self._leading, self._inner = [], []
+    for id, name in self._names.items():
+      leading, inner = self._keys(id, name)
+      self._leading.append(leading)
+      self._inner.extend(inner)
+    self._leading.sort()
+    self._inner.sort()
+
+  def complete(self, term, limit):
+    """Return up to ``limit`` ``(id, name)`` pairs with a word starting with ``term``.
+
+    Names starting with the term come first, then names with a later word
+    starting with it, each in alphabetical order from the matching word on.
+    """
+    term = normalize(term).strip()
+    if not term or limit < 1:
+      return []
+    ids = {}
+    for keys, scan in ((self._leading, limit), (self._inner, limit * self.SCAN)):
+      position = bisect_left(keys, (term,))
+      for tail, id in keys[position:position + scan]:
+        if not tail.startswith(term) or len(ids) >= limit:
+          break
+        ids.setdefault(id, None)
+    return [(id, self._names[id]) for id in ids]
+
+
+class NgramIndex:
+  """Trigram inverted index answering case-insensitive substring queries.
+
+  ``search('hop')`` returns the same rows as ``name ILIKE '%hop%'``. Terms of
+  three or more characters only look at the ids that share all of the term's
+  trigrams. Shorter terms fall back to scanning the in-memory names.
+  """
+
+  def __init__(self):
+    self._lock = threading.RLock()
+    self._names = {}
+    self._postings = defaultdict(set)
+    self._prefixes = PrefixIndex()
+
+  def __len__(self):
+    return len(self._names)
+
+  def __contains__(self, id):
+    return id in self._names
+
+  def add(self, id, name):
+    """Index ``name`` under ``id``, replacing whatever was indexed before."""
+    with self._lock:
+      self.remove(id)
+      self._prefixes.add(id, name)
+      name = normalize(name)
+      self._names[id] = name
+      for gram in ngrams(name):
+        self._postings[gram].add(id)
+
+  def remove(self, id):
+    with self._lock:
+      name = self._names.pop(id, None)
+      if name is None:
+        return
+      self._prefixes.remove(id)
+      for gram in ngrams(name):
+        ids = self._postings[gram]
+        ids.discard(id)
+        if not ids:
+          del self._postings[gram]
+
+  def load(self, rows):
+    """Replace the whole index with ``(id, name)`` rows."""
+    with self._lock:
+      self._names = {}
+      self._postings = defaultdict(set)
+      self._prefixes = PrefixIndex()
+      rows = list(rows)
+      for id, name in rows:
+        name = normalize(name)
+        self._names[id] = name
+        for gram in ngrams(name):
+          self._postings[gram].add(id)
+      # Sorted once, rather than one insertion per row.
+      self._prefixes.load(rows)
+
+  def search(self, term):
+    """Return the ids whose name contains ``term``, best matches first.
+
+    Names starting with the term rank first, then earlier matches, then
+    shorter names; ties are broken by id so the order is stable.
+    """
+    term = normalize(term)
+    with self._lock:
+      if len(term) < N:
+        candidates = self._names.keys()
+      else:
+        postings = sorted((self._postings.get(gram, ()) for gram in ngrams(term)), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+
+      ranked = []
+      for id in candidates:
+        name = self._names[id]
+        position = name.find(term)
+        if position >= 0:
+          ranked.append((position, len(name), id))
+
+    ranked.sort()
+    return [id for position, length, id in ranked]
+
+  def complete(self, term, limit=10):
+    """Return up to ``limit`` ``(id, name)`` pairs for a typeahead; see PrefixIndex."""
+    with self._lock:
+      return self._prefixes.complete(term, limit)
+
+
+class SearchIndex:
+  """The venue and artist name indexes, loaded lazily on first use."""
+
+  def __init__(self):
+    self.venues = NgramIndex()
+    self.artists = NgramIndex()
+    self.loaded = False
+    self._lock = threading.Lock()
+
+  def ensure_loaded(self, load_venues, load_artists):
+    """Fill both indexes once, from callables returning ``(id, name)`` rows."""
+    if self.loaded:
+      return self
+    with self._lock:
+      if not self.loaded:
+        self.venues.load(load_venues())
+        self.artists.load(load_artists())
+        self.loaded = True
+    return self
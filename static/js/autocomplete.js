@@ -0,0 +1,47 @@
+// Typeahead for inputs marked data-autocomplete="artist" or "venue": as the
+// user types, matches from /autocomplete fill the input's <datalist>, and
+// picking one puts its id into the field named by data-autocomplete-target.
+(function () {
+  function label(match) {
+    return match.name + ' (#' + match.id + ')';
+  }
+
+  function attach(input) {
+    var list = document.getElementById(input.getAttribute('list'));
+    var target = document.getElementById(input.dataset.autocompleteTarget);
+    var ids = {};
+    var timer = null;
+    var latest = 0;
+
+    input.addEventListener('input', function () {
+      if (ids.hasOwnProperty(input.value)) {
+        target.value = ids[input.value];
+        return;
+      }
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var request = ++latest;
+        fetch('/autocomplete?kind=' + input.dataset.autocomplete + '&q=' + encodeURIComponent(input.value))
+          .then(function (response) { return response.json(); })
+          .then(function (matches) {
+            // Answers can arrive out of order; only the newest one counts.
+            if (request !== latest) {
+              return;
+            }
+            list.innerHTML = '';
+            ids = {};
+            matches.forEach(function (match) {
+              var option = document.createElement('option');
+              option.value = label(match);
+              list.appendChild(option);
+              ids[option.value] = match.id;
+            });
+          });
+      }, 100);
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    Array.prototype.forEach.call(document.querySelectorAll('input[data-autocomplete]'), attach);
+  });
+})();
@@ -0,0 +1,26 @@
+// Buttons marked data-nearby ask the browser for its location and open
+// /venues/nearby there, with the button's data-km radius if it has one.
+(function () {
+  function open(button) {
+    navigator.geolocation.getCurrentPosition(function (position) {
+      var url = '/venues/nearby?lat=' + position.coords.latitude.toFixed(4)
+        + '&lon=' + position.coords.longitude.toFixed(4);
+      if (button.dataset.km) {
+        url += '&km=' + encodeURIComponent(button.dataset.km);
+      }
+      window.location.href = url;
+    }, function () {
+      button.disabled = true;
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    Array.prototype.forEach.call(document.querySelectorAll('[data-nearby]'), function (button) {
+      if (!navigator.geolocation) {
+        button.hidden = true;
+        return;
+      }
+      button.addEventListener('click', function () { open(button); });
+    });
+  });
+})();
@@ -0,0 +1,16 @@
+// Sections marked data-suggestions are filled in from that URL once the
+// page has loaded, and stay hidden if it has nothing to suggest.
+(function () {
+  document.addEventListener('DOMContentLoaded', function () {
+    Array.prototype.forEach.call(document.querySelectorAll('[data-suggestions]'), function (section) {
+      fetch(section.dataset.suggestions)
+        .then(function (response) { return response.status === 200 ? response.text() : ''; })
+        .then(function (html) {
+          if (html) {
+            section.innerHTML = html;
+            section.hidden = false;
+          }
+        });
+    });
+  });
+})();
@@ -0,0 +1,288 @@
+"""Resized copies of venue and artist images, cached on local disk.
+
+``image_link`` points at full-size images on other people's hosts. Pages
+link to ``/img/<kind>/<id>/<size>?v=<digest of the link>`` instead (see
+``image_url``); the first request for an image fetches the original once,
+and every size is cut from that copy and kept, as WebP for clients that
+accept it and JPEG otherwise. The digest in ``v`` changes with the link,
+so responses are cacheable for a year.
+
+The cache is a directory bounded by ``IMAGE_CACHE_MAX_BYTES``: when it
+overflows, the least recently served files go first. Each process keeps
+its own recency index, seeded from file mtimes at startup, so with several
+workers the bound is approximate.
+
+Links are saved through unauthenticated forms, so fetches only go to
+public addresses: every connection, redirects included, is checked against
+the address it actually connects to (``connect_public``), and
+``IMAGE_ALLOWED_HOSTS`` can narrow them to known image hosts.
+
+Resizing needs Pillow. Without it, pages link straight to the originals.
+"""
+
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import threading
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+
+from flask import current_app, url_for
+
+# Longest side, in pixels.
+SIZES = {'tile': 400, 'large': 800}
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg')}
+QUALITY = 80
+# Fetches and resizes of one image are serialized on one of these.
+LOCK_STRIPES = 64
+
+
+def link_digest(link):
+  return hashlib.sha1(link.encode('utf-8')).hexdigest()[:16]
+
+
+def image_url(kind, id, link, size='tile'):
+  """URL to put in an ``<img>`` for entity ``kind``/``id`` whose image_link is ``link``."""
+  if not link:
+    return link
+  if current_app.extensions['thumbnails'] is None:
+    return link
+  return url_for('main.image', kind=kind, entity_id=id, size=size, v=link_digest(link))
+
+
+class BlockedLink(ValueError):
+  """An image link to a host or address the server must not fetch from."""
+
+
+def public_address(address):
+  """Whether ``address`` (an IP string) is routable on the public internet."""
+  ip = ipaddress.ip_address(address.split('%', 1)[0])
+  if getattr(ip, 'ipv4_mapped', None) is not None:
+    ip = ip.ipv4_mapped
+  return ip.is_global and not (ip.is_multicast or ip.is_reserved or ip.is_private or ip.is_loopback
+                               or ip.is_link_local or ip.is_unspecified)
+
+
+def connect_public(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+  """``socket.create_connection`` that refuses hosts resolving to non-public addresses.
+
+  Connects to the vetted address itself, so a second DNS answer can't
+  swap in another one.
+  """
+  host, port = address
+  resolved = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+  blocked = [sockaddr[0] for _, _, _, _, sockaddr in resolved if not public_address(sockaddr[0])]
+  if blocked or not resolved:
+    raise BlockedLink('{} resolves to a non-public address {}'.format(host, blocked))
+  error = None
+  for family, type, proto, _, sockaddr in resolved:
+    sock = socket.socket(family, type, proto)
+    try:
+      if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+        sock.settimeout(timeout)
+      if source_address:
+        sock.bind(source_address)
+      sock.connect(sockaddr)
+      return sock
+    except OSError as e:
+      sock.close()
+      error = e
+  raise error
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self._create_connection = connect_public
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self._create_connection = connect_public
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+  def http_open(self, request):
+    return self.do_open(PublicHTTPConnection, request)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+  def https_open(self, request):
+    return self.do_open(PublicHTTPSConnection, request)
+
+
+class CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+  """Follows a redirect only to a link ``check`` accepts."""
+
+  max_redirections = 3
+
+  def __init__(self, check):
+    self.check = check
+
+  def redirect_request(self, request, fp, code, message, headers, new_url):
+    self.check(new_url)
+    return super().redirect_request(request, fp, code, message, headers, new_url)
+
+
+def allowed_host(host, allowed_hosts):
+  # An entry matches its host; one starting with a dot, any subdomain too.
+  host = (host or '').lower().rstrip('.')
+  return any(host == entry.lstrip('.') or (entry.startswith('.') and host.endswith(entry))
+             for entry in (entry.lower() for entry in allowed_hosts))
+
+
+class DiskLRU:
+  """Files in ``directory``, evicted least recently used first beyond ``max_bytes``."""
+
+  def __init__(self, directory, max_bytes):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self._lock = threading.Lock()
+    os.makedirs(directory, exist_ok=True)
+    entries = []
+    for entry in os.scandir(directory):
+      if entry.is_file() and not entry.name.endswith('.tmp'):
+        stat = entry.stat()
+        entries.append((stat.st_mtime, entry.name, stat.st_size))
+    self._entries = OrderedDict((name, size) for _, name, size in sorted(entries))
+    self._bytes = sum(self._entries.values())
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def get(self, name):
+    """Path of ``name`` if cached, marking it as just used."""
+    with self._lock:
+      if name not in self._entries:
+        return None
+      self._entries.move_to_end(name)
+    try:
+      os.utime(self.path(name))
+    except FileNotFoundError:
+      # Evicted by another worker.
+      self._forget(name)
+      return None
+    return self.path(name)
+
+  def put(self, name, data):
+    path = self.path(name)
+    temporary = '{}.{}.tmp'.format(path, threading.get_ident())
+    with open(temporary, 'wb') as f:
+      f.write(data)
+    os.replace(temporary, path)
+    with self._lock:
+      self._bytes += len(data) - self._entries.pop(name, 0)
+      self._entries[name] = len(data)
+      while self._bytes > self.max_bytes and len(self._entries) > 1:
+        victim, size = self._entries.popitem(last=False)
+        self._bytes -= size
+        try:
+          os.remove(self.path(victim))
+        except FileNotFoundError:
+          pass
+    return path
+
+  def _forget(self, name):
+    with self._lock:
+      self._bytes -= self._entries.pop(name, 0)
+
+
+class Thumbnails:
+  """The app's image cache, in ``app.extensions['thumbnails']`` (None without Pillow)."""
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    try:
+      import PIL  # noqa: F401
+    except ImportError:
+      app.extensions['thumbnails'] = None
+      return
+    app.extensions['thumbnails'] = ImageCache(
+      DiskLRU(app.config['IMAGE_CACHE_DIR'], app.config['IMAGE_CACHE_MAX_BYTES']),
+      app.config['IMAGE_FETCH_TIMEOUT'], app.config['IMAGE_MAX_ORIGINAL_BYTES'],
+      app.config.get('IMAGE_ALLOWED_HOSTS'), app.config.get('IMAGE_FETCH_PRIVATE_ADDRESSES', False))
+
+
+class ImageCache:
+  """Originals and their resized copies, in a DiskLRU."""
+
+  def __init__(self, files, timeout, max_original_bytes, allowed_hosts=None, private_addresses=False):
+    self.files = files
+    self.timeout = timeout
+    self.max_original_bytes = max_original_bytes
+    self.allowed_hosts = allowed_hosts
+    self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+    # No ProxyHandler: a proxy would make the connection checks moot.
+    if private_addresses:
+      connections = (urllib.request.HTTPHandler(), urllib.request.HTTPSHandler())
+    else:
+      connections = (PublicHTTPHandler(), PublicHTTPSHandler())
+    self._opener = urllib.request.OpenerDirector()
+    for handler in (*connections, CheckedRedirectHandler(self.check_link),
+                    urllib.request.HTTPDefaultErrorHandler(), urllib.request.HTTPErrorProcessor()):
+      self._opener.add_handler(handler)
+
+  def check_link(self, link):
+    """Raise BlockedLink unless ``link`` may be fetched (addresses are checked on connect)."""
+    parts = urllib.parse.urlsplit(link)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+      raise BlockedLink('not an http(s) image link: {!r}'.format(link))
+    if self.allowed_hosts and not allowed_host(parts.hostname, self.allowed_hosts):
+      raise BlockedLink('{} is not in IMAGE_ALLOWED_HOSTS'.format(parts.hostname))
+
+  def fetch(self, link):
+    self.check_link(link)
+    request = urllib.request.Request(link, headers={'User-Agent': 'fyyur-thumbnails'})
+    with self._opener.open(request, timeout=self.timeout) as response:
+      data = response.read(self.max_original_bytes + 1)
+    if len(data) > self.max_original_bytes:
+      raise ValueError('image over {} bytes: {}'.format(self.max_original_bytes, link))
+    return data
+
+  def original(self, link):
+    name = link_digest(link) + '.orig'
+    path = self.files.get(name) or self.files.put(name, self.fetch(link))
+    with open(path, 'rb') as f:
+      return f.read()
+
+  def resized(self, link, size, format):
+    """Path of ``link``'s image scaled to ``size`` in ``format``, fetching it if need be.
+
+    Raises OSError or ValueError if the original can't be fetched or read.
+    """
+    digest = link_digest(link)
+    name = '{}.{}.{}'.format(digest, size, format)
+    path = self.files.get(name)
+    if path is not None:
+      return path
+    # One fetch and resize per image at a time; the others wait for it.
+    with self._locks[int(digest, 16) % LOCK_STRIPES]:
+      path = self.files.get(name)
+      if path is None:
+        path = self.files.put(name, resize(self.original(link), SIZES[size], FORMATS[format][0]))
+    return path
+
+
+def resize(data, longest, format):
+  from PIL import Image
+
+  # Pillow refuses oversized images as early as Image.open(), with an error
+  # that is neither OSError nor ValueError.
+  try:
+    with Image.open(io.BytesIO(data)) as image:
+      image.thumbnail((longest, longest))
+      if image.mode not in ('RGB', 'RGBA') or format == 'JPEG':
+        image = image.convert('RGBA' if format == 'WEBP' and 'A' in image.getbands() else 'RGB')
+      output = io.BytesIO()
+      image.save(output, format, quality=QUALITY)
+  except Image.DecompressionBombError as e:
+    raise ValueError(str(e))
+  return output.getvalue()